@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import yaml
+from pathlib import Path
+from loguru import logger
+from rich.console import Console
+from rich.table import Table
+
+from ..core import OUTPUT_DIR, trace
+
+# 吞吐量 benchmark：產生合成 catalog（類別 / 解析度混合），以本地替身後端端到端跑 run_pipeline，
+# 記錄 effects/sec、各 stage p50 / p95（來自 --trace 的 span）與峰值記憶體，輸出 JSON 結果檔。
+# compare 子命令比較兩個結果檔，超過門檻的退化標記出來並以 exit code 1 結束（可接 CI）。
+# 每個規模在獨立子行程執行，峰值記憶體以 os.wait4 取得該行程（含 worker）的 ru_maxrss。
+# 子行程以 AI_ANIM_OUTPUT_DIR 指到 output/bench/runs/ 下的獨立目錄（每次執行前清空），不覆寫正式產出。
+
+BENCH_DIR = OUTPUT_DIR / 'bench'
+DEFAULT_SIZES = [100, 1000, 10000]
+RESULTS_VERSION = 1
+# stage 耗時差距小於此值不算退化（毫秒級的 stage 相對變化大多是雜訊）
+MIN_STAGE_DELTA_SEC = 0.005
+
+CATEGORIES = ["symbolWin", "backgroundLoop", "uiFx", "particleBurst", "transition"]
+RESOLUTIONS = ["256x256", "512x512", "768x768", "1024x1024", "1280x720", "1920x1080"]
+
+
+def synthetic_effects(count: int, seed: int = 0):
+    """產生 count 筆合成 effect（固定 seed 可重現）。"""
+    rng = random.Random(seed)
+    effects = []
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        loops = category in ("backgroundLoop", "uiFx") or rng.random() < 0.3
+        qa_rules = {
+            "max_size_kb": rng.choice([300, 800, 2600]),
+            "max_brightness": 0.95,
+            "max_center_drift_ratio": rng.choice([0.05, 0.2]),
+        }
+        if loops:
+            qa_rules["max_loop_error"] = 0.03
+        effects.append({
+            "id": f"bench_{category}_{i:05d}",
+            "category": category,
+            "resolution": rng.choice(RESOLUTIONS),
+            "duration_sec": round(rng.uniform(0.4, 3.0), 1),
+            "fps": rng.choice([24, 30]),
+            "loops": loops,
+            "variant_count": rng.randint(1, 3),
+            "qa_rules": qa_rules,
+        })
+    return effects
+
+
+def write_catalog(path: Path, count: int, seed: int = 0) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(yaml.safe_dump({"effects": synthetic_effects(count, seed)}, sort_keys=False))
+    return path
+
+
+def run_once(count: int, jobs: int, seed: int, extra_args=()) -> dict:
+    """以子行程跑一次 run_pipeline，回傳此規模的量測結果。"""
+    catalog = write_catalog(BENCH_DIR / 'catalogs' / f'effects_{count}_s{seed}.yaml', count, seed)
+    trace_path = BENCH_DIR / 'traces' / f'trace_{count}_j{jobs}.json'
+    log_path = BENCH_DIR / 'logs' / f'run_{count}_j{jobs}.log'
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    run_root = BENCH_DIR / 'runs' / f'{count}_j{jobs}'
+    shutil.rmtree(run_root, ignore_errors=True)
+    env = dict(os.environ, AI_ANIM_OUTPUT_DIR=str(run_root))
+    cmd = [sys.executable, '-m', 'ai_anim_pipeline.cli.run_pipeline', '--config', str(catalog),
+           '--jobs', str(jobs), '--no-cache', '--no-history', '--trace', str(trace_path), *extra_args]
+    logger.info(f"[bench] {count} effects, jobs={jobs}")
+    started = time.perf_counter()
+    with open(log_path, 'wb') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"run_pipeline exited with {proc.returncode} for {count} effects (see {log_path})")
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    stages = {name: {k: s[k] for k in ("count", "p50_sec", "p95_sec", "max_sec", "wall_sec", "cpu_sec")}
+              for name, s in trace.stage_summary(events).items()}
+    return {
+        "effects": count,
+        "jobs": jobs,
+        "seed": seed,
+        "wall_sec": round(wall, 3),
+        "effects_per_sec": round(count / wall, 3),
+        # Linux 的 ru_maxrss 單位為 KB
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "stages": stages,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, jobs: int, seed: int, output: Path, extra_args=()) -> dict:
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "commit": _git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpu_count": os.cpu_count()},
+        "runs": [run_once(n, jobs, seed, extra_args) for n in sizes],
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    for r in results["runs"]:
+        logger.info(f"[bench] {r['effects']} effects: {r['effects_per_sec']} effects/s, "
+                    f"peak {r['peak_rss_mb']}MB, wall {r['wall_sec']}s")
+    logger.success(f"[bench] results -> {output}")
+    return results
+
+
+def compare(base: dict, new: dict, threshold: float = 0.10):
+    """比較兩份結果；回傳 [(規模, 指標, base, new, 變化比例, 是否退化)]。
+
+    effects/sec 越高越好，其餘（stage p50 / p95、峰值記憶體）越低越好；變差超過 threshold 視為退化
+    （stage 耗時另需差距 >= MIN_STAGE_DELTA_SEC）。
+    """
+    rows = []
+    base_runs = {(r["effects"], r["jobs"]): r for r in base["runs"]}
+    for r in new["runs"]:
+        b = base_runs.get((r["effects"], r["jobs"]))
+        if b is None:
+            continue
+        pairs = [("effects_per_sec", b["effects_per_sec"], r["effects_per_sec"], True),
+                 ("peak_rss_mb", b["peak_rss_mb"], r["peak_rss_mb"], False)]
+        for stage, s in r["stages"].items():
+            if stage in b["stages"]:
+                for q in ("p50_sec", "p95_sec"):
+                    pairs.append((f"{stage}.{q}", b["stages"][stage][q], s[q], False))
+        for metric, old, cur, higher_better in pairs:
+            change = (cur - old) / old if old else 0.0
+            worse = -change if higher_better else change
+            noise = metric.endswith("_sec") and abs(cur - old) < MIN_STAGE_DELTA_SEC
+            rows.append((r["effects"], metric, old, cur, change, worse > threshold and not noise))
+    return rows
+
+
+def print_comparison(rows, threshold: float):
+    table = Table(title=f"Benchmark comparison (regression > {threshold:.0%})")
+    for col in ("Effects", "Metric", "Base", "New", "Change", ""):
+        table.add_column(col)
+    for effects, metric, old, cur, change, regressed in rows:
+        table.add_row(str(effects), metric, f"{old:g}", f"{cur:g}", f"{change:+.1%}",
+                      "[red]REGRESSION[/red]" if regressed else "")
+    Console().print(table)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ai_anim_pipeline throughput benchmark")
+    sub = parser.add_subparsers(dest='command', required=True)
+    r = sub.add_parser('run', help="以合成 catalog 跑 benchmark 並輸出結果 JSON")
+    r.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="catalog 規模（effect 數）")
+    r.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help="傳給 run_pipeline 的 --jobs")
+    r.add_argument('--seed', type=int, default=0, help="合成 catalog 的亂數種子")
+    r.add_argument('--output', '-o', type=Path, default=None,
+                   help="結果檔路徑（預設 output/bench/results/<時間>.json）")
+    r.add_argument('pipeline_args', nargs=argparse.REMAINDER,
+                   help="其餘參數原樣傳給 run_pipeline（置於 -- 之後）")
+    c = sub.add_parser('compare', help="比較兩個結果檔，標記退化")
+    c.add_argument('base', type=Path)
+    c.add_argument('new', type=Path)
+    c.add_argument('--threshold', type=float, default=0.10, help="視為退化的變差比例")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'run':
+        output = args.output or BENCH_DIR / 'results' / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+        extra = [a for a in args.pipeline_args if a != '--']
+        run(args.sizes, args.jobs, args.seed, output, extra)
+        return 0
+    rows = compare(json.loads(args.base.read_text()), json.loads(args.new.read_text()), args.threshold)
+    print_comparison(rows, args.threshold)
+    regressions = sum(1 for row in rows if row[-1])
+    if regressions:
+        logger.warning(f"[bench] {regressions} regression(s) over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,47 +1,537 @@
-import yaml
+import argparse
+import random
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
+from typing import Callable
 from loguru import logger
-from rich.progress import track
+from rich.progress import Progress, track
 
-from ..core import EffectSpec
-from ..stages import plan, generate, evaluate, postprocess, pack, manifest, report
+from ..core import OUTPUT_DIR, EffectSpec, PromptPlan, GenerationResult, EvalResult, PackagingResult
+from ..core.cache import StageCache
+from ..core.catalog import CATALOG_CACHE_DIR, iter_effect_specs
+from ..core.scheduler import AsyncioPool, DagScheduler, Node
+from ..core.workqueue import QUEUE_DIR, LeaseKeeper, WorkQueue, default_worker_id
+from ..core import framecache, frames, history, journal, trace
+from ..stages import plan, generate, evaluate, postprocess, pack, atlas, manifest, report
 
 CONFIG_PATH = Path(__file__).parent.parent / 'config' / 'effects_catalog.yaml'
-OUTPUT_DIR = Path(__file__).parent.parent / 'output'
+# coordinator 寫在自己 OUTPUT_DIR 的 token；worker 讀到相同 token 才表示兩者共用同一個輸出目錄
+OUTPUT_MARKER = '.coordinator'
 
 
-def load_effect_specs(path: Path):
-    data = yaml.safe_load(path.read_text())
-    specs = [EffectSpec(**e) for e in data.get('effects', [])]
-    return specs
+def _pack_artifacts(result: PackagingResult):
+    paths = []
+    if result.spritesheet_path:
+        sheet = Path(result.spritesheet_path)
+        paths += [str(sheet.parent / name) for name in result.meta_json.get("sheets", [])]
+        paths += [str(pack.raw_page_path(name)) for name in result.meta_json.get("sheets", [])]
+        paths += [str(sheet.parent / name) for v in (result.meta_json.get("gpu_textures") or {}).values()
+                  for name in v["files"]]
+        paths.append(str(sheet.with_suffix('.json')))
+    if result.webm_path:
+        paths += [result.webm_path, str(Path(result.webm_path).with_suffix('.json'))]
+    return paths
 
 
-def main():
+def stage_plan(spec: EffectSpec, cache: StageCache):
+    with trace.span("plan", spec=spec.id) as span:
+        return cache.run(plan, spec.model_dump(), lambda: plan.build_prompt(spec), model=PromptPlan, info=span)
+
+
+def _gen_artifacts(gens):
+    return [g.video_path for g in gens]
+
+
+def stage_generate(spec: EffectSpec, cache: StageCache, planned):
+    plan_obj, plan_digest = planned
+    with trace.span("generate", spec=spec.id) as span:
+        return cache.run(generate, plan_digest, lambda: generate.run_variants(plan_obj),
+                         model=GenerationResult, artifacts=_gen_artifacts, info=span)
+
+
+async def stage_generate_async(spec: EffectSpec, cache: StageCache, planned):
+    """DAG 模式：在 I/O pool 的 event loop 上生成，所有 spec 共用引擎的 max_inflight / 限流。"""
+    plan_obj, plan_digest = planned
+    with trace.span("generate", spec=spec.id) as span:
+        return await cache.arun(generate, plan_digest, lambda: generate.default_engine().run_plan(plan_obj),
+                                model=GenerationResult, artifacts=_gen_artifacts, info=span)
+
+
+def stage_evaluate(spec: EffectSpec, cache: StageCache, generated, selection: dict = None):
+    """選出要打包的變體。回傳 {"gen", "eval", "rejected_by", "gen_digest", "variants", "passed"[, "selection"]}
+    （無通過時 gen 為 None；variants 為所有變體 id，打包完成後據此釋放 frame cache；passed 為已知通過的變體數）。
+
+    selection 為 None 或 mode == "first"：依序評估，取第一個通過者。
+    mode == "best"：同時評估所有變體，依加權分數選擇（可設 good_enough 提前結束），rationale 寫入 manifest。
+    """
+    gens, gen_digest = generated
+    variants = [g.variant_id for g in gens]
+
+    def evaluate_one(g, cancel=None):
+        with trace.span("evaluate", spec=spec.id, variant=g.variant_id) as span:
+            eval_res, _ = cache.run(evaluate, (gen_digest, g.variant_id, spec.qa_rules, spec.loops),
+                                    lambda: evaluate.run_all(g, spec.qa_rules, cancel, spec.loops),
+                                    model=EvalResult, info=span, cacheable=evaluate.cacheable)
+        return eval_res
+
+    if selection and selection.get("mode") == "best":
+        chosen, eval_res, results, rationale = evaluate.select_variant(
+            gens, spec.qa_rules, evaluate_one, selection.get("good_enough"), selection.get("weights"))
+        rejected_by = [r.rejected_by for r in results if r is not None and not r.pass_flag]
+        passed = sum(1 for r in results if r is not None and r.pass_flag)
+        return {"gen": chosen, "eval": eval_res, "rejected_by": rejected_by, "gen_digest": gen_digest,
+                "variants": variants, "passed": passed, "selection": rationale}
+    rejected_by = []
+    for g in gens:
+        eval_res = evaluate_one(g)
+        if eval_res.pass_flag:
+            return {"gen": g, "eval": eval_res, "rejected_by": rejected_by, "gen_digest": gen_digest,
+                    "variants": variants, "passed": 1}
+        rejected_by.append(eval_res.rejected_by)
+    return {"gen": None, "eval": None, "rejected_by": rejected_by, "gen_digest": gen_digest, "variants": variants,
+            "passed": 0}
+
+
+def stage_postprocess(spec: EffectSpec, cache: StageCache, selected):
+    g = selected["gen"]
+    loop_plan = selected["eval"].loop_plan
+    with trace.span("postprocess", spec=spec.id, variant=g.variant_id) as span:
+        return cache.run(postprocess, (selected["gen_digest"], g.variant_id, spec.model_dump(), loop_plan),
+                         lambda: postprocess.process(g, spec, loop_plan),
+                         artifacts=lambda p: [p["processed_path"], p["frames_path"]], info=span)
+
+
+def stage_pack(spec: EffectSpec, cache: StageCache, selected, post):
+    processed, post_digest = post
+    with trace.span("pack", spec=spec.id, variant=selected["gen"].variant_id) as span:
+        packaged, _ = cache.run(pack, (post_digest, spec.model_dump()), lambda: pack.package(processed, spec),
+                                model=PackagingResult, artifacts=_pack_artifacts, info=span)
+    return packaged
+
+
+def stage_atlas(items, cache: StageCache):
+    """全部 spec 完成後，把同群組 effect 的 sheet 合併成共用 atlas 頁面。回傳 (更新後的 items, atlas 清單)。"""
+    items = list(items)
+    atlases = []
+    for group, idxs in atlas.groups(items).items():
+        members = [items[i] for i in idxs]
+        with trace.span("atlas", group=group) as span:
+            packed, _ = cache.run(atlas, (group, members, atlas.sheet_digests(members)),
+                                  lambda: atlas.pack_group(group, members),
+                                  artifacts=atlas.artifacts, info=span)
+        for i in idxs:
+            items[i] = atlas.apply(items[i], group, packed)
+        atlases.append(atlas.summary(group, members, packed))
+    return items, atlases
+
+
+def spec_record(spec: EffectSpec, selected, packaged):
+    """回傳 (manifest_item 或 None, kpi_record)。kpi 含生成的變體數與通過數（history 的變體通過率）。"""
+    counts = {"variants": len(selected["variants"]), "variants_passed": selected["passed"]}
+    if packaged is None:
+        return None, {"id": spec.id, "status": "NO_PASS", "rejected_by": selected["rejected_by"], **counts}
+    kpi = dict(selected["eval"].metrics, id=spec.id, **counts)
+    if selected["rejected_by"]:
+        kpi["rejected_by"] = selected["rejected_by"]
+    item = packaged.meta_json
+    if "selection" in selected:
+        item = dict(item, selection=selected["selection"])
+    return item, kpi
+
+
+def run_spec(spec: EffectSpec, cache: StageCache = None, selection: dict = None):
+    """單一 spec 完整跑 plan → generate → evaluate → postprocess → pack。
+
+    回傳 (manifest_item 或 None, kpi_record)。各 spec 互不相依，可在子行程中執行。
+    cache 命中時略過該 stage；spec、stage 程式碼與上游產物都未變時整條鏈只讀快取紀錄。
+    """
+    cache = cache or StageCache(enabled=False)
+    # 以 spec.id 重設亂數種子，結果與執行順序 / 所在行程無關（serial 與 --jobs 輸出一致）
+    random.seed(spec.id)
+    with trace.span("spec", spec=spec.id):
+        generated = stage_generate(spec, cache, stage_plan(spec, cache))
+        selected = stage_evaluate(spec, cache, generated, selection)
+        packaged = None
+        if selected["gen"] is not None:
+            packaged = stage_pack(spec, cache, selected, stage_postprocess(spec, cache, selected))
+    framecache.release(selected["variants"])
+    return spec_record(spec, selected, packaged)
+
+
+def _run_and_drain(spec: EffectSpec, cache: StageCache = None, selection: dict = None):
+    """worker 入口：結果連同本 spec 的 trace 事件與耗時彙總一起送回主行程。"""
+    return run_spec(spec, cache, selection), trace.snapshot()
+
+
+def init_worker(engine: generate.GenerationEngine, chunk_bytes: int = None, tracing: tuple = (False, False),
+                frame_cache_bytes: int = None):
+    """設定本行程的生成引擎、影格記憶體上限、frame cache 與 tracing（serial 直接呼叫；process pool 作為 initializer）。"""
+    generate.configure(engine)
+    if frame_cache_bytes is not None:
+        framecache.configure(frame_cache_bytes)
+    if chunk_bytes:
+        frames.set_chunk_budget(chunk_bytes)
+    trace.enable(*tracing)
+
+
+def run_specs(specs, jobs: int = 1, engine: generate.GenerationEngine = None, cache: StageCache = None,
+              chunk_bytes: int = None, selection: dict = None, on_result: Callable = None):
+    """依 catalog 順序回傳每個 spec 的結果；jobs > 1 時以 process pool 平行執行。
+
+    specs 可以是 generator（逐一取用，不整份展開）；平行時最多 jobs * 4 個 spec 在途。
+    tracing 啟用時各 spec 的 span 事件與耗時彙總併入主行程（trace.drain() / drain_timings() 取出）。
+    on_result(index, result)：每個 spec 完成時在主行程呼叫（寫 journal 用）。
+    """
+    engine = engine or generate.GenerationEngine()
+    tracing = trace.mode()
+    init_worker(engine, chunk_bytes, tracing)
+    worker = partial(_run_and_drain, cache=cache, selection=selection)
+    results = []
+
+    def collect(outputs):
+        for i, (result, state) in enumerate(outputs):
+            trace.merge(*state)
+            results.append(result)
+            if on_result:
+                on_result(i, result)
+
+    if jobs <= 1:
+        collect(worker(s) for s in track(specs, description="Pipeline Running"))
+    else:
+        # 各 worker 行程平分生成的 max_inflight / 限流，總量與 serial 相同
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(engine.split(jobs), chunk_bytes, tracing, framecache.budget_bytes())) as ex:
+            collect(track(_bounded_map(ex, worker, specs, jobs * 4), total=None,
+                          description=f"Pipeline Running (jobs={jobs})"))
+    return results
+
+
+def _bounded_map(ex, fn, items, window: int):
+    """與 ex.map 相同（依輸入順序產出結果），但只預先提交 window 個，items 不必整份放進記憶體。"""
+    inflight = deque()
+    for item in items:
+        inflight.append(ex.submit(fn, item))
+        if len(inflight) >= window:
+            yield inflight.popleft().result()
+    while inflight:
+        yield inflight.popleft().result()
+
+
+def _has_pass(inputs) -> bool:
+    return inputs[0]["gen"] is not None
+
+
+def run_specs_dag(specs, engine: generate.GenerationEngine = None, cache: StageCache = None,
+                  chunk_bytes: int = None, io_limit: int = 16, cpu_workers: int = 1, selection: dict = None,
+                  on_result: Callable = None):
+    """以 DAG 排程執行：generate 在 I/O pool、evaluate / postprocess / pack 在 CPU process pool，
+    manifest 由單一 writer 收集。不同 spec 的 stage 互相重疊；結果仍依 catalog 順序回傳。
+    specs 可以是 generator：每個 spec 的 node 逐組建立，最多 io_limit + cpu_workers * 4 個 spec 展開中。
+    on_result(index, result) 在 writer thread 呼叫（依完成順序）。
+    """
+    engine = engine or generate.GenerationEngine()
+    cache = cache or StageCache(enabled=False)
+    tracing = trace.mode()
+    init_worker(engine, chunk_bytes, tracing)
+    writer = manifest.ManifestWriter()
+
+    def write(i, spec, selected, packaged):
+        framecache.release(selected["variants"])
+        result = spec_record(spec, selected, packaged)
+        writer.add(i, result)
+        if on_result:
+            on_result(i, result)
+
+    def spec_nodes():
+        for i, spec in enumerate(specs):
+            yield [
+                Node((i, "plan"), "main", stage_plan, (spec, cache)),
+                Node((i, "generate"), "io", stage_generate_async, (spec, cache), deps=((i, "plan"),)),
+                Node((i, "evaluate"), "cpu", partial(stage_evaluate, selection=selection), (spec, cache),
+                     deps=((i, "generate"),)),
+                Node((i, "postprocess"), "cpu", stage_postprocess, (spec, cache), deps=((i, "evaluate"),),
+                     when=_has_pass),
+                Node((i, "pack"), "cpu", stage_pack, (spec, cache), deps=((i, "evaluate"), (i, "postprocess"))),
+                Node((i, "write"), "writer", write, (i, spec), deps=((i, "evaluate"), (i, "pack")),
+                     when=lambda inputs: True),
+            ]
+
+    io_pool = AsyncioPool()
+    try:
+        with ProcessPoolExecutor(max_workers=cpu_workers, initializer=init_worker,
+                                 initargs=(engine, chunk_bytes, tracing, framecache.budget_bytes())) as cpu_pool, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="manifest-writer") as writer_pool:
+            scheduler = DagScheduler({"io": io_pool, "cpu": cpu_pool, "writer": writer_pool},
+                                     limits={"io": io_limit, "cpu": cpu_workers * 2})
+            with Progress() as progress:
+                task = progress.add_task(f"Pipeline Running (dag, cpu={cpu_workers})", total=None)
+                scheduler.run(spec_nodes(), on_done=lambda node, _: node.key[1] == "write" and progress.advance(task),
+                              window=io_limit + cpu_workers * 4)
+    finally:
+        io_pool.shutdown()
+    return writer.records
+
+
+def run_local(specs, args, engine, cache, chunk_bytes, selection):
+    """單機執行，每個完成的 spec 寫入 journal。回傳 index -> (item, kpi)（全部保留，atlas / manifest / report 需要）。
+
+    specs 逐一取用：已完成的直接填入結果，其餘送去執行（spec / dag 排程都不整份展開）。
+    """
+    # 已完成的 spec 從 journal 讀回；未 --resume 時開新的 journal
+    records = journal.load(args.journal) if args.resume else {}
+    results = {}
+    inflight = {}  # 送出順序 -> (catalog index, spec)
+    submitted = 0
+
+    def pending():
+        nonlocal submitted
+        for i, spec in enumerate(specs):
+            done = journal.lookup(spec, records)
+            if done is not None:
+                results[i] = done
+                continue
+            inflight[submitted] = (i, spec)
+            submitted += 1
+            yield spec
+
+    with journal.RunJournal(args.journal, fresh=not args.resume) as run_journal:
+        def on_result(k, result):
+            i, spec = inflight.pop(k)
+            results[i] = result
+            run_journal.append(spec, *result)
+
+        if args.scheduler == 'dag':
+            run_specs_dag(pending(), engine, cache, chunk_bytes, io_limit=args.io_limit,
+                          cpu_workers=args.cpu_workers or args.jobs, selection=selection, on_result=on_result)
+        else:
+            run_specs(pending(), args.jobs, engine, cache, chunk_bytes, selection, on_result=on_result)
+    if args.resume:
+        logger.info(f"[journal] resume: {len(results) - submitted} spec(s) reused, {submitted} run")
+    return results
+
+
+def run_worker(specs, args, engine, cache, chunk_bytes, selection):
+    """worker：從共享佇列租 spec 來跑，結果寫入自己的 manifest fragment（journal 格式）後 ack。
+
+    每批 lease --jobs * 2 個；fragment 落盤後才 ack，當機時未 ack 的工作在租約過期後由其他 worker 重跑。
+    資產寫在 OUTPUT_DIR，coordinator 之後要從同一目錄建 atlas / manifest，因此必須與 coordinator 共用輸出目錄。
+    """
+    worker_id = args.worker_id or default_worker_id()
+    db_path = args.queue / 'queue.db'
+    queue = WorkQueue(db_path)
+    while not queue.seeded():
+        logger.info(f"[worker] waiting for the coordinator to seed {db_path}")
+        time.sleep(args.poll_sec)
+    token = queue.meta("output_token")
+    marker = OUTPUT_DIR / OUTPUT_MARKER
+    if token is not None and (not marker.exists() or marker.read_text() != token):
+        queue.close()
+        raise RuntimeError(f"output dir {OUTPUT_DIR} is not the coordinator's; workers and the coordinator must "
+                           f"share one output dir (set AI_ANIM_OUTPUT_DIR to the same shared path)")
+    by_id = {s.id: s for s in specs}  # 租到的是 id，需要整份 catalog 的 id -> spec
+    processed = 0
+    logger.info(f"[worker] {worker_id} polling {db_path}")
+    with journal.RunJournal(args.queue / 'fragments' / f"{worker_id}.ndjson") as fragment, \
+            LeaseKeeper(db_path, worker_id, args.lease_sec) as keeper:
+        while True:
+            leased = queue.lease(worker_id, max(1, args.jobs * 2), args.lease_sec)
+            if not leased:
+                if queue.drained():
+                    break
+                time.sleep(args.poll_sec)
+                continue
+            batch, mismatched = [], []
+            for sid, h in leased:
+                spec = by_id.get(sid)
+                if spec is not None and journal.spec_hash(spec) == h:
+                    batch.append(spec)
+                else:
+                    mismatched.append(sid)
+            if mismatched:
+                queue.fail(worker_id, mismatched, "spec missing or changed in this worker's catalog")
+            keeper.held = [s.id for s in batch]
+            done = []
+
+            def on_result(k, result):
+                fragment.append(batch[k], *result)
+                done.append(batch[k].id)
+
+            try:
+                run_specs(batch, args.jobs, engine, cache, chunk_bytes, selection, on_result=on_result)
+            except Exception as e:
+                logger.exception(f"[worker] batch failed: {e!r}")
+                queue.fail(worker_id, [s.id for s in batch if s.id not in set(done)], repr(e))
+            finally:
+                fragment.flush()
+                queue.ack(worker_id, done)
+                keeper.held = []
+            processed += len(done)
+    queue.close()
+    logger.success(f"[worker] {worker_id} done, {processed} spec(s) processed")
+
+
+def run_coordinator(load_specs: Callable, args):
+    """coordinator：把 spec 放進共享佇列，等所有 worker 做完後合併 fragment。回傳 index -> (item, kpi)。
+
+    load_specs() 回傳 catalog 的 spec generator：enqueue 與合併各讀一遍，不把展開後的 catalog 留在記憶體。
+    """
+    db_path = args.queue / 'queue.db'
+    fragments = args.queue / 'fragments'
+    if not args.resume and fragments.exists():
+        for f in fragments.glob('*.ndjson'):
+            f.unlink()
+    queue = WorkQueue(db_path)
+    token = uuid.uuid4().hex
+    (OUTPUT_DIR / OUTPUT_MARKER).write_text(token)
+    count = queue.enqueue(((s.id, journal.spec_hash(s)) for s in load_specs()), reset=not args.resume,
+                          meta={"output_token": token})
+    logger.info(f"[coordinator] {count} spec(s) queued in {db_path}; start workers with --role worker")
+    last = None
+    while not queue.drained():
+        counts = queue.counts()
+        if counts != last:
+            logger.info(f"[coordinator] {counts}")
+            last = counts
+        time.sleep(args.poll_sec)
+    failed = queue.failed()
+    queue.close()
+
+    records = {}
+    for f in sorted(fragments.glob('*.ndjson')):
+        records.update(journal.load(f))
+    results = {}
+    for i, spec in enumerate(load_specs()):
+        done = journal.lookup(spec, records)
+        results[i] = done if done is not None else (None, {"id": spec.id, "status": "FAILED",
+                                                           "error": failed.get(spec.id)})
+    logger.info(f"[coordinator] merged {len(records)} record(s) from {len(list(fragments.glob('*.ndjson')))} fragment(s)"
+                f", {len(failed)} failed")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI animation pipeline")
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH,
+                        help="effects catalog YAML，或放多個 catalog shard (*.yaml) 的目錄")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="平行處理的 spec 數（process pool 大小）")
+    parser.add_argument('--scheduler', choices=['spec', 'dag'], default='spec',
+                        help="spec：每個 spec 整條鏈在一個 worker 跑完；dag：各 stage 分派到 I/O / CPU / writer pool 重疊執行")
+    parser.add_argument('--io-limit', type=int, default=16, help="dag 模式同時生成中的 spec 數上限（I/O pool）")
+    parser.add_argument('--cpu-workers', type=int, default=None,
+                        help="dag 模式 evaluate / postprocess / pack 的 process pool 大小（預設同 --jobs）")
+    parser.add_argument('--select', choices=['first', 'best'], default='first',
+                        help="first：依序評估取第一個通過的變體；best：同時評估所有變體，取加權分數最高者")
+    parser.add_argument('--good-enough', type=float, default=None,
+                        help="best 模式：有通過的變體分數達此值 (0~1) 即採用並取消其餘評估")
+    parser.add_argument('--score-weight', action='append', default=[], metavar='METRIC=W',
+                        help="best 模式的評分權重（可重複，覆寫預設 evaluate.SCORE_WEIGHTS）")
+    parser.add_argument('--resume', action='store_true',
+                        help="沿用 journal 中已完成（且 spec 未變）的結果，只跑剩下的 spec")
+    parser.add_argument('--journal', type=Path, default=journal.JOURNAL_PATH, help="執行紀錄 (NDJSON) 路徑")
+    dist = parser.add_argument_group('distributed')
+    dist.add_argument('--role', choices=['local', 'coordinator', 'worker'], default='local',
+                      help="coordinator：排入共享佇列並合併結果；worker：從佇列租工作來跑（各機器指向同一個 --queue）")
+    dist.add_argument('--queue', type=Path, default=QUEUE_DIR, help="共享佇列目錄（queue.db + fragments/）")
+    dist.add_argument('--worker-id', default=None, help="worker 名稱（預設 hostname-pid）")
+    dist.add_argument('--lease-sec', type=float, default=300.0, help="租約秒數，逾時未續租的工作會被重新分派")
+    dist.add_argument('--poll-sec', type=float, default=2.0, help="佇列輪詢間隔秒數")
+    parser.add_argument('--no-atlas', action='store_true',
+                        help="不合併跨 effect 的 atlas 頁面（各 effect 使用自己的 sheet）")
+    parser.add_argument('--no-cache', action='store_true', help="停用 stage 結果快取（output/cache）")
+    parser.add_argument('--frame-memory-mb', type=int, default=64,
+                        help="每個 worker 解碼影格 chunk 的記憶體上限 (MB)")
+    parser.add_argument('--frame-cache-mb', type=int, default=framecache.DEFAULT_BUDGET_BYTES // 1024 ** 2,
+                        help="解碼影格快取的磁碟上限 (MB)，evaluate / postprocess 共用同一次解碼；0 停用")
+    parser.add_argument('--history', type=Path, default=history.HISTORY_PATH,
+                        help="執行歷史資料庫 (SQLite)；report 以前 N 次執行為基準標記退步")
+    parser.add_argument('--history-window', type=int, default=history.HISTORY_WINDOW,
+                        help="退步比較的基準執行次數 (N)")
+    parser.add_argument('--history-label', default=None,
+                        help="執行歷史的比較標籤，只與同標籤的執行比較（預設為 catalog 路徑）")
+    parser.add_argument('--no-history', action='store_true', help="不記錄執行歷史，report 不含趨勢與退步標記")
+    parser.add_argument('--trace', type=Path, nargs='?', const=OUTPUT_DIR / 'reports' / 'trace.json',
+                        default=None, help="記錄各 stage span 並輸出 Chrome trace JSON（預設 output/reports/trace.json）")
+    gen = parser.add_argument_group('generate')
+    gen.add_argument('--gen-per-spec', type=int, default=4, help="單一 spec 同時生成的變體數 (N)")
+    gen.add_argument('--gen-max-inflight', type=int, default=16, help="每個 worker 同時進行中的生成請求上限 (M)")
+    gen.add_argument('--gen-rate', type=float, default=None, help="每秒生成請求數上限 (token bucket)")
+    gen.add_argument('--gen-timeout', type=float, default=120.0, help="單次生成請求逾時秒數")
+    gen.add_argument('--gen-retries', type=int, default=2, help="失敗重試次數")
+    gen.add_argument('--stub-latency', type=float, default=0.0, help="本地替身後端的固定延遲秒數")
+    gen.add_argument('--stub-jitter', type=float, default=0.0, help="本地替身後端的長尾延遲平均秒數")
+    gen.add_argument('--stub-failure-rate', type=float, default=0.0, help="本地替身後端的模擬失敗率")
+    return parser.parse_args(argv)
+
+
+def build_selection(args):
+    if args.select != 'best':
+        return None
+    weights = None
+    if args.score_weight:
+        weights = {k: float(v) for k, v in (w.split('=', 1) for w in args.score_weight)}
+    return {"mode": "best", "good_enough": args.good_enough, "weights": weights}
+
+
+def build_engine(args) -> generate.GenerationEngine:
+    backend = generate.LocalBackend(latency_sec=args.stub_latency, jitter_sec=args.stub_jitter,
+                                    failure_rate=args.stub_failure_rate)
+    return generate.GenerationEngine(backend=backend, per_spec=args.gen_per_spec,
+                                     max_inflight=args.gen_max_inflight, rate_per_sec=args.gen_rate,
+                                     timeout_sec=args.gen_timeout, retries=args.gen_retries)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    specs = load_effect_specs(CONFIG_PATH)
-    logger.info(f"Loaded {len(specs)} effect specs")
+    # --trace 才收集 span 事件；記錄歷史只需各 stage 的耗時彙總
+    trace.enable(args.trace is not None, timings=not args.no_history)
+    # catalog 以 generator 逐一展開、驗證，邊讀邊跑
+    specs = iter_effect_specs(args.config, cache_dir=None if args.no_cache else CATALOG_CACHE_DIR)
+
+    engine, cache = build_engine(args), StageCache(enabled=not args.no_cache)
+    selection = build_selection(args)
+    chunk_bytes = args.frame_memory_mb * 1024 * 1024
+    framecache.configure(args.frame_cache_mb * 1024 * 1024)
+
+    if args.role == 'worker':
+        run_worker(list(specs), args, engine, cache, chunk_bytes, selection)
+        return
+    if args.role == 'coordinator':
+        results = run_coordinator(
+            lambda: iter_effect_specs(args.config, cache_dir=None if args.no_cache else CATALOG_CACHE_DIR), args)
+    else:
+        results = run_local(specs, args, engine, cache, chunk_bytes, selection)
+    logger.info(f"{len(results)} effect spec(s) done")
 
     manifest_items = []
     kpi_records = []
+    for i in sorted(results):
+        item, kpi = results[i]
+        if item is not None:
+            manifest_items.append(item)
+        kpi_records.append(kpi)
 
-    for spec in track(specs, description="Pipeline Running"):
-        plan_obj = plan.build_prompt(spec)
-        gens = generate.run_variants(plan_obj)
-        accepted = None
-        for g in gens:
-            eval_res = evaluate.run_all(g, spec.qa_rules)
-            if eval_res.pass_flag:
-                processed = postprocess.process(g, spec)
-                packaged = pack.package(processed, spec)
-                manifest_items.append(packaged.meta_json)
-                kpi_records.append(eval_res.metrics)
-                accepted = g
-                break
-        if not accepted:
-            kpi_records.append({"id": spec.id, "status": "NO_PASS"})
-
-    manifest.write(manifest_items)
-    report.generate(kpi_records)
+    atlases = None
+    standalone_items = manifest_items
+    if not args.no_atlas:
+        manifest_items, atlases = stage_atlas(manifest_items, cache)
+    manifest.write(manifest_items, atlases=atlases)
+    events, timings = trace.drain(), trace.drain_timings()
+    stage_stats = None
+    if args.trace is not None:
+        logger.info(f"[trace] {len(events)} spans -> {trace.export_chrome(events, args.trace)}")
+        stage_stats = trace.stage_summary(events) if events else None
+    trend = None
+    if not args.no_history:
+        with history.HistoryStore(args.history) as store:
+            run_id = store.record(kpi_records, standalone_items, timings, atlases,
+                                  label=args.history_label or str(Path(args.config).resolve()))
+            trend = store.analyze(run_id, args.history_window)
+    report.generate(kpi_records, stage_stats=stage_stats, history=trend)
     logger.success("Pipeline completed.")
 
 if __name__ == "__main__":
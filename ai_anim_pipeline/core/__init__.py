@@ -1 +1,7 @@
-from .models import EffectSpec, PromptPlan, GenerationResult, EvalResult, PackagingResult
+from pathlib import Path
+import os
+
+# 所有產出（資產、快取、暫存、報告、歷史）的根目錄；設定 AI_ANIM_OUTPUT_DIR 可改到其他位置（例如 benchmark 的隔離目錄）
+OUTPUT_DIR = Path(os.environ.get('AI_ANIM_OUTPUT_DIR') or Path(__file__).parent.parent / 'output')
+
+from .models import EffectSpec, PromptPlan, GenerationResult, EvalResult, PackagingResult, parse_resolution
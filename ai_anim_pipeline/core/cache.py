@@ -0,0 +1,181 @@
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+from pydantic import BaseModel
+import ast
+import hashlib
+import json
+import os
+
+from . import OUTPUT_DIR
+
+CACHE_DIR = OUTPUT_DIR / 'cache'
+
+# 內容定址的階段結果快取
+# key = hash(stage 模組名稱, stage 原始碼（含遞移引用的本套件模組）雜湊, 上游 digest / spec)
+# 每筆紀錄存 stage 輸出值 + 產出檔案的 (size, mtime_ns, sha256)；檔案被刪除或改動即視為未命中。
+# 下游 stage 以上游紀錄的 digest（輸出值 + 產出檔內容雜湊）組成自己的 key，命中時不需重新讀檔雜湊。
+
+
+def stable_hash(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _source_hash(path: str) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+CORE_DIR = Path(__file__).parent
+
+
+@lru_cache(maxsize=None)
+def _core_hash() -> str:
+    return stable_hash([_source_hash(str(p)) for p in sorted(CORE_DIR.glob('*.py'))])
+
+
+def _imported_files(path: Path) -> List[Path]:
+    """path 以相對 import（from . / from ..x import y）引用的本套件原始檔。"""
+    out = []
+    for node in ast.walk(ast.parse(path.read_bytes())):
+        if not isinstance(node, ast.ImportFrom) or not node.level:
+            continue
+        base = path.parent
+        for _ in range(node.level - 1):
+            base = base.parent
+        if node.module:
+            base = base.joinpath(*node.module.split('.'))
+        candidates = [base.with_suffix('.py'), base / '__init__.py'] + [base / f"{a.name}.py" for a in node.names]
+        out += [p for p in candidates if p.is_file()]
+    return out
+
+
+@lru_cache(maxsize=None)
+def _import_closure_hash(path: str) -> str:
+    """模組與其遞移引用的本套件模組的內容雜湊（例如 atlas 引用 pack 的 MaxRects，改 pack 也會讓 atlas 失效）。"""
+    seen, todo = set(), [Path(path).resolve()]
+    while todo:
+        p = todo.pop()
+        if p not in seen:
+            seen.add(p)
+            todo += [q.resolve() for q in _imported_files(p)]
+    return stable_hash([_source_hash(str(p)) for p in sorted(seen)])
+
+
+def code_version(module) -> str:
+    """stage 程式碼版本：模組與其遞移引用的本套件模組 + core/ 共用模組的內容雜湊（改程式即失效，不需手動維護版本號）。"""
+    return stable_hash(_import_closure_hash(module.__file__), _core_hash())
+
+
+def file_digest(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _dump(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [_dump(v) for v in value]
+    return value
+
+
+def _load(data, model):
+    if model is None:
+        return data
+    if isinstance(data, list):
+        return [model.model_validate(d) for d in data]
+    return model.model_validate(data)
+
+
+class StageCache:
+    def __init__(self, root: Path = CACHE_DIR, enabled: bool = True):
+        self.root = Path(root)
+        self.enabled = enabled
+
+    def key(self, module, *upstream) -> str:
+        return stable_hash(module.__name__, code_version(module), *upstream)
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.root / stage / key[:2] / f"{key}.json"
+
+    def get(self, stage: str, key: str) -> Optional[dict]:
+        path = self._path(stage, key)
+        try:
+            record = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        for a in record['artifacts']:
+            try:
+                st = os.stat(a['path'])
+            except OSError:
+                return None
+            if st.st_size != a['size'] or st.st_mtime_ns != a['mtime_ns']:
+                return None
+        return record
+
+    def put(self, stage: str, key: str, value, artifacts: Iterable[str] = ()) -> dict:
+        arts = []
+        for p in artifacts:
+            st = os.stat(p)
+            arts.append({"path": str(p), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                         "sha256": file_digest(p)})
+        record = {
+            "key": key,
+            "value": value,
+            "artifacts": arts,
+            "digest": stable_hash(value, [a['sha256'] for a in arts]),
+        }
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先寫暫存檔再 rename，平行 worker 不會讀到寫一半的紀錄
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(record))
+        os.replace(tmp, path)
+        return record
+
+    def _lookup(self, module, upstream):
+        stage = module.__name__.rsplit('.', 1)[-1]
+        key = self.key(module, upstream)
+        return stage, key, (self.get(stage, key) if self.enabled else None)
+
+    def _store(self, stage: str, key: str, value, artifacts: Callable, cacheable: Callable) -> str:
+        dumped = _dump(value)
+        # 空結果（例如所有變體生成失敗）與 cacheable 判定為暫時性失敗的結果不寫入，下次重跑會重試
+        if not self.enabled or dumped == [] or not cacheable(value):
+            return stable_hash(dumped)
+        return self.put(stage, key, dumped, artifacts(value))['digest']
+
+    def run(self, module, upstream, compute: Callable, model=None,
+            artifacts: Callable = lambda value: (), info: Optional[dict] = None,
+            cacheable: Callable = lambda value: True) -> Tuple[object, str]:
+        """命中則讀回快取結果，否則執行 compute() 並寫入快取。回傳 (結果, digest)。
+
+        upstream：組成 key 的上游 digest / 參數；model：結果（或結果 list 元素）的 pydantic 型別；
+        artifacts：由結果取出需要驗證存在的產出檔路徑；info：有給時寫入 info["cached"]（trace span 的 args）；
+        cacheable(結果) 為 False 時不寫入快取（例如解碼失敗這類暫時性錯誤）。
+        """
+        stage, key, record = self._lookup(module, upstream)
+        if info is not None:
+            info["cached"] = record is not None
+        if record is not None:
+            return _load(record['value'], model), record['digest']
+        value = compute()
+        return value, self._store(stage, key, value, artifacts, cacheable)
+
+    async def arun(self, module, upstream, compute: Callable[[], Awaitable], model=None,
+                   artifacts: Callable = lambda value: (), info: Optional[dict] = None,
+                   cacheable: Callable = lambda value: True) -> Tuple[object, str]:
+        """run() 的 async 版本：compute() 回傳 awaitable（給在 event loop 上執行的 stage）。"""
+        stage, key, record = self._lookup(module, upstream)
+        if info is not None:
+            info["cached"] = record is not None
+        if record is not None:
+            return _load(record['value'], model), record['digest']
+        value = await compute()
+        return value, self._store(stage, key, value, artifacts, cacheable)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, product
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from loguru import logger
+from pydantic import TypeAdapter
+import marshal
+import os
+import yaml
+
+from .cache import CACHE_DIR, stable_hash
+from .models import EffectSpec
+
+# effects catalog 載入
+# - 可以是單一 YAML，或一個放多個 shard（*.yaml / *.yml，依檔名排序串接）的目錄
+# - 有 libyaml 時用 C loader (CSafeLoader)，多個 shard 以 process pool 平行解析（最多預先解析 workers 個 shard）
+# - 解析結果以 marshal（只含 dict / list / str / 數字，精簡且載入快）快取，key 為 (路徑, 大小, mtime_ns)
+# - templates：具名的欄位預設值，effect / template 以 extends（名稱或名稱 list，後者覆寫前者）繼承，
+#   dict 欄位（qa_rules 等）逐鍵合併；template 在定義它的 shard 及之後的 shard 可用
+# - matrix：{參數: [值, ...]} 的笛卡兒積展開成多個 effect，字串欄位中的 {參數} 以 str.format 代入，
+#   參數名稱是 EffectSpec 欄位（例如 resolution）時直接設定該欄位
+# - iter_effect_specs 以 generator 逐批（VALIDATE_BATCH 筆，TypeAdapter 批次驗證）產出 EffectSpec，
+#   EffectSpec 物件只有正在處理的批次；重複 id 以已見過的 id 集合檢查（隨筆數成長），在產出到該筆時報錯
+
+CATALOG_CACHE_DIR = CACHE_DIR / 'catalog'
+CATALOG_CACHE_FORMAT = 2
+CATALOG_SUFFIXES = ('.yaml', '.yml')
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SPEC_LIST = TypeAdapter(List[EffectSpec])
+# shard 數不少於此值才開 process pool（行程啟動與結果傳回的成本高於解析小檔）
+PARALLEL_MIN_SHARDS = 2
+VALIDATE_BATCH = 512
+
+
+def catalog_files(path: Path) -> List[Path]:
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.suffix.lower() in CATALOG_SUFFIXES)
+    return [path]
+
+
+def _cache_path(path: Path, cache_dir: Path) -> Path:
+    st = path.stat()
+    key = stable_hash(str(path.resolve()), st.st_size, st.st_mtime_ns, YAML_LOADER.__name__, CATALOG_CACHE_FORMAT)
+    return cache_dir / f"{key}.bin"
+
+
+def parse_shard(path: Path, cache_dir: Optional[Path] = CATALOG_CACHE_DIR) -> dict:
+    """解析單一 shard，回傳 {"templates": {...}, "effects": [...]}；cache_dir 為 None 時不使用快取。"""
+    path = Path(path)
+    cached = _cache_path(path, cache_dir) if cache_dir else None
+    if cached is not None:
+        try:
+            return marshal.loads(cached.read_bytes())
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+    with open(path, 'rb') as f:
+        data = yaml.load(f, Loader=YAML_LOADER) or {}
+    shard = {"templates": data.get('templates') or {}, "effects": data.get('effects') or []}
+    if cached is not None:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(marshal.dumps(shard))
+        os.replace(tmp, cached)
+    return shard
+
+
+def _shards(files: List[Path], cache_dir: Optional[Path], workers: int) -> Iterator[dict]:
+    """依檔名順序產出解析結果；平行時最多同時有 workers 個 shard 在解析或等待取用。"""
+    if len(files) < PARALLEL_MIN_SHARDS or workers <= 1:
+        for f in files:
+            yield parse_shard(f, cache_dir)
+        return
+    remaining = iter(files)
+    with ProcessPoolExecutor(max_workers=min(workers, len(files))) as ex:
+        window = deque(ex.submit(parse_shard, f, cache_dir) for f in islice(remaining, workers))
+        while window:
+            shard = window.popleft().result()
+            nxt = next(remaining, None)
+            if nxt is not None:
+                window.append(ex.submit(parse_shard, nxt, cache_dir))
+            yield shard
+
+
+def merge(base: dict, override: dict) -> dict:
+    """override 覆寫 base；兩邊都是 dict 的欄位逐鍵合併。"""
+    out = dict(base)
+    for k, v in override.items():
+        out[k] = merge(out[k], v) if isinstance(v, dict) and isinstance(out.get(k), dict) else v
+    return out
+
+
+def resolve(entry: dict, templates: Dict[str, dict], memo: Optional[Dict[str, dict]] = None,
+            chain: tuple = ()) -> dict:
+    """展開 entry 的 extends 鏈（memo：已展開的 template，同一組 templates 內共用）。"""
+    parents = entry.get("extends") or []
+    if isinstance(parents, str):
+        parents = [parents]
+    out: dict = {}
+    for name in parents:
+        if name in chain:
+            raise ValueError(f"template cycle: {' -> '.join(chain + (name,))}")
+        if name not in templates:
+            raise ValueError(f"unknown template {name!r} (extended by {entry.get('id', chain[-1] if chain else '?')!r})")
+        if memo is not None and name in memo:
+            resolved = memo[name]
+        else:
+            resolved = resolve(templates[name], templates, memo, chain + (name,))
+            if memo is not None:
+                memo[name] = resolved
+        out = merge(out, resolved)
+    return merge(out, {k: v for k, v in entry.items() if k != "extends"})
+
+
+def _format(value, params: dict):
+    if isinstance(value, str):
+        return value.format_map(params) if '{' in value else value
+    if isinstance(value, dict):
+        return {k: _format(v, params) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_format(v, params) for v in value]
+    return value
+
+
+def expand(entry: dict) -> Iterator[dict]:
+    """matrix 的笛卡兒積（依 matrix 鍵的順序，最後一個鍵變化最快），逐筆產出。沒有 matrix 時原樣產出。"""
+    matrix = entry.get("matrix")
+    if not matrix:
+        yield entry
+        return
+    base = {k: v for k, v in entry.items() if k != "matrix"}
+    keys = list(matrix)
+    for values in product(*(matrix[k] for k in keys)):
+        params = dict(zip(keys, values))
+        try:
+            out = _format(base, params)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"cannot expand {base.get('id')!r} with {params}: {e!r}") from None
+        out.update((k, v) for k, v in params.items() if k in EffectSpec.model_fields)
+        yield out
+
+
+def iter_raw_effects(files: List[Path], cache_dir: Optional[Path] = CATALOG_CACHE_DIR,
+                     workers: Optional[int] = None) -> Iterator[dict]:
+    """展開 templates / matrix 後的 effect dict（未驗證），依 catalog 順序逐筆產出。"""
+    templates: Dict[str, dict] = {}
+    for shard in _shards(files, cache_dir, workers or os.cpu_count() or 1):
+        templates.update(shard["templates"])
+        memo: Dict[str, dict] = {}
+        for entry in shard["effects"]:
+            yield from expand(resolve(entry, templates, memo))
+
+
+def _validate(batch: List[dict], seen: Set[str]) -> List[EffectSpec]:
+    specs = SPEC_LIST.validate_python(batch)
+    dup = [s.id for s in specs if s.id in seen or seen.add(s.id)]
+    if dup:
+        raise ValueError(f"duplicate effect ids in catalog: {sorted(set(dup))[:10]}")
+    return specs
+
+
+def _batches(items: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def iter_effect_specs(path: Path, cache_dir: Optional[Path] = CATALOG_CACHE_DIR,
+                      workers: Optional[int] = None, batch: int = VALIDATE_BATCH) -> Iterator[EffectSpec]:
+    """逐筆產出 EffectSpec（generator）；pipeline 直接消費時不必先建出整個 catalog。
+    重複 id 檢查的 seen 集合仍會保存所有 id。"""
+    files = catalog_files(path)
+    seen: Set[str] = set()
+    count = 0
+    for raw in _batches(iter_raw_effects(files, cache_dir, workers), batch):
+        specs = _validate(raw, seen)
+        count += len(specs)
+        yield from specs
+    logger.debug(f"[catalog] {count} specs from {len(files)} file(s)")
+
+
+def load_effect_specs(path: Path, cache_dir: Optional[Path] = CATALOG_CACHE_DIR,
+                      workers: Optional[int] = None) -> List[EffectSpec]:
+    return list(iter_effect_specs(path, cache_dir, workers))
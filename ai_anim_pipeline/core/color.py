@@ -0,0 +1,73 @@
+from __future__ import annotations
+import numpy as np
+
+# 色彩空間 / alpha 轉換（整段 (…, 4) 陣列向量化運算）
+# sRGB -> linear 以 256 項查表；linear -> sRGB 依公式計算（輸入為浮點）。
+
+_SRGB = np.arange(256, dtype=np.float64) / 255
+SRGB_TO_LINEAR = np.where(_SRGB <= 0.04045, _SRGB / 12.92, ((_SRGB + 0.055) / 1.055) ** 2.4).astype(np.float32)
+D65_WHITE = np.array([0.95047, 1.0, 1.08883], np.float32)
+SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+], np.float32)
+
+
+def srgb_to_linear(rgba: np.ndarray) -> np.ndarray:
+    """uint8 sRGB RGBA -> float32 linear RGB + alpha (0~1)。"""
+    out = np.empty(rgba.shape, np.float32)
+    out[..., :3] = SRGB_TO_LINEAR[rgba[..., :3]]
+    out[..., 3] = rgba[..., 3] * np.float32(1 / 255)
+    return out
+
+
+def linear_to_srgb(linear: np.ndarray) -> np.ndarray:
+    """float linear (0~1) -> float sRGB (0~1)。"""
+    x = np.clip(linear, 0, 1)
+    return np.where(x <= 0.0031308, x * 12.92, 1.055 * np.power(x, 1 / 2.4) - 0.055)
+
+
+def premultiply(rgba: np.ndarray) -> np.ndarray:
+    """float RGBA（straight）-> premultiplied，就地修改並回傳。"""
+    rgba[..., :3] *= rgba[..., 3:4]
+    return rgba
+
+
+def unpremultiply(rgba: np.ndarray) -> np.ndarray:
+    """float RGBA（premultiplied）-> straight，就地修改並回傳；alpha 為 0 的像素 RGB 設為 0。"""
+    a = rgba[..., 3:4]
+    np.divide(rgba[..., :3], a, out=rgba[..., :3], where=a > 0)
+    rgba[..., :3] *= a > 0
+    return rgba
+
+
+def premultiply_u8(rgba: np.ndarray) -> np.ndarray:
+    """uint8 straight RGBA -> uint8 premultiplied（四捨五入）。"""
+    out = rgba.copy()
+    out[..., :3] = (rgba[..., :3].astype(np.uint16) * rgba[..., 3:4] + 127) // 255
+    return out
+
+
+def unpremultiply_u8(rgba: np.ndarray) -> np.ndarray:
+    """uint8 premultiplied RGBA -> uint8 straight（影片編碼器需要 straight alpha）。"""
+    a = rgba[..., 3:4].astype(np.uint16)
+    out = rgba.copy()
+    rgb = (rgba[..., :3].astype(np.uint16) * 255 + a // 2) // np.maximum(a, 1)
+    out[..., :3] = np.where(a > 0, np.minimum(rgb, 255), 0)
+    return out
+
+
+def to_u8(x: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(x * 255), 0, 255).astype(np.uint8)
+
+
+def srgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """sRGB (0~1, 任意前置維度 + 最後一維 3) -> CIELAB。"""
+    lin = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = (lin @ SRGB_TO_XYZ.T) / D65_WHITE
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    L = 116 * f[..., 1] - 16
+    a = 500 * (f[..., 0] - f[..., 1])
+    b = 200 * (f[..., 1] - f[..., 2])
+    return np.stack([L, a, b], axis=-1)
@@ -0,0 +1,151 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+import io
+import os
+import zlib
+import numpy as np
+
+# 依大小預算搜尋 PNG 編碼參數
+# 1. 無損：zlib level / 壓縮策略（DEFAULT / FILTERED / RLE）由便宜到昂貴嘗試，第一個放得進預算的即採用
+# 2. 有損：alpha 量化、8-bit 調色盤（可選 ordered dither）及其組合，全部候選平行編碼，
+#    在放得進預算的候選中取 PSNR 最高者；都放不下時取最小者
+# Pillow 的編碼 / 量化在 C 端釋放 GIL，所以用 thread pool 即可平行，不需複製頁面到子行程。
+
+ZLIB_STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "rle": zlib.Z_RLE,
+}
+
+LOSSLESS = [
+    {"level": 6, "strategy": "default"},
+    {"level": 6, "strategy": "filtered"},
+    {"level": 9, "strategy": "default"},
+    {"level": 9, "strategy": "filtered"},
+    {"level": 9, "strategy": "rle"},
+]
+
+# 大致依品質損失由小到大排列
+LOSSY = [
+    {"alpha_levels": 64},
+    {"alpha_levels": 32},
+    {"colors": 256, "dither": True},
+    {"colors": 256, "dither": False},
+    {"colors": 256, "dither": True, "alpha_levels": 16},
+    {"colors": 128, "dither": True},
+    {"colors": 64, "dither": True},
+    {"colors": 64, "dither": True, "alpha_levels": 8},
+]
+
+BAYER_4 = (np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+], np.float32) + 0.5) / 16 - 0.5
+
+ENCODE_WORKERS = os.cpu_count() or 1
+_executor = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="png-encode")
+    return _executor
+
+
+def quantize_alpha(rgba: np.ndarray, levels: int) -> np.ndarray:
+    """alpha 量化為 levels 階（0 與 255 保持不變）。"""
+    out = rgba.copy()
+    step = 255 / (levels - 1)
+    out[..., 3] = np.round(np.round(rgba[..., 3] / step) * step).astype(np.uint8)
+    return out
+
+
+def ordered_dither(rgba: np.ndarray, colors: int) -> np.ndarray:
+    """以 4x4 Bayer 矩陣在 RGB 加入量化步距大小的閾值雜訊，之後再量化成調色盤。"""
+    h, w = rgba.shape[:2]
+    step = 255 / max(colors ** (1 / 3) - 1, 1)
+    noise = np.tile(BAYER_4, (-(-h // 4), -(-w // 4)))[:h, :w, None] * step
+    out = rgba.copy()
+    out[..., :3] = np.clip(rgba[..., :3] + noise, 0, 255).astype(np.uint8)
+    return out
+
+
+def apply_settings(rgba: np.ndarray, settings: dict) -> Image.Image:
+    arr = rgba
+    if settings.get("alpha_levels"):
+        arr = quantize_alpha(arr, settings["alpha_levels"])
+    colors = settings.get("colors")
+    if colors and settings.get("dither"):
+        arr = ordered_dither(arr, colors)
+    img = Image.fromarray(arr, 'RGBA')
+    if colors:
+        img = img.quantize(colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    return img
+
+
+def psnr(reference: np.ndarray, img: Image.Image) -> float:
+    """RGBA 四個通道依儲存值直接比較的 PSNR (dB)；完全相同回傳 inf。
+
+    pack / atlas 的頁面已是 premultiplied，不再乘一次 alpha。
+    """
+    a = reference.astype(np.float32)
+    b = np.asarray(img.convert('RGBA'), np.float32)
+    mse = float(np.mean((a - b) ** 2))
+    return float('inf') if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+
+def encode_png(img: Image.Image, strategy: str = "default", level: int = 9) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format='PNG', compress_level=level, compress_type=ZLIB_STRATEGIES[strategy])
+    return buf.getvalue()
+
+
+def _encode_page(rgba: np.ndarray, settings: dict, zlib_opts: dict, with_psnr: bool) -> Tuple[bytes, float]:
+    img = apply_settings(rgba, settings)
+    opts = dict(zlib_opts, **{k: settings[k] for k in ("level", "strategy") if k in settings})
+    data = encode_png(img, opts["strategy"], opts["level"])
+    return data, (psnr(rgba, img) if with_psnr else float('inf'))
+
+
+def _encode_all(pages: List[np.ndarray], candidates: List[dict], zlib_opts: dict, with_psnr: bool):
+    """每個候選 x 每頁平行編碼。回傳 [(settings, [bytes...], 最差頁 PSNR)]。"""
+    futures = [[_pool().submit(_encode_page, p, c, zlib_opts, with_psnr) for p in pages] for c in candidates]
+    results = []
+    for c, fs in zip(candidates, futures):
+        out = [f.result() for f in fs]
+        results.append((c, [d for d, _ in out], min((q for _, q in out), default=float('inf'))))
+    return results
+
+
+def encode_pages(pages: List[np.ndarray], budget_bytes: Optional[int] = None) -> Tuple[List[bytes], Dict]:
+    """依預算選擇編碼參數。回傳 (每頁 PNG bytes, 編碼資訊)。"""
+    if not pages:
+        return [], {"bytes": 0, "page_bytes": [], "psnr": None, "budget_bytes": budget_bytes, "within_budget": True}
+    best = None
+    # 無損候選依序嘗試（不平行）：便宜的先試，放得進預算就不必付出更高壓縮等級的成本
+    for c in (LOSSLESS if budget_bytes else LOSSLESS[:1]):
+        (_, datas, _), = _encode_all(pages, [c], {}, False)
+        total = sum(map(len, datas))
+        if best is None or total < best[2]:
+            best = (c, datas, total, float('inf'))
+        if budget_bytes is None or total <= budget_bytes:
+            break
+    if budget_bytes is not None and best[2] > budget_bytes:
+        zlib_opts = best[0]
+        lossy = [(dict(zlib_opts, **c), datas, sum(map(len, datas)), q)
+                 for c, datas, q in _encode_all(pages, LOSSY, zlib_opts, True)]
+        fitting = [r for r in lossy if r[2] <= budget_bytes]
+        if fitting:
+            best = max(fitting, key=lambda r: (r[3], -r[2]))
+        else:
+            best = min(lossy + [best], key=lambda r: r[2])
+    settings, datas, total, quality = best
+    info = dict(settings, bytes=total, page_bytes=[len(d) for d in datas],
+                psnr=None if quality == float('inf') else round(quality, 2),
+                budget_bytes=budget_bytes, within_budget=budget_bytes is None or total <= budget_bytes)
+    return datas, info
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from loguru import logger
+import glob
+import os
+import struct
+import threading
+import numpy as np
+
+from . import OUTPUT_DIR
+from .cache import stable_hash
+from .frames import FrameSource, reduce_frame
+
+FRAME_CACHE_DIR = OUTPUT_DIR / 'temp' / 'frames'
+DEFAULT_BUDGET_BYTES = 4 * 1024 ** 3
+
+# 解碼一次、各 stage 共用的影格快取
+# - 第一個需要某變體影格的 stage（通常是 evaluate）解碼時，同時把全解析度影格寫進 {variant_id}-{digest}.npy；
+#   之後的 stage（postprocess 的兩趟、其他行程）直接 memmap 讀取，不再解碼
+# - digest 為 (影片路徑, 大小, mtime_ns, fps) 的雜湊，影片換了就是新的 entry
+# - 整段沒讀完（evaluate 提前淘汰）就不寫入快取；超過磁碟上限的單一片段也不快取
+# - 磁碟用量超過上限時依 mtime（命中時更新）淘汰最久未用的 entry；已開啟的 memmap 在檔案刪除後仍可讀
+# - spec 打包完成後以 release() 刪除其所有變體的 entry
+
+# npy header 補齊到 4096 bytes，資料區與頁對齊；寫完影格、知道總格數後再回頭寫 header
+HEADER_BYTES = 4096
+DIGEST_LEN = 12
+
+_root = FRAME_CACHE_DIR
+_budget = DEFAULT_BUDGET_BYTES
+
+
+def configure(budget_bytes: Optional[int], root: Path = FRAME_CACHE_DIR):
+    """設定本行程的 frame cache（process pool 的 worker 也要呼叫）；budget 為 0 / None 時停用。"""
+    global _root, _budget
+    _root, _budget = Path(root), int(budget_bytes or 0)
+
+
+def budget_bytes() -> int:
+    return _budget
+
+
+def enabled() -> bool:
+    return _budget > 0
+
+
+def _npy_header(shape) -> bytes:
+    header = f"{{'descr': '|u1', 'fortran_order': False, 'shape': {tuple(shape)!r}, }}".encode('latin1')
+    body = header.ljust(HEADER_BYTES - 10 - 1) + b'\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(body)) + body
+
+
+def _entry_path(key: str, video_path, fps) -> Path:
+    path = Path(video_path)
+    st = path.stat()
+    digest = stable_hash(str(path.resolve()), st.st_size, st.st_mtime_ns, float(fps) if fps else None)
+    return _root / f"{key}-{digest[:DIGEST_LEN]}.npy"
+
+
+def _evict(incoming: int):
+    """淘汰最久未用的 entry，直到加上 incoming bytes 仍在上限內。"""
+    entries = []
+    for p in _root.glob('*.npy'):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = incoming + sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= _budget:
+            break
+        try:
+            p.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # 其他平台上使用中的檔案可能刪不掉，略過
+            continue
+        total -= size
+        logger.debug(f"[framecache] evicted {p.name} ({size / 1024 ** 2:.1f}MB)")
+
+
+class _EntryWriter:
+    """把解碼中的全解析度影格依序寫入暫存檔；commit() 時補上 header 並放進快取。"""
+
+    def __init__(self, dst: Path, size):
+        self.dst = dst
+        self.w, self.h = size
+        self.count = 0
+        self.tmp = dst.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.tmp, 'wb')
+        self._f.seek(HEADER_BYTES)
+
+    def write(self, frame: np.ndarray) -> bool:
+        """寫入一格；超過磁碟上限時放棄快取並回傳 False。"""
+        if self._f is None:
+            return False
+        if HEADER_BYTES + (self.count + 1) * self.w * self.h * 4 > _budget:
+            self.discard()
+            return False
+        self._f.write(np.ascontiguousarray(frame).data)
+        self.count += 1
+        return True
+
+    def commit(self) -> Optional[Path]:
+        if self._f is None:
+            return None
+        self._f.seek(0)
+        self._f.write(_npy_header((self.count, self.h, self.w, 4)))
+        self._f.close()
+        self._f = None
+        _evict(HEADER_BYTES + self.count * self.w * self.h * 4)
+        os.replace(self.tmp, self.dst)
+        return self.dst
+
+    def discard(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+            self.tmp.unlink(missing_ok=True)
+
+
+class CachingFrameSource(FrameSource):
+    """快取未命中時的來源：第一次完整讀完時寫入快取，之後的 frames() / chunks() 改讀快取的 memmap。"""
+
+    def __init__(self, path, dst: Path, fps=None, max_side=None, max_bytes=None):
+        super().__init__(path, fps=fps, max_side=max_side, max_bytes=max_bytes)
+        self._dst = dst
+        self._cached: Optional[FrameSource] = None
+
+    def frames(self) -> Iterator[np.ndarray]:
+        if self._cached is not None:
+            yield from self._cached.frames()
+            return
+        full = FrameSource(self.path, fps=self.fps)
+        factor = self.reduce_factor
+        writer = _EntryWriter(self._dst, full.size)
+        try:
+            for frame in full.frames():
+                writer.write(frame)
+                yield reduce_frame(frame, factor) if factor > 1 else frame
+            committed = writer.commit()
+        finally:
+            # 沒讀完（呼叫端提前結束 / 解碼錯誤）時丟棄暫存檔
+            writer.discard()
+        if committed is not None:
+            self._cached = FrameSource(committed, max_side=self.max_side, max_bytes=self.max_bytes)
+            self._cached._array()
+            logger.debug(f"[framecache] stored {committed.name} ({writer.count} frames)")
+
+    def chunks(self, max_bytes: Optional[int] = None) -> Iterator[np.ndarray]:
+        if self._cached is not None:
+            return self._cached.chunks(max_bytes)
+        return super().chunks(max_bytes)
+
+
+def source(video_path, key: str, fps: Optional[float] = None, max_side: Optional[int] = None,
+           max_bytes: Optional[int] = None) -> FrameSource:
+    """取得 video_path 的影格來源；key 為變體 id。
+
+    命中時回傳快取 .npy 的 FrameSource（memmap，零複製；max_side 以區塊平均縮小）；
+    未命中時邊解碼邊寫入快取。停用時等同 FrameSource(video_path, ...)。
+    """
+    if not enabled():
+        return FrameSource(video_path, fps=fps, max_side=max_side, max_bytes=max_bytes)
+    dst = _entry_path(key, video_path, fps)
+    try:
+        os.utime(dst)
+        cached = FrameSource(dst, max_side=max_side, max_bytes=max_bytes)
+        # 先開啟 mapping，之後被其他行程淘汰也不影響本次讀取
+        cached._array()
+        return cached
+    except (FileNotFoundError, ValueError):
+        return CachingFrameSource(video_path, dst, fps=fps, max_side=max_side, max_bytes=max_bytes)
+
+
+def release(keys: Iterable[str]):
+    """刪除這些變體的所有 entry（spec 打包完成後呼叫）。"""
+    if not enabled():
+        return
+    for key in keys:
+        for p in _root.glob(f"{glob.escape(key)}-{'?' * DIGEST_LEN}.npy"):
+            p.unlink(missing_ok=True)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterator, List, Optional
+from PIL import Image
+import numpy as np
+import shutil
+import subprocess
+
+# 影格解碼 / 寫出
+# APNG / GIF / WebP 等動畫圖檔走 Pillow；mp4 / webm / mov 等影片容器走 ffmpeg (rawvideo rgba pipe)；
+# postprocess 輸出的 (T, H, W, 4) .npy 以 memmap 開啟，影格 / chunk 直接是檔案的 view，不需解碼。
+# 解出的影格一律為 (H, W, 4) uint8 RGBA，以 generator 串流產出，不會整段放進記憶體。
+
+PILLOW_SUFFIXES = {'.png', '.apng', '.gif', '.webp'}
+NPY_SUFFIX = '.npy'
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def set_chunk_budget(max_bytes: int):
+    """設定本行程 FrameSource 預設的 chunk 記憶體上限（process pool 的 worker 也要呼叫）。"""
+    global DEFAULT_CHUNK_BYTES
+    DEFAULT_CHUNK_BYTES = max(1, int(max_bytes))
+
+
+def reduce_frame(frame: np.ndarray, factor: int) -> np.ndarray:
+    """(H, W, 4) uint8 RGBA 以 factor x factor 區塊平均縮小，RGB 以 alpha 加權（透明像素的顏色不混入）。
+
+    在 Pillow 的 premultiplied 模式 (RGBa) 下 reduce，運算在 C 端；邊緣不足一塊的以實際像素數平均。
+    """
+    img = Image.fromarray(np.ascontiguousarray(frame), 'RGBA').convert('RGBa').reduce(factor)
+    return np.asarray(img.convert('RGBA'))
+
+
+def _probe_size(path: Path):
+    out = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height', '-of', 'csv=p=0', str(path)],
+        check=True, capture_output=True, text=True).stdout
+    w, h = out.strip().split(',')[:2]
+    return int(w), int(h)
+
+
+class FrameSource:
+    """串流影格來源，evaluate / postprocess / pack 共用。
+
+    - fps：取樣率提示，用來還原 APNG 中被合併的重複影格、統一影片取樣率
+    - max_side：以整數倍率縮小到長邊不超過此值（給不需要全解析度的指標用），None 表示原尺寸；
+      各種來源（Pillow / ffmpeg / 快取的 .npy）都以同一個 reduce_frame 縮小，指標與是否命中 frame cache 無關
+    - max_bytes：chunks() 每個 chunk 的記憶體上限（至少容納一格）
+
+    同一時間只保留「目前這一格」或「目前這一個 chunk」，峰值記憶體與片長無關。
+    """
+
+    def __init__(self, path, fps: Optional[float] = None, max_side: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.fps = fps
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self._use_pillow = self.path.suffix.lower() in PILLOW_SUFFIXES
+        self._use_npy = self.path.suffix.lower() == NPY_SUFFIX
+        if not (self._use_pillow or self._use_npy) and not (shutil.which('ffmpeg') and shutil.which('ffprobe')):
+            raise ValueError(f"no decoder for {self.path.name} (ffmpeg not found)")
+        self._source_size = None
+        self._mmap = None
+
+    @property
+    def source_size(self):
+        """原始 (width, height)"""
+        if self._source_size is None:
+            if self._use_npy:
+                _, h, w, _ = self._array().shape
+                self._source_size = (w, h)
+            elif self._use_pillow:
+                with Image.open(self.path) as im:
+                    self._source_size = im.size
+            else:
+                self._source_size = _probe_size(self.path)
+        return self._source_size
+
+    @property
+    def reduce_factor(self) -> int:
+        if not self.max_side:
+            return 1
+        return max(1, -(-max(self.source_size) // self.max_side))
+
+    @property
+    def size(self):
+        """解碼輸出的 (width, height)"""
+        w, h = self.source_size
+        f = self.reduce_factor
+        return -(-w // f), -(-h // f)
+
+    def _array(self) -> np.ndarray:
+        # 開啟一次後保留 mapping；檔案之後被刪除（例如 frame cache 淘汰）仍可繼續讀
+        if self._mmap is None:
+            self._mmap = np.load(self.path, mmap_mode='r')
+        return self._mmap
+
+    def _pillow_frames(self) -> Iterator[np.ndarray]:
+        base_ms = 1000.0 / self.fps if self.fps else None
+        with Image.open(self.path) as im:
+            for k in range(getattr(im, 'n_frames', 1)):
+                im.seek(k)
+                frame = np.asarray(im.convert('RGBA'))
+                # Pillow 寫 APNG 時會把連續相同影格合併成一格較長的 duration，依 fps 展開回原本格數
+                repeat = 1
+                if base_ms and im.info.get('duration'):
+                    repeat = max(1, round(im.info['duration'] / base_ms))
+                for _ in range(repeat):
+                    yield frame
+
+    def _ffmpeg_frames(self) -> Iterator[np.ndarray]:
+        w, h = self.source_size
+        cmd = ['ffmpeg', '-v', 'error', '-i', str(self.path)]
+        if self.fps:
+            cmd += ['-vf', f"fps={self.fps}"]
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'rgba', '-']
+        frame_bytes = w * h * 4
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        try:
+            while True:
+                buf = proc.stdout.read(frame_bytes)
+                if len(buf) < frame_bytes:
+                    break
+                yield np.frombuffer(buf, np.uint8).reshape(h, w, 4)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+    def frames(self) -> Iterator[np.ndarray]:
+        """逐格產出 (H, W, 4) uint8。"""
+        if self._use_npy:
+            raw = iter(self._array())
+        else:
+            raw = self._pillow_frames() if self._use_pillow else self._ffmpeg_frames()
+        f = self.reduce_factor
+        return raw if f == 1 else (reduce_frame(frame, f) for frame in raw)
+
+    def chunks(self, max_bytes: Optional[int] = None) -> Iterator[np.ndarray]:
+        """產出 (n, H, W, 4) 的 chunk，n * H * W * 4 <= max_bytes。
+
+        chunk 共用同一塊緩衝區，下一次迭代會被覆寫；需要保留時請自行 copy()。
+        """
+        w, h = self.size
+        budget = max_bytes or self.max_bytes or DEFAULT_CHUNK_BYTES
+        n = max(1, budget // (w * h * 4))
+        if self._use_npy and self.reduce_factor == 1:
+            # memmap 直接切片（唯讀 view，零複製）
+            arr = self._array()
+            for i in range(0, len(arr), n):
+                yield arr[i:i + n]
+            return
+        buf = np.empty((n, h, w, 4), np.uint8)
+        i = 0
+        for frame in self.frames():
+            buf[i] = frame
+            i += 1
+            if i == n:
+                yield buf
+                i = 0
+        if i:
+            yield buf[:i]
+
+
+def iter_frames(path, fps: Optional[float] = None) -> Iterator[np.ndarray]:
+    """逐格解碼；fps 用於還原被合併的重複影格 / 統一影片取樣率。"""
+    return FrameSource(path, fps=fps).frames()
+
+
+def read_frames(path, fps: Optional[float] = None, max_side: Optional[int] = None) -> np.ndarray:
+    """整段解碼為 (T, H, W, 4) uint8（短片 / 測試用；長片請用 FrameSource 串流）。"""
+    frames = list(FrameSource(path, fps=fps, max_side=max_side).frames())
+    if not frames:
+        raise ValueError(f"no frames decoded from {path}")
+    return np.stack(frames)
+
+
+def write_apng(path, frames, fps: float, compress_level: int = 6) -> Path:
+    """將 (T, H, W, 4) uint8 影格寫成 APNG。"""
+    images: List[Image.Image] = [Image.fromarray(np.ascontiguousarray(f), 'RGBA') for f in frames]
+    images[0].save(path, format='PNG', save_all=True, append_images=images[1:],
+                   duration=1000.0 / fps, loop=0, compress_level=compress_level)
+    return Path(path)
@@ -0,0 +1,241 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional
+import sqlite3
+import time
+import numpy as np
+
+from . import OUTPUT_DIR
+from .trace import SPARK
+
+HISTORY_PATH = OUTPUT_DIR / 'history' / 'history.db'
+HISTORY_WINDOW = 10        # 與前 N 次執行比較
+SIZE_REGRESSION = 0.10     # 資產大小超過基準（前 N 次中位數）10% 即標記
+TIME_REGRESSION = 0.50     # stage 耗時超過基準 50% 即標記
+TIME_NOISE_SEC = 0.05      # 且至少慢 50ms（避免毫秒級 stage 的雜訊）
+PASS_RATE_DROP = 0.10      # 整體 QA 通過率比基準低 10 個百分點即標記
+VARIANT_PASS_DROP = 0.20   # 單一 effect 的變體通過率比基準低 20 個百分點即標記
+TREND_ROWS = 20            # report 的 effect 趨勢表最多列數
+
+# 每次執行的歷史紀錄（SQLite，窄表：一列一個 (run, effect, metric) 值，方便以 SQL 依欄位查詢）
+# - runs.label：比較對象的標籤（預設為 catalog 路徑），analyze() 只以同標籤的前 N 次執行為基準，
+#   benchmark 或其他 catalog 的執行不會混進正式 catalog 的基準
+# - effect_metrics：kpi 指標、是否通過 (pass)、變體通過率（通過的變體數 / 生成的變體數）、
+#   資產 bytes（standalone sheet / 影片）與 GPU 貼圖 bytes；atlas 頁面以 effect_id = "atlas:{group}" 記錄
+# - stage_times：trace 的耗時彙總（trace.drain_timings()，不需產生 span 事件）依 (effect, stage) 的 wall / CPU 秒數，
+#   cached 表示該 stage 全部命中 stage cache
+# analyze() 以前 N 次執行為基準（中位數）產生趨勢、百分位數與退步標記；耗時只比較未命中快取的紀錄。
+# 通過 = 有通過 QA 的變體；NO_PASS 與 coordinator 的 FAILED（worker 處理失敗）都算未通過。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    label TEXT,
+    total INTEGER NOT NULL,
+    passed INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS effect_metrics (
+    run_id INTEGER NOT NULL,
+    effect_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS effect_metrics_key ON effect_metrics (effect_id, metric, run_id);
+CREATE TABLE IF NOT EXISTS stage_times (
+    run_id INTEGER NOT NULL,
+    effect_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    wall_sec REAL NOT NULL,
+    cpu_sec REAL NOT NULL,
+    cached INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_times_key ON stage_times (effect_id, stage, run_id);
+"""
+
+
+def spec_passed(kpi: dict) -> bool:
+    """spec 有通過 QA 的變體（已打包）。沒有變體計數的舊紀錄以有無 status（NO_PASS / FAILED）判斷。"""
+    if "variants_passed" in kpi:
+        return kpi["variants_passed"] > 0
+    return "status" not in kpi
+
+
+def _effect_rows(kpi_records: List[dict], items: List[dict], atlases: Optional[List[dict]]) -> List[tuple]:
+    """(effect_id, metric, value)。"""
+    rows = []
+    for kpi in kpi_records:
+        effect = kpi.get("id")
+        if effect is None:
+            continue
+        rows.append((effect, "pass", float(spec_passed(kpi))))
+        if kpi.get("variants"):
+            rows.append((effect, "variant_pass_rate", kpi.get("variants_passed", 0) / kpi["variants"]))
+        rows += [(effect, k, float(v)) for k, v in kpi.items() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    for item in items:
+        encoding = item.get("encoding") or {}
+        if encoding.get("bytes") is not None:
+            rows.append((item["id"], "asset_bytes", float(encoding["bytes"])))
+        gpu = item.get("gpu_textures") or {}
+        if gpu:
+            rows.append((item["id"], "gpu_bytes", float(sum(v["bytes"] for v in gpu.values()))))
+    for a in atlases or ():
+        rows.append((f"atlas:{a['group']}", "asset_bytes", float(a["bytes"])))
+        if a.get("gpu_bytes"):
+            rows.append((f"atlas:{a['group']}", "gpu_bytes", float(sum(a["gpu_bytes"].values()))))
+    return rows
+
+
+def _stage_rows(timings: List[tuple]) -> List[tuple]:
+    """trace.drain_timings() -> (effect_id, stage, wall_sec, cpu_sec, cached)；同一 effect 同一 stage
+    （例如多個變體的 evaluate）已在 trace 端加總。"""
+    rows = []
+    for name, spec, group, wall, cpu, cached in timings:
+        effect = spec or (f"atlas:{group}" if group is not None else None)
+        if effect is None or name == "spec":
+            continue
+        rows.append((effect, name, round(wall, 6), round(cpu, 6), int(cached)))
+    return rows
+
+
+def _percentiles(values) -> dict:
+    p50, p90, p95 = np.percentile(np.asarray(values, float), [50, 90, 95])
+    return {"count": len(values), "p50": round(float(p50), 4), "p90": round(float(p90), 4),
+            "p95": round(float(p95), 4), "max": round(float(max(values)), 4)}
+
+
+def sparkline(values: List[Optional[float]]) -> str:
+    """依最小到最大值縮放的 sparkline；缺值以空白表示。"""
+    known = [v for v in values if v is not None]
+    if not known:
+        return ""
+    lo, hi = min(known), max(known)
+    span = hi - lo
+    return "".join(" " if v is None else SPARK[1 + round((v - lo) / span * (len(SPARK) - 2)) if span else 4]
+                   for v in values)
+
+
+class HistoryStore:
+    def __init__(self, path: Path = HISTORY_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=60)
+        self._conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def record(self, kpi_records: List[dict], items: List[dict], timings: List[tuple] = (),
+               atlases: Optional[List[dict]] = None, label: Optional[str] = None) -> int:
+        """寫入一次執行（單一交易），回傳 run_id。items 為 atlas 合併前的 manifest item（各 effect 自己的資產大小），
+        timings 為 trace.drain_timings()。"""
+        passed = sum(1 for k in kpi_records if spec_passed(k))
+        with self._conn:
+            run_id = self._conn.execute("INSERT INTO runs (started, label, total, passed) VALUES (?, ?, ?, ?)",
+                                        (time.time(), label, len(kpi_records), passed)).lastrowid
+            self._conn.executemany("INSERT INTO effect_metrics VALUES (?, ?, ?, ?)",
+                                   [(run_id, *r) for r in _effect_rows(kpi_records, items, atlases)])
+            self._conn.executemany("INSERT INTO stage_times VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(run_id, *r) for r in _stage_rows(timings)])
+        return run_id
+
+    def runs(self, run_id: int, window: int) -> List[tuple]:
+        """run_id 與其之前同標籤的最多 window 次執行，舊到新：[(run_id, started, total, passed)]。"""
+        rows = self._conn.execute("SELECT run_id, started, total, passed FROM runs WHERE run_id <= ? "
+                                  "AND label IS (SELECT label FROM runs WHERE run_id = ?) "
+                                  "ORDER BY run_id DESC LIMIT ?", (run_id, run_id, window + 1)).fetchall()
+        return rows[::-1]
+
+    def _metric_series(self, run_ids: List[int], metric: str) -> Dict[str, Dict[int, float]]:
+        out: Dict[str, Dict[int, float]] = {}
+        q = (f"SELECT effect_id, run_id, value FROM effect_metrics WHERE metric = ? "
+             f"AND run_id IN ({','.join('?' * len(run_ids))})")
+        for effect, run, value in self._conn.execute(q, (metric, *run_ids)):
+            out.setdefault(effect, {})[run] = value
+        return out
+
+    def _stage_series(self, run_ids: List[int]) -> Dict[tuple, Dict[int, float]]:
+        out: Dict[tuple, Dict[int, float]] = {}
+        q = (f"SELECT effect_id, stage, run_id, wall_sec FROM stage_times WHERE cached = 0 "
+             f"AND run_id IN ({','.join('?' * len(run_ids))})")
+        for effect, stage, run, wall in self._conn.execute(q, run_ids):
+            out.setdefault((effect, stage), {})[run] = wall
+        return out
+
+    def analyze(self, run_id: int, window: int = HISTORY_WINDOW) -> dict:
+        """以前 window 次執行為基準：趨勢、百分位數與退步標記。"""
+        runs = self.runs(run_id, window)
+        ids = [r[0] for r in runs]
+        base = ids[:-1]
+        sizes = self._metric_series(ids, "asset_bytes")
+        passes = self._metric_series(ids, "pass")
+        variant_rates = self._metric_series(ids, "variant_pass_rate")
+        stages = self._stage_series(ids)
+        regressions = []
+
+        def baseline(series: Dict[int, float]) -> Optional[float]:
+            vals = [series[r] for r in base if r in series]
+            return float(np.median(vals)) if vals else None
+
+        for effect, series in sizes.items():
+            ref, cur = baseline(series), series.get(run_id)
+            if ref and cur is not None and cur > ref * (1 + SIZE_REGRESSION):
+                regressions.append({"kind": "size", "effect": effect, "current": cur, "baseline": ref,
+                                    "ratio": round(cur / ref, 3)})
+        for effect, series in passes.items():
+            prior = [series[r] for r in base if r in series]
+            # 之前多數執行通過、這次沒通過
+            if series.get(run_id) == 0.0 and prior and sum(prior) / len(prior) >= 0.5:
+                regressions.append({"kind": "qa_fail", "effect": effect, "current": 0.0,
+                                    "baseline": round(sum(prior) / len(prior), 3)})
+        failed_now = {r["effect"] for r in regressions if r["kind"] == "qa_fail"}
+        for effect, series in variant_rates.items():
+            ref, cur = baseline(series), series.get(run_id)
+            # 整個沒通過的已標記為 qa_fail
+            if ref is not None and cur is not None and effect not in failed_now and cur < ref - VARIANT_PASS_DROP:
+                regressions.append({"kind": "variant_pass_rate", "effect": effect, "current": round(cur, 3),
+                                    "baseline": round(ref, 3)})
+        rates = {r[0]: r[3] / r[2] if r[2] else None for r in runs}
+        prior_rates = [rates[r] for r in base if rates[r] is not None]
+        if prior_rates and rates[run_id] is not None:
+            ref = float(np.median(prior_rates))
+            if rates[run_id] < ref - PASS_RATE_DROP:
+                regressions.append({"kind": "pass_rate", "effect": None, "current": round(rates[run_id], 3),
+                                    "baseline": round(ref, 3)})
+        for (effect, stage), series in stages.items():
+            ref, cur = baseline(series), series.get(run_id)
+            if ref is not None and cur is not None and cur > ref * (1 + TIME_REGRESSION) and cur - ref > TIME_NOISE_SEC:
+                regressions.append({"kind": "stage_time", "effect": effect, "stage": stage, "current": round(cur, 4),
+                                    "baseline": round(ref, 4), "ratio": round(cur / ref, 3) if ref else None})
+
+        # 百分位數：各 stage（未命中快取）耗時、各 effect 資產大小，皆取整個 window（含本次）
+        by_stage: Dict[str, List[float]] = {}
+        for (_, stage), series in stages.items():
+            by_stage.setdefault(stage, []).extend(series.values())
+        current_sizes = [s[run_id] for s in sizes.values() if run_id in s]
+
+        flagged = {r["effect"] for r in regressions if r["effect"]}
+        current = sorted(sizes, key=lambda e: (e not in flagged, -sizes[e].get(run_id, 0)))
+        trends = {e: {"asset_bytes": [sizes[e].get(r) for r in ids],
+                      "pass": [passes.get(e, {}).get(r) for r in ids],
+                      "variant_pass_rate": [variant_rates.get(e, {}).get(r) for r in ids]} for e in current[:TREND_ROWS]}
+        return {
+            "run_id": run_id,
+            "window": window,
+            "runs": [{"run_id": r, "started": started, "total": total, "passed": passed,
+                      "pass_rate": round(passed / total, 3) if total else None,
+                      "asset_bytes": sum(s.get(r, 0) for e, s in sizes.items() if not e.startswith("atlas:"))}
+                     for r, started, total, passed in runs],
+            "percentiles": {
+                "stage_sec": {stage: _percentiles(v) for stage, v in sorted(by_stage.items())},
+                "asset_kb": _percentiles([v / 1024 for v in current_sizes]) if current_sizes else None,
+            },
+            "trends": trends,
+            "regressions": regressions,
+        }
@@ -0,0 +1,102 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Optional
+from loguru import logger
+import json
+import os
+import time
+
+from . import OUTPUT_DIR
+from .cache import stable_hash
+
+JOURNAL_PATH = OUTPUT_DIR / 'journal' / 'run.ndjson'
+
+# append-only 執行紀錄（NDJSON，一行一個完成的 spec）
+# - 每筆 {"id", "spec_hash", "item", "kpi"}；spec_hash 為 spec 內容雜湊，spec 改過的紀錄在 resume 時不採用
+# - 寫入先累積在記憶體，滿 batch_size 筆或距上次寫入超過 flush_sec 時以單次 append write + fsync 寫出，
+#   當機最多遺失最後一批（resume 時重跑）
+# - 讀取時略過寫到一半的最後一行；同一 id 多筆以最後一筆為準
+
+
+def spec_hash(spec) -> str:
+    return stable_hash(spec.model_dump())
+
+
+class RunJournal:
+    def __init__(self, path: Path = JOURNAL_PATH, batch_size: int = 32, flush_sec: float = 2.0,
+                 fresh: bool = False):
+        self.path = Path(path)
+        self.batch_size = max(1, batch_size)
+        self.flush_sec = flush_sec
+        self._pending: List[bytes] = []
+        self._last_flush = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (os.O_TRUNC if fresh else 0)
+        self._fd = os.open(self.path, flags, 0o644)
+        # 上次中斷時可能留下沒有換行結尾的半行，補上換行讓新紀錄從新的一行開始
+        size = os.fstat(self._fd).st_size
+        if size and not fresh:
+            with open(self.path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    os.write(self._fd, b'\n')
+
+    def append(self, spec, item: Optional[dict], kpi: dict):
+        record = {"id": spec.id, "spec_hash": spec_hash(spec), "item": item, "kpi": kpi}
+        self._pending.append(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            # 一次 write 寫出整批（O_APPEND），再 fsync 確保落盤
+            os.write(self._fd, b''.join(self._pending))
+            os.fsync(self._fd)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(path: Path = JOURNAL_PATH) -> Dict[str, dict]:
+    """讀取 journal，回傳 id -> 最後一筆紀錄；不存在時回傳空 dict。"""
+    records = {}
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return records
+    with f:
+        for n, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"[journal] skipping incomplete line {n} in {path}")
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def lookup(spec, records: Dict[str, dict]) -> Optional[tuple]:
+    """spec 已完成且內容未變時回傳 (item, kpi)，否則 None。"""
+    r = records.get(spec.id)
+    if r is not None and r["spec_hash"] == spec_hash(spec):
+        return r["item"], r["kpi"]
+    return None
+
+
+def completed(specs, records: Dict[str, dict]) -> Dict[int, tuple]:
+    """catalog 中已完成且 spec 未變的項目：index -> (item, kpi)。"""
+    done = {}
+    for i, spec in enumerate(specs):
+        result = lookup(spec, records)
+        if result is not None:
+            done[i] = result
+    return done
@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import Optional
+import math
+import numpy as np
+
+from .color import srgb_to_lab
+
+# 循環接縫偵測 / 修補（loops=true 的 effect）
+# - 距離：兩格在 CIELAB 下的平均 ΔE76 / 100（premultiplied 顏色，與 evaluate 的 loopError 相同定義）
+# - 偵測：以縮圖特徵對每個間距 k 一次向量化算出所有 d(frame[s], frame[s + k])，取距離最小的 (start, end)，
+#   裁成 frames[start:end + 1]（首尾相接：最後一格 ≈ 第一格，與 loopError 的首尾比較一致）
+# - 修補：裁切後仍超過上限、但在 CROSSFADE_MAX_RATIO 倍以內時，把尾端 crossfade 到 start 之前的影格，
+#   最後一格等於第一格；差距更大的（例如整段漂移）不修，交給 QA 淘汰
+
+SEAM_MAX_SIDE = 64
+MIN_LOOP_RATIO = 0.75
+CROSSFADE_SEC = 0.25
+CROSSFADE_MAX_RATIO = 3.0
+
+
+def lab_features(frames: np.ndarray, max_side: Optional[int] = SEAM_MAX_SIDE) -> np.ndarray:
+    """(n, H, W, 4) uint8 straight RGBA -> (n, P, 3) CIELAB（premultiplied），先以整數間隔縮到長邊 <= max_side。"""
+    if max_side:
+        f = max(1, -(-max(frames.shape[1:3]) // max_side))
+        frames = frames[:, ::f, ::f]
+    rgba = frames.astype(np.float32) / 255
+    lab = srgb_to_lab(rgba[..., :3] * rgba[..., 3:4])
+    return lab.reshape(len(frames), -1, 3)
+
+
+def loop_error(first: np.ndarray, last: np.ndarray) -> float:
+    """首尾格在 CIELAB 下的平均 ΔE76 / 100；以 premultiplied 顏色比較，透明區域的 RGB 不影響結果。"""
+    lab = lab_features(np.stack([first, last]), max_side=None)
+    return float(np.linalg.norm(lab[0] - lab[1], axis=-1).mean() / 100)
+
+
+def seam_matrix(features: np.ndarray, min_frames: int) -> np.ndarray:
+    """D[s, e] = 第 s 與第 e 格的距離（只算 e - s + 1 >= min_frames 的組合，其餘為 inf）。"""
+    t = len(features)
+    d = np.full((t, t), np.inf, np.float32)
+    idx = np.arange(t)
+    for k in range(max(1, min_frames - 1), t):
+        # 同一間距 k 的所有起點一次算完
+        d[idx[:t - k], idx[k:]] = np.linalg.norm(features[:t - k] - features[k:], axis=-1).mean(axis=1) / 100
+    return d
+
+
+def plan_loop(features: np.ndarray, fps: float, limit: float, min_ratio: float = MIN_LOOP_RATIO,
+              crossfade_sec: float = CROSSFADE_SEC, max_ratio: float = CROSSFADE_MAX_RATIO) -> Optional[dict]:
+    """選出循環區間；回傳 {"start", "end"（含）, "crossfade"（格數）, "raw_error", "error"}，無法修補時回傳 None。
+
+    距離相同時取較長、再取較早開始的區間。error 為修補後首尾距離的估計（crossfade 後首尾同格為 0）。
+    """
+    t = len(features)
+    if t < 3:
+        return None
+    d = seam_matrix(features, max(2, math.ceil(t * min_ratio)))
+    raw = float(d[0, t - 1])
+    best = float(d.min())
+    starts, ends = np.nonzero(d <= best + 1e-6)
+    i = np.lexsort((starts, starts - ends))[0]
+    start, end = int(starts[i]), int(ends[i])
+    plan = {"start": start, "end": end, "crossfade": 0, "raw_error": round(raw, 6), "error": round(best, 6)}
+    if best <= limit:
+        return plan
+    n = min(max(2, round(fps * crossfade_sec)), (end - start + 1) // 4)
+    if best > limit * max_ratio or n < 2:
+        return None
+    plan.update(crossfade=n, error=0.0)
+    return plan
+
+
+def lead_range(plan: dict) -> range:
+    """crossfade 要混入的影格（原始索引）：start 之前的 n 格（含 start）；前面不夠時只用 start 一格。"""
+    start, n = plan["start"], plan["crossfade"]
+    return range(start - n + 1, start + 1) if start >= n - 1 else range(start, start + 1)
+
+
+def crossfade(tail: np.ndarray, lead: np.ndarray) -> np.ndarray:
+    """tail：循環最後 n 格；lead：lead_range 的影格（n 格或 1 格），皆為 premultiplied。
+
+    權重由 1/n 線性升到 1，最後一格等於 lead 的最後一格（即循環第一格）。
+    """
+    w = (np.arange(1, len(tail) + 1, dtype=np.float32) / len(tail))[:, None, None, None]
+    out = tail.astype(np.float32) * (1 - w) + lead.astype(np.float32) * w
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
@@ -1,6 +1,14 @@
 from __future__ import annotations
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+def parse_resolution(resolution: str, default: Tuple[int, int] = (512, 512)) -> Tuple[int, int]:
+    """'1920x1080' -> (1920, 1080)；格式錯誤時回傳 default。"""
+    try:
+        w, h = map(int, resolution.lower().split('x'))
+    except (AttributeError, ValueError):
+        return default
+    return w, h
 
 class EffectSpec(BaseModel):
     id: str
@@ -11,6 +19,9 @@ class EffectSpec(BaseModel):
     loops: bool
     variant_count: int = 1
     qa_rules: Dict[str, float] = {}
+    packaging: Optional[str] = None  # "sheet" / "delta" / "video"；None 依 category / 解析度自動選擇（delta 需明確指定）
+    atlas_group: Optional[str] = None  # 共用 atlas 頁面的群組（同畫面一起出現的 effect）；None 時以 category 分組
+    gpu_formats: Optional[List[str]] = None  # sheet 另外輸出的 GPU 壓縮貼圖（etc2_rgba8 / astc_4x4 / astc_6x6）；None / [] 不輸出
 
 class PromptPlan(BaseModel):
     id: str
@@ -31,6 +42,9 @@ class EvalResult(BaseModel):
     variant_id: str
     pass_flag: bool
     metrics: Dict[str, float]
+    frame_luminance: List[float] = []
+    rejected_by: Optional[str] = None
+    loop_plan: Optional[Dict] = None  # loops=true 且首尾接縫需修補時的裁切 / crossfade 計畫
 
 class PackagingResult(BaseModel):
     spritesheet_path: Optional[str]
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+import asyncio
+import heapq
+import threading
+
+from . import trace
+
+# DAG stage 排程
+# 每個 stage 呼叫宣告為一個 Node（所屬 pool、函式、相依 node），scheduler 在相依完成後把 node 丟進對應的 pool：
+#   io     → AsyncioPool（單一 event loop thread，生成請求在同一個 loop 上共用 max_inflight / 限流）
+#   cpu    → ProcessPoolExecutor（evaluate / postprocess / pack）
+#   writer → 單一 thread（manifest 只由一個 writer 修改）
+#   main   → 直接在 scheduler thread 執行（極輕量的 stage，例如 plan）
+# 各 pool 的同時進行數由 limits 控制；ready 的 node 依宣告順序（heap）優先派發，
+# 先宣告的 spec 先往下游推進，不會整批卡在同一個 stage。
+# run(window=N) 時 node 以群組（每個 spec 一組）逐批取用，最多 N 組展開中，整組完成即釋放。
+
+
+@dataclass
+class Node:
+    """fn(*args, *相依結果)。when(相依結果) 為 False 時不執行，結果為 None。
+
+    when 預設：任一相依結果為 None 即略過（上游沒有產出，下游也不必跑）。
+    """
+    key: Hashable
+    pool: str
+    fn: Callable
+    args: Tuple = ()
+    deps: Tuple[Hashable, ...] = ()
+    when: Optional[Callable[[List], bool]] = None
+    order: int = field(default=0, compare=False)
+
+
+def _default_when(results: List) -> bool:
+    return all(r is not None for r in results)
+
+
+def _remote_call(fn: Callable, args: Tuple):
+    """process pool 內執行：結果連同 trace 事件與耗時彙總一起送回主行程。"""
+    return fn(*args), trace.snapshot()
+
+
+class AsyncioPool(Executor):
+    """在背景 thread 的 event loop 上執行 coroutine function 的 Executor。"""
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="io-pool", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), self._loop)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if wait:
+            self._thread.join()
+        self._loop.close()
+
+
+class DagScheduler:
+    """pools：pool 名稱 -> Executor；limits：pool 名稱 -> 同時派發中的 node 上限（未列出的 pool 不限）。"""
+
+    def __init__(self, pools: Dict[str, Executor], limits: Optional[Dict[str, int]] = None):
+        self.pools = pools
+        self.limits = {k: max(1, v) for k, v in (limits or {}).items()}
+
+    def _submit(self, node: Node, inputs: List) -> Future:
+        pool = self.pools[node.pool]
+        args = tuple(node.args) + tuple(inputs)
+        if isinstance(pool, ProcessPoolExecutor):
+            return pool.submit(_remote_call, node.fn, args)
+        return pool.submit(node.fn, *args)
+
+    def run(self, nodes: Iterable, on_done: Optional[Callable[[Node, object], None]] = None,
+            window: Optional[int] = None) -> Dict:
+        """執行所有 node，回傳 key -> 結果。任一 node 丟出例外即取消尚未開始的 node 並向外拋出。
+
+        window 設定時 nodes 為 node 群組（list，例如每個 spec 一組；相依只能在同一組內）的 iterable：
+        最多同時展開 window 組，整組完成後釋放其結果（不在回傳值中，由 on_done 取用），
+        node 與結果都不必整份放進記憶體。
+        """
+        groups = iter([list(nodes)]) if window is None else iter(nodes)
+        by_key: Dict[Hashable, Node] = {}
+        waiting: Dict[Hashable, int] = {}
+        children: Dict[Hashable, List[Hashable]] = {}
+        results: Dict[Hashable, object] = {}
+        group_of: Dict[Hashable, int] = {}
+        members: Dict[int, List[Hashable]] = {}
+        remaining: Dict[int, int] = {}  # 展開中的群組 -> 未完成的 node 數
+        ready: List[tuple] = []
+        running: Dict[Future, Node] = {}
+        active = {name: 0 for name in self.pools}
+        active['main'] = 0
+        next_order, next_group, exhausted = 0, 0, False
+
+        def refill():
+            nonlocal next_order, next_group, exhausted
+            while not exhausted and len(remaining) < (window or 1):
+                group = next(groups, None)
+                if group is None:
+                    exhausted = True
+                    break
+                if not group:
+                    continue
+                gid, next_group = next_group, next_group + 1
+                for n in group:
+                    n.order, next_order = next_order, next_order + 1
+                    by_key[n.key], waiting[n.key], children[n.key], group_of[n.key] = n, len(n.deps), [], gid
+                for n in group:
+                    for d in n.deps:
+                        children[d].append(n.key)
+                    if not n.deps:
+                        heapq.heappush(ready, (n.order, n.key))
+                members[gid] = [n.key for n in group]
+                remaining[gid] = len(group)
+
+        def finish(node: Node, value):
+            results[node.key] = value
+            if on_done:
+                on_done(node, value)
+            for c in children[node.key]:
+                waiting[c] -= 1
+                if waiting[c] == 0:
+                    heapq.heappush(ready, (by_key[c].order, c))
+            gid = group_of[node.key]
+            remaining[gid] -= 1
+            if remaining[gid] == 0:
+                del remaining[gid]
+                if window is not None:
+                    for k in members.pop(gid):
+                        for table in (by_key, waiting, children, results, group_of):
+                            table.pop(k, None)
+                refill()
+
+        refill()
+        while ready or running:
+            deferred = []
+            while ready:
+                order, key = heapq.heappop(ready)
+                node = by_key[key]
+                inputs = [results[d] for d in node.deps]
+                if not (node.when or _default_when)(inputs):
+                    finish(node, None)
+                    continue
+                if node.pool == 'main':
+                    finish(node, node.fn(*node.args, *inputs))
+                    continue
+                limit = self.limits.get(node.pool)
+                if limit is not None and active[node.pool] >= limit:
+                    deferred.append((order, key))
+                    continue
+                active[node.pool] += 1
+                running[self._submit(node, inputs)] = node
+            for item in deferred:
+                heapq.heappush(ready, item)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                node = running.pop(fut)
+                active[node.pool] -= 1
+                try:
+                    value = fut.result()
+                except BaseException:
+                    for f in running:
+                        f.cancel()
+                    raise
+                if isinstance(self.pools[node.pool], ProcessPoolExecutor):
+                    value, state = value
+                    trace.merge(*state)
+                finish(node, value)
+        return results
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List
+import json
+import math
+import os
+import resource
+import threading
+import time
+
+# stage 層級的 span 量測：wall time、CPU time（span 所在 thread 的 thread_time，委派給其他 thread 的工作不計入）、
+# 行程層級的峰值 RSS 增量與寫出 bytes（proc_ 前綴；rusage 與 /proc/self/io 是整個行程的計數器，
+# 只在主 thread 的 span 記錄，thread pool / event loop thread 上的 span 沒有這兩個欄位）
+# 預設停用，span() 直接回傳共用的 nullcontext，不讀任何計數器（幾乎零成本）。
+# 啟用後每個行程各自累積事件，worker 以 snapshot() 取出隨結果送回主行程，再匯出成 Chrome trace JSON
+# （chrome://tracing 或 https://ui.perfetto.dev 開啟）。
+# ts 使用 perf_counter（Linux 上為 CLOCK_MONOTONIC，跨行程可比較）。
+# timings 模式（執行歷史用）只讀兩個時鐘，依 (stage, spec, group) 累加 wall / CPU 秒數，不產生事件、
+# 不讀 /proc 與 rusage；送回主行程的也只是這份小彙總。
+
+_enabled = False
+_timing = False
+_events: List[dict] = []
+_timings: Dict[tuple, list] = {}  # (name, spec, group) -> [wall_sec, cpu_sec, 全部命中快取]
+_lock = threading.Lock()  # evaluate thread pool、io-pool、writer thread 都會累加 _timings
+_NULL = nullcontext()
+_IO_PATH = Path('/proc/self/io')
+
+# 直方圖 bucket：以 2 倍遞增的秒數上界
+HIST_BOUNDS = [0.001 * 2 ** i for i in range(16)]
+SPARK = " ▁▂▃▄▅▆▇█"
+
+
+def enable(on: bool = True, timings: bool = False):
+    """設定本行程是否記錄 span 事件 (on) 與耗時彙總 (timings)；process pool 的 worker 也要呼叫。"""
+    global _enabled, _timing
+    _enabled, _timing = on, timings
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def mode() -> tuple:
+    """(on, timings)，傳給 worker 的 enable(*mode())。"""
+    return _enabled, _timing
+
+
+def _bytes_written() -> int:
+    """本行程 write 系統呼叫累計 bytes（/proc/self/io 的 wchar）；不支援的平台回傳 0。"""
+    try:
+        with open(_IO_PATH, 'rb') as f:
+            for line in f:
+                if line.startswith(b'wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _accumulate(name: str, args: dict, wall: float, cpu: float):
+    key = (name, args.get("spec"), args.get("group"))
+    with _lock:
+        t = _timings.get(key)
+        if t is None:
+            _timings[key] = [wall, cpu, bool(args.get("cached"))]
+        else:
+            t[0] += wall
+            t[1] += cpu
+            t[2] = t[2] and bool(args.get("cached"))
+
+
+@contextmanager
+def _span(name: str, args: dict):
+    wall0, cpu0 = time.perf_counter(), time.thread_time()
+    process_counters = _enabled and threading.current_thread() is threading.main_thread()
+    if process_counters:
+        rss0, io0 = _peak_rss_kb(), _bytes_written()
+    try:
+        yield args
+    finally:
+        wall1, cpu1 = time.perf_counter(), time.thread_time()
+        if _timing:
+            _accumulate(name, args, wall1 - wall0, cpu1 - cpu0)
+        if _enabled:
+            extra = {"cpu_ms": round((cpu1 - cpu0) * 1000, 3)}
+            if process_counters:
+                extra.update(proc_peak_rss_delta_kb=_peak_rss_kb() - rss0, proc_bytes_written=_bytes_written() - io0)
+            event = {"name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                     "ts": wall0 * 1e6, "dur": (wall1 - wall0) * 1e6, "args": dict(args, **extra)}
+            with _lock:
+                _events.append(event)
+
+
+def span(name: str, **args):
+    """with trace.span("evaluate", spec=..., variant=...) as a: ...；a 為 args dict，可在區塊內補欄位。
+
+    停用時回傳的 nullcontext 產出 None。
+    """
+    if not (_enabled or _timing):
+        return _NULL
+    return _span(name, args)
+
+
+def drain() -> List[dict]:
+    """取出並清空本行程累積的事件。"""
+    global _events
+    with _lock:
+        events, _events = _events, []
+    return events
+
+
+def drain_timings() -> List[tuple]:
+    """取出並清空耗時彙總：[(name, spec, group, wall_sec, cpu_sec, cached)]。"""
+    global _timings
+    with _lock:
+        timings, _timings = _timings, {}
+    return [(*key, wall, cpu, cached) for key, (wall, cpu, cached) in timings.items()]
+
+
+def snapshot() -> tuple:
+    """worker 端：(事件, 耗時彙總)，隨結果送回主行程後以 merge(*snapshot) 併入。"""
+    return drain(), drain_timings()
+
+
+def merge(events: List[dict], timings: List[tuple] = ()):
+    """把 worker 送回的事件與耗時彙總併入本行程。"""
+    with _lock:
+        _events.extend(events)
+    for name, spec, group, wall, cpu, cached in timings:
+        _accumulate(name, {"spec": spec, "group": group, "cached": cached}, wall, cpu)
+
+
+def export_chrome(events: List[dict], path) -> Path:
+    """寫出 Chrome trace JSON；ts 以最早事件為 0。"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    t0 = min((e["ts"] for e in events), default=0.0)
+    out = [dict(e, ts=round(e["ts"] - t0, 1), dur=round(e["dur"], 1)) for e in events]
+    path.write_text(json.dumps({"traceEvents": out, "displayTimeUnit": "ms"}))
+    return path
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    k = (len(sorted_vals) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def histogram(durations: List[float]) -> str:
+    """以 HIST_BOUNDS（1ms 起 2 倍遞增）分桶的 sparkline，從最小到最大非空 bucket。"""
+    counts = [0] * (len(HIST_BOUNDS) + 1)
+    for d in durations:
+        counts[next((i for i, b in enumerate(HIST_BOUNDS) if d <= b), len(HIST_BOUNDS))] += 1
+    used = [i for i, c in enumerate(counts) if c]
+    if not used:
+        return ""
+    counts = counts[used[0]:used[-1] + 1]
+    top = max(counts)
+    return "".join(SPARK[math.ceil(c / top * (len(SPARK) - 1))] for c in counts)
+
+
+def stage_summary(events: List[dict]) -> Dict[str, dict]:
+    """依 span 名稱彙整：次數、wall 總和 / p50 / p95 / max、CPU、行程峰值 RSS 增量、行程寫出 bytes、直方圖。
+
+    行程層級的兩個欄位只來自主 thread 的 span，該 stage 全在其他 thread 執行時為 None。
+    """
+    by_name: Dict[str, List[dict]] = {}
+    for e in events:
+        by_name.setdefault(e["name"], []).append(e)
+    summary = {}
+    for name, evs in by_name.items():
+        durs = sorted(e["dur"] / 1e6 for e in evs)
+        proc = [e["args"] for e in evs if "proc_bytes_written" in e["args"]]
+        summary[name] = {
+            "count": len(evs),
+            "wall_sec": round(sum(durs), 4),
+            "p50_sec": round(_percentile(durs, 0.5), 4),
+            "p95_sec": round(_percentile(durs, 0.95), 4),
+            "max_sec": round(durs[-1], 4),
+            "cpu_sec": round(sum(e["args"]["cpu_ms"] for e in evs) / 1000, 4),
+            "proc_peak_rss_delta_kb": max((a["proc_peak_rss_delta_kb"] for a in proc), default=None),
+            "proc_bytes_written": sum(a["proc_bytes_written"] for a in proc) if proc else None,
+            "histogram": histogram(durs),
+        }
+    return summary
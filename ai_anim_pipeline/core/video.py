@@ -0,0 +1,107 @@
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+from PIL import Image
+from loguru import logger
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+
+# 帶 alpha 的循環影片輸出
+# - 有 ffmpeg (libvpx-vp9) 時：WebM / VP9 yuva420p，可選 two-pass，依大小預算搜尋 bitrate
+# - 沒有時（測試 / 開發機）：以 Pillow (libwebp) 輸出 animated WebP，依大小預算搜尋 quality
+# 影格由 frames_factory() 每次重新產生 generator，two-pass 與多次嘗試都以串流方式餵給編碼器。
+
+CONTAINER_OVERHEAD = 0.97   # 預算保留給容器 / header 的比例
+MAX_ATTEMPTS = 5
+MAX_KBPS = 8000
+
+
+@lru_cache(maxsize=None)
+def has_vp9_encoder() -> bool:
+    if not shutil.which('ffmpeg'):
+        return False
+    out = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True).stdout
+    return 'libvpx-vp9' in out
+
+
+def _ffmpeg_vp9(frames_factory: Callable[[], Iterator[np.ndarray]], size, fps: float, out_path: Path,
+                kbps: int, two_pass: bool) -> int:
+    w, h = size
+    base = ['ffmpeg', '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{w}x{h}',
+            '-r', str(fps), '-i', '-', '-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p',
+            '-b:v', f'{kbps}k', '-auto-alt-ref', '0', '-an']
+
+    def run(extra):
+        proc = subprocess.Popen(base + extra, stdin=subprocess.PIPE)
+        try:
+            for frame in frames_factory():
+                proc.stdin.write(np.ascontiguousarray(frame).tobytes())
+        finally:
+            proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg vp9 encode failed for {out_path.name}")
+
+    if two_pass:
+        with tempfile.TemporaryDirectory() as tmp:
+            log = str(Path(tmp) / 'vp9pass')
+            run(['-pass', '1', '-passlogfile', log, '-f', 'webm', '/dev/null'])
+            run(['-pass', '2', '-passlogfile', log, str(out_path)])
+    else:
+        run([str(out_path)])
+    return out_path.stat().st_size
+
+
+def _pillow_webp(frames_factory: Callable[[], Iterator[np.ndarray]], fps: float, out_path: Path,
+                 quality: int) -> int:
+    images = [Image.fromarray(np.ascontiguousarray(f), 'RGBA') for f in frames_factory()]
+    images[0].save(out_path, format='WEBP', save_all=True, append_images=images[1:],
+                   duration=round(1000 / fps), loop=0, quality=quality, alpha_quality=quality, method=4)
+    return out_path.stat().st_size
+
+
+def encode_loop(frames_factory: Callable[[], Iterator[np.ndarray]], size, fps: float, frame_count: int,
+                out_stem: Path, budget_bytes: Optional[int] = None, two_pass: bool = True) -> Dict:
+    """編碼帶 alpha 的循環影片，回傳編碼資訊（含輸出路徑 path）。"""
+    duration = max(frame_count / fps, 1e-3)
+    target = int(budget_bytes * CONTAINER_OVERHEAD) if budget_bytes else None
+    attempts = []
+    if has_vp9_encoder():
+        out_path = out_stem.with_suffix('.webm')
+        kbps = min(MAX_KBPS, max(50, int(target * 8 / duration / 1000))) if target else 2000
+        for _ in range(MAX_ATTEMPTS):
+            size_bytes = _ffmpeg_vp9(frames_factory, size, fps, out_path, kbps, two_pass)
+            attempts.append({"bitrate_kbps": kbps, "bytes": size_bytes})
+            if target is None or size_bytes <= target:
+                break
+            # 依超出比例降低 bitrate，留 5% 餘裕
+            kbps = max(20, int(kbps * target / size_bytes * 0.95))
+        info = {"format": "webm", "codec": "vp9", "pix_fmt": "yuva420p", "passes": 2 if two_pass else 1,
+                "bitrate_kbps": attempts[-1]["bitrate_kbps"]}
+    else:
+        out_path = out_stem.with_suffix('.webp')
+        logger.debug("[video] ffmpeg/libvpx-vp9 not available, falling back to animated WebP")
+        # quality 二分搜尋：放得進預算的最高 quality
+        lo, hi, best = 5, 95, None
+        quality = hi
+        while True:
+            size_bytes = _pillow_webp(frames_factory, fps, out_path, quality)
+            attempts.append({"quality": quality, "bytes": size_bytes})
+            fits = target is None or size_bytes <= target
+            if fits:
+                best = quality
+                lo = quality + 1
+            else:
+                hi = quality - 1
+            if target is None or lo > hi or len(attempts) >= MAX_ATTEMPTS + 2:
+                break
+            quality = (lo + hi) // 2
+        if best is not None and best != attempts[-1]["quality"]:
+            size_bytes = _pillow_webp(frames_factory, fps, out_path, best)
+        info = {"format": "webp", "codec": "webp", "passes": 1, "quality": best if best is not None else quality}
+    size_bytes = out_path.stat().st_size
+    info.update(path=str(out_path), bytes=size_bytes, attempts=attempts, budget_bytes=budget_bytes,
+                within_budget=budget_bytes is None or size_bytes <= budget_bytes)
+    return info
@@ -0,0 +1,192 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from . import OUTPUT_DIR
+
+QUEUE_DIR = OUTPUT_DIR / 'queue'
+ENQUEUE_BATCH = 1000
+
+# 多機分派用的持久化工作佇列（SQLite，放在各機器都能存取的共享目錄即可，不需外部服務）
+# - coordinator 以 enqueue() 放入 spec id（依 catalog 順序）
+# - worker 以 lease() 取得一批並設定租約到期時間，處理中定期 renew()，完成後 ack()
+# - 租約過期（worker 當機 / 卡住）的工作會被其他 worker 重新租走；失敗或過期累計 max_attempts 次標記為 failed
+#   （lease() 在同一交易中處理，每次都讓 worker 當掉的 spec 不會無限重租）
+# - meta：coordinator 在 enqueue 同一交易寫入的設定（seeded、共享輸出目錄的 token）；worker 等 seeded 後才開始
+# 所有狀態轉換都在 BEGIN IMMEDIATE 交易中完成，多個行程 / 主機同時 lease 不會拿到同一筆。
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    spec_id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    spec_hash TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, path: Path = QUEUE_DIR / 'queue.db', max_attempts: int = 3):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        # isolation_level=None：自行以 BEGIN IMMEDIATE 控制交易
+        self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _tx(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def enqueue(self, entries: Iterable[tuple], reset: bool = False, meta: Optional[Dict[str, str]] = None) -> int:
+        """entries：[(spec_id, spec_hash)]，依 catalog 順序（可為 generator，每 ENQUEUE_BATCH 筆寫入一次）。
+
+        reset=False 時保留已完成且 spec 未變的工作（可續跑，failed 的重新排入）；spec 改過或 reset=True 的重新排入。
+        meta 與 seeded 標記在同一交易寫入。回傳 entries 筆數。
+        """
+        now = time.time()
+        count = 0
+        entries = iter(entries)
+        with self._tx() as c:
+            if reset:
+                c.execute("DELETE FROM tasks")
+            # 既有工作先標為不在 catalog 中（position = -1），本次出現的設回位置，最後刪掉仍為 -1 的
+            c.execute("UPDATE tasks SET position = -1")
+            while batch := list(islice(entries, ENQUEUE_BATCH)):
+                existing = dict(c.execute("SELECT spec_id, spec_hash FROM tasks WHERE spec_id IN "
+                                          "(SELECT value FROM json_each(?))", (json.dumps([sid for sid, _ in batch]),)))
+                c.executemany(
+                    "INSERT OR REPLACE INTO tasks (spec_id, position, spec_hash, state, attempts, updated) "
+                    "VALUES (?, ?, ?, 'pending', 0, ?)",
+                    [(sid, count + i, h, now) for i, (sid, h) in enumerate(batch) if existing.get(sid) != h])
+                c.executemany("UPDATE tasks SET position = ? WHERE spec_id = ?",
+                              [(count + i, sid) for i, (sid, h) in enumerate(batch) if existing.get(sid) == h])
+                count += len(batch)
+            c.execute("DELETE FROM tasks WHERE position = -1")
+            c.execute("UPDATE tasks SET state = 'pending', attempts = 0, error = NULL WHERE state = 'failed'")
+            c.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                          [*(meta or {}).items(), ("seeded", str(now))])
+        return count
+
+    def meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def seeded(self) -> bool:
+        """coordinator 已 enqueue（worker 比 coordinator 先啟動時據此等待，而不是看到空佇列就結束）。"""
+        return self.meta("seeded") is not None
+
+    def lease(self, worker: str, count: int = 1, lease_sec: float = 300.0) -> List[tuple]:
+        """租下最多 count 筆待處理（或租約已過期）的工作，回傳 [(spec_id, spec_hash)]。
+
+        租約過期且已租過 max_attempts 次的工作先標記為 failed，不再租出。
+        """
+        now = time.time()
+        with self._tx() as c:
+            c.execute("UPDATE tasks SET state = 'failed', worker = NULL, lease_expires = NULL, error = ?, updated = ? "
+                      "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                      (f"lease expired after {self.max_attempts} attempt(s) (worker crashed or hung)", now, now,
+                       self.max_attempts))
+            rows = c.execute(
+                "SELECT spec_id, spec_hash FROM tasks "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                "ORDER BY position LIMIT ?", (now, count)).fetchall()
+            c.executemany(
+                "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE spec_id = ?",
+                [(worker, now + lease_sec, now, sid) for sid, _ in rows])
+        return rows
+
+    def renew(self, worker: str, spec_ids: List[str], lease_sec: float = 300.0):
+        now = time.time()
+        with self._tx() as c:
+            c.executemany("UPDATE tasks SET lease_expires = ?, updated = ? "
+                          "WHERE spec_id = ? AND worker = ? AND state = 'leased'",
+                          [(now + lease_sec, now, sid, worker) for sid in spec_ids])
+
+    def ack(self, worker: str, spec_ids: List[str]):
+        """標記完成；租約已被別人接手的不影響（以先完成者為準）。"""
+        now = time.time()
+        with self._tx() as c:
+            c.executemany("UPDATE tasks SET state = 'done', lease_expires = NULL, error = NULL, updated = ? "
+                          "WHERE spec_id = ? AND state = 'leased'",
+                          [(now, sid) for sid in spec_ids])
+
+    def fail(self, worker: str, spec_ids: List[str], error: str):
+        """處理失敗：未超過 max_attempts 的放回 pending，否則標記 failed。"""
+        now = time.time()
+        with self._tx() as c:
+            c.executemany(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, error = ?, updated = ? "
+                "WHERE spec_id = ? AND worker = ? AND state = 'leased'",
+                [(self.max_attempts, error[:2000], now, sid, worker) for sid in spec_ids])
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+
+    def failed(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT spec_id, error FROM tasks WHERE state = 'failed'"))
+
+    def drained(self) -> bool:
+        """沒有 pending / leased 的工作。"""
+        c = self.counts()
+        return not c.get('pending') and not c.get('leased')
+
+    def close(self):
+        self._conn.close()
+
+
+class LeaseKeeper:
+    """背景 thread 定期為目前持有的工作續租（使用自己的 SQLite 連線）。"""
+
+    def __init__(self, path: Path, worker: str, lease_sec: float):
+        self.path, self.worker, self.lease_sec = path, worker, lease_sec
+        self.held: List[str] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def _run(self):
+        queue = WorkQueue(self.path)
+        try:
+            while not self._stop.wait(self.lease_sec / 3):
+                if self.held:
+                    queue.renew(self.worker, list(self.held), self.lease_sec)
+        finally:
+            queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
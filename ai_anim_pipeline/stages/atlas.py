@@ -0,0 +1,187 @@
+from loguru import logger
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+import hashlib
+import re
+import numpy as np
+
+from ..core import texcomp
+from ..core.cache import file_digest
+from ..core.encoding import encode_pages
+from .pack import ASSETS_DIR, MAX_PAGE_SIZE, pack_rects, raw_page_path
+
+MAX_GROUP_EFFECTS = 32   # 單一 atlas 群組的 effect 上限，超過時依 manifest 順序拆成多個群組
+MAX_GROUP_RECTS = 512    # 單一 atlas 群組的不重複 rect 上限（MaxRects 的成本隨 rect 數超線性成長）
+
+# 跨 effect 的 atlas 打包（全部 spec 完成後的全域 pass）
+# - 依 manifest item 的 atlas_group（spec.atlas_group，未設定時為 category）分組；只有一個 effect 的群組不處理，
+#   超過 MAX_GROUP_EFFECTS 個 effect 或 MAX_GROUP_RECTS 個 rect 的群組依 manifest 順序拆成 {group}#k
+# - 各 effect sheet 中不重複的 rect 一起以 MaxRects 重新裝進共用頁面 atlas_{group}_{hash}[_k].png（受 MAX_PAGE_SIZE 限制），
+#   區塊取自 pack 保留的量化前頁面（raw_page_path），PNG 編碼與 GPU 壓縮都只對原始像素做一次
+# - 頁面以群組內各 effect sheet 預算（pack.sheet_budget_kb，記錄在 encoding.budget_bytes）的總和為預算編碼
+# - item 的 sheets / page_sizes / frame_rects 改指向共用頁面（page 仍是 item.sheets 的索引），
+#   client 依頁面名稱合併載入與 draw call；各 effect 原本的 sheet 保留為單獨使用時的備援
+# - GPU 壓縮貼圖只輸出群組內所有 effect 都要求的格式
+
+
+def group_of(item: dict) -> Optional[str]:
+    """可參與 atlas 的 sheet item 的群組；影片 / 舊紀錄回傳 None。"""
+    if not item.get("sheets") or not item.get("frame_rects"):
+        return None
+    return item.get("atlas_group")
+
+
+def regions(frame: dict) -> List[dict]:
+    """一格在 sheet 中用到的區塊（delta 模式的一格可有多個 rect）。"""
+    if frame.get("empty"):
+        return []
+    return frame["rects"] if "rects" in frame else [frame]
+
+
+def _remap(frame: dict, new_region) -> dict:
+    if "rects" in frame:
+        return dict(frame, rects=[new_region(r) for r in frame["rects"]])
+    return frame if frame.get("empty") else new_region(frame)
+
+
+def _page_names(group: str, count: int) -> List[str]:
+    # 清理後的名稱可能撞名（"a/b" 與 "a_b"），加上原始群組名稱的雜湊
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', group)
+    stem = f"atlas_{safe}_{hashlib.sha1(group.encode('utf-8')).hexdigest()[:8]}"
+    return [f"{stem}.png" if k == 0 else f"{stem}_{k}.png" for k in range(count)]
+
+
+def _source_page(name: str) -> Path:
+    """sheet 頁面量化前的版本；舊紀錄沒有時退回已編碼的 sheet。"""
+    raw = raw_page_path(name)
+    if raw.exists():
+        return raw
+    logger.warning(f"[atlas] no unquantized page for {name}, using the encoded sheet")
+    return ASSETS_DIR / name
+
+
+def _budget(members: List[dict]) -> Optional[int]:
+    budgets = [m.get("encoding", {}).get("budget_bytes") for m in members]
+    return sum(budgets) if budgets and all(budgets) else None
+
+
+def _gpu_formats(members: List[dict]) -> List[str]:
+    common = set.intersection(*(set(m.get("gpu_textures") or ()) for m in members))
+    return [f for f in texcomp.FORMATS if f in common]
+
+
+def pack_group(group: str, members: List[dict]) -> dict:
+    """把一組 effect 的不重複 rect 裝進共用頁面。
+
+    回傳 {"pages", "page_sizes", "encoding", "gpu_textures", "frame_rects": {id: [...]}}。
+    """
+    # 各 effect 的不重複區塊：(member, 原頁面, x, y, w, h)
+    blocks: List[Tuple[int, int, int, int, int, int]] = []
+    index: Dict[Tuple[int, int, int, int, int, int], int] = {}
+    for m, item in enumerate(members):
+        for f in item["frame_rects"]:
+            for r in regions(f):
+                key = (m, r["page"], *r["rect"])
+                if key not in index:
+                    index[key] = len(blocks)
+                    blocks.append(key)
+    placements, page_sizes = pack_rects([(b[4], b[5]) for b in blocks], max_size=MAX_PAGE_SIZE)
+
+    by_sheet: Dict[Tuple[int, int], List[int]] = {}
+    for b, (m, p, *_) in enumerate(blocks):
+        by_sheet.setdefault((m, p), []).append(b)
+    pages = [np.zeros((h, w, 4), np.uint8) for w, h in page_sizes]
+    for (m, p), bs in by_sheet.items():
+        with Image.open(_source_page(members[m]["sheets"][p])) as im:
+            sheet = np.asarray(im.convert('RGBA'))
+        for b in bs:
+            _, _, x, y, w, h = blocks[b]
+            page, ax, ay = placements[b]
+            pages[page][ay:ay + h, ax:ax + w] = sheet[y:y + h, x:x + w]
+
+    datas, encoding = encode_pages(pages, _budget(members))
+    names = _page_names(group, len(datas))
+    for name, data in zip(names, datas):
+        (ASSETS_DIR / name).write_bytes(data)
+    gpu = texcomp.compress_pages(pages, names, ASSETS_DIR, _gpu_formats(members))
+    del pages
+
+    frame_rects = {}
+    for m, item in enumerate(members):
+        def moved(r, m=m):
+            page, ax, ay = placements[index[(m, r["page"], *r["rect"])]]
+            return dict(r, page=page, rect=[ax, ay, r["rect"][2], r["rect"][3]])
+        frame_rects[item["id"]] = [_remap(f, moved) for f in item["frame_rects"]]
+    logger.info(f"[atlas] {group}: {len(members)} effects, {len(blocks)} rects -> {len(names)} page(s) "
+                f"{page_sizes}, {encoding['bytes'] / 1024:.1f}KB")
+    return {"pages": names, "page_sizes": [list(s) for s in page_sizes], "encoding": encoding,
+            "gpu_textures": gpu, "frame_rects": frame_rects}
+
+
+def apply(item: dict, group: str, packed: dict) -> dict:
+    """item 改指向共用頁面；sheets 只列本 effect 用到的頁面，frame page 為其索引。"""
+    rects = packed["frame_rects"][item["id"]]
+    used = sorted({r["page"] for f in rects for r in regions(f)})
+    local = {p: k for k, p in enumerate(used)}
+    sheets = [packed["pages"][p] for p in used]
+    return dict(item,
+                sheet=sheets[0] if sheets else None,
+                sheets=sheets,
+                page_sizes=[packed["page_sizes"][p] for p in used],
+                frame_rects=[_remap(f, lambda r: dict(r, page=local[r["page"]])) for f in rects],
+                atlas={"group": group, "pages": used, "standalone_sheets": item["sheets"],
+                       "standalone_gpu_textures": item.get("gpu_textures")},
+                encoding=packed["encoding"],
+                gpu_textures={fmt: dict(v, files=[v["files"][p] for p in used])
+                              for fmt, v in packed.get("gpu_textures", {}).items()})
+
+
+def _rect_count(item: dict) -> int:
+    return len({(r["page"], *r["rect"]) for f in item["frame_rects"] for r in regions(f)})
+
+
+def _split(idxs: List[int], items: List[dict]) -> List[List[int]]:
+    """依 manifest 順序切成不超過 MAX_GROUP_EFFECTS 個 effect、MAX_GROUP_RECTS 個 rect 的段（單一 effect 超過時自成一段）。"""
+    chunks, current, rects = [], [], 0
+    for i in idxs:
+        n = _rect_count(items[i])
+        if current and (len(current) >= MAX_GROUP_EFFECTS or rects + n > MAX_GROUP_RECTS):
+            chunks.append(current)
+            current, rects = [], 0
+        current.append(i)
+        rects += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def groups(items: List[dict]) -> Dict[str, List[int]]:
+    """群組 -> item 索引（依 manifest 順序），只留兩個 effect 以上的群組；過大的群組拆成 {group}#k。"""
+    out: Dict[str, List[int]] = {}
+    for i, item in enumerate(items):
+        group = group_of(item)
+        if group is not None:
+            out.setdefault(group, []).append(i)
+    split: Dict[str, List[int]] = {}
+    for g, idxs in out.items():
+        chunks = _split(idxs, items)
+        for k, chunk in enumerate(chunks):
+            split[g if len(chunks) == 1 else f"{g}#{k}"] = chunk
+    return {g: idxs for g, idxs in split.items() if len(idxs) > 1}
+
+
+def sheet_digests(members: List[dict]) -> List[str]:
+    """atlas 的輸入：各 member 量化前的頁面。用 pack 寫頁面時記錄的 sha256，舊紀錄沒有時才讀檔雜湊。"""
+    return [(m.get("raw_pages") or {}).get(n) or file_digest(_source_page(n)) for m in members for n in m["sheets"]]
+
+
+def artifacts(packed: dict) -> List[str]:
+    files = packed["pages"] + [f for v in packed.get("gpu_textures", {}).values() for f in v["files"]]
+    return [str(ASSETS_DIR / n) for n in files]
+
+
+def summary(group: str, members: List[dict], packed: dict) -> dict:
+    return {"group": group, "pages": packed["pages"], "page_sizes": packed["page_sizes"],
+            "effects": [m["id"] for m in members], "bytes": packed["encoding"]["bytes"],
+            "gpu_bytes": {fmt: v["bytes"] for fmt, v in packed.get("gpu_textures", {}).items()}}
@@ -1,24 +1,330 @@
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
 from loguru import logger
-from random import random
-from ..core import GenerationResult, EvalResult, EffectSpec
-
-# 偽評估：提供基礎結構，未做真實影片解析
-
-def run_all(gen: GenerationResult, qa_rules: dict) -> EvalResult:
-    brightness = 0.5 + (random() * 0.4)  # 0.5 ~ 0.9
-    size_kb = 100 + (random() * 200)     # 100-300
-    loop_error = 0.0
-    metrics = {
-        "brightnessAvg": brightness,
-        "sizeKB": size_kb,
-        "loopError": loop_error
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from ..core import GenerationResult, EvalResult
+from ..core import framecache, loopseam
+from ..core.loopseam import loop_error
+import numpy as np
+import os
+import threading
+import time
+
+# 影片 QA：以 FrameSource 串流解碼，每個 chunk (n, H, W, 4) 以向量化運算累積指標，
+# 記憶體只與 chunk 大小有關，與片長無關。指標不需全解析度，解碼時先縮到長邊 METRIC_MAX_SIDE。
+
+METRIC_MAX_SIDE = 512
+# 有可串流判定的規則時改用較小的 chunk，讓提前淘汰更早發生
+EARLY_EXIT_CHUNK_BYTES = 8 * 1024 * 1024
+
+# qa_rules 名稱 -> 對應的 metric（皆為「超過上限即不通過」）
+RULE_METRICS = {
+    "max_size_kb": "sizeKB",
+    "max_brightness": "brightnessAvg",
+    "max_loop_error": "loopError",
+    "max_center_drift_ratio": "centerDriftRatio",
+}
+
+# 規則成本：0 = 檔案 stat 即可判定；1 = 串流中每個 chunk 後可判定（可提前淘汰）；2 = 需整段解碼完
+# 規則依成本由低到高執行，任一規則確定不通過即停止，不再解碼剩下的影格。
+RULE_COST = {
+    "max_size_kb": 0,
+    "max_center_drift_ratio": 1,
+    "max_brightness": 1,
+    "max_loop_error": 2,
+}
+
+# 變體評分：各指標相對於 qa_rules 上限的餘裕 (1 - 值 / 上限，截在 0~1) 的加權平均，越高越好
+SCORE_WEIGHTS = {
+    "loopError": 0.4,
+    "centerDriftRatio": 0.3,
+    "sizeKB": 0.2,
+    "brightnessAvg": 0.1,
+}
+EVAL_WORKERS = os.cpu_count() or 1
+_executor = None
+
+LUMA = np.array([0.2126, 0.7152, 0.0722], np.float32)  # Rec.709
+# frame_luminance 每次轉 float32 的像素數上限：暫存最多 LUMA_SLICE_PIXELS * 16 bytes（預設 4 MB），
+# 不隨 --frame-memory-mb 的 chunk 大小放大（整個 chunk 轉 float32 會多出 4 倍 chunk 的記憶體）
+LUMA_SLICE_PIXELS = 512 * 512
+
+
+def frame_luminance(frames: np.ndarray) -> np.ndarray:
+    """每格以 alpha 加權的平均 luma (0~1)；完全透明的影格為 0。"""
+    x = frames.reshape(len(frames), -1, 4)
+    step = max(1, LUMA_SLICE_PIXELS // max(1, x.shape[1]))
+    weighted = np.empty((len(x), 3), np.float32)
+    mass = np.empty(len(x), np.float32)
+    buf = np.empty((min(step, len(x)),) + x.shape[1:], np.float32)  # 各 slice 共用同一塊暫存
+    for i in range(0, len(x), step):
+        part = buf[:len(x[i:i + step])]
+        np.copyto(part, x[i:i + step])
+        # 每格一次 batched matmul：alpha · [R, G, B, A] 得 Σ(αR), Σ(αG), Σ(αB)
+        weighted[i:i + step] = np.matmul(part[:, None, :, 3], part)[:, 0, :3] / 255
+        mass[i:i + step] = part[..., 3].sum(axis=1)
+    return np.divide(weighted @ LUMA, mass, out=np.zeros_like(mass), where=mass > 0)
+
+
+def alpha_centroids(frames: np.ndarray) -> np.ndarray:
+    """每格 alpha 質心 (cx / W, cy / H)；無 alpha 的影格為 NaN。"""
+    _, h, w, _ = frames.shape
+    # 直接在 uint8 view 上以 float32 累加，不複製整個 alpha 平面
+    alpha = frames[..., 3]
+    rows = alpha.sum(axis=2, dtype=np.float32)
+    mass = rows.sum(axis=1)
+    cy = (rows @ np.arange(h, dtype=np.float32)) / h
+    cx = (alpha.sum(axis=1, dtype=np.float32) @ np.arange(w, dtype=np.float32)) / w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.stack([cx / mass, cy / mass], axis=1)
+
+
+class MetricAccumulator:
+    """逐 chunk 累積指標；fails() 在串流途中判定規則是否已確定不通過。
+
+    expected_frames：預期總格數，用於亮度平均的下界估計（未知時亮度只能在結束後判定）。
+    seam：同時保留每格的縮圖特徵，供循環接縫偵測使用（loopseam.plan_loop）。
+    """
+
+    def __init__(self, expected_frames: Optional[int] = None, seam: bool = False):
+        self.expected_frames = expected_frames
+        self.seam_features: Optional[List[np.ndarray]] = [] if seam else None
+        self.lumas: List[np.ndarray] = []
+        self.luma_sum = 0.0
+        self.frames = 0
+        self.ref_centroid = None
+        self.max_drift = 0.0
+        self.first = self.last = None
+
+    def update(self, chunk: np.ndarray):
+        luma = frame_luminance(chunk)
+        self.lumas.append(luma)
+        self.luma_sum += float(luma.sum())
+        self.frames += len(chunk)
+        centroids = alpha_centroids(chunk)
+        valid = centroids[~np.isnan(centroids).any(axis=1)]
+        if len(valid):
+            if self.ref_centroid is None:
+                self.ref_centroid = valid[0]
+            self.max_drift = max(self.max_drift, float(np.hypot(*(valid - self.ref_centroid).T).max()))
+        # chunk 緩衝區會被重用，首尾格要複製保留
+        if self.first is None:
+            self.first = chunk[0].copy()
+        self.last = chunk[-1].copy()
+        if self.seam_features is not None:
+            self.seam_features.append(loopseam.lab_features(chunk))
+
+    def fails(self, rule: str, limit: float) -> bool:
+        if rule == "max_center_drift_ratio":
+            return self.max_drift > limit
+        if rule == "max_brightness" and self.expected_frames:
+            # 其餘影格亮度 >= 0，目前總和 / 總格數 是平均亮度的下界
+            return self.luma_sum / self.expected_frames > limit
+        return False
+
+    def finalize(self) -> Tuple[Dict[str, float], List[float]]:
+        if self.first is None:
+            raise ValueError("no frames")
+        luma = np.concatenate(self.lumas)
+        metrics = {
+            "brightnessAvg": float(luma.mean()),
+            "brightnessMax": float(luma.max()),
+            "loopError": loop_error(self.first, self.last),
+            "centerDriftRatio": self.max_drift,
+            "frameCount": float(len(luma)),
+        }
+        return metrics, luma.round(4).tolist()
+
+
+def compute_metrics(chunks: Iterable[np.ndarray]) -> Tuple[Dict[str, float], List[float]]:
+    """chunks：依序的 (n, H, W, 4) 影格區塊（單一整段陣列也可包成 [frames] 傳入）。"""
+    acc = MetricAccumulator()
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc.finalize()
+
+
+def plan_rules(qa_rules: dict) -> List[Tuple[str, float]]:
+    """有效規則依成本排序（便宜的先跑）；未設定或無對應 metric 的規則略過。"""
+    active = [(r, l) for r, l in qa_rules.items() if l is not None and r in RULE_METRICS]
+    return sorted(active, key=lambda rl: RULE_COST[rl[0]])
+
+
+def check_rules(metrics: Dict[str, float], qa_rules: dict) -> List[str]:
+    """回傳不通過的規則名稱（依成本順序）。"""
+    return [rule for rule, limit in plan_rules(qa_rules)
+            if RULE_METRICS[rule] in metrics and metrics[RULE_METRICS[rule]] > limit]
+
+
+# 本行程解碼 + 指標計算的平均成本（秒 / 百萬像素格），用來估算提前淘汰省下的時間
+_decode_sec_per_mpx = None
+
+
+def _record_decode_rate(elapsed: float, frames: int, size) -> None:
+    global _decode_sec_per_mpx
+    mpx = frames * size[0] * size[1] / 1e6
+    if mpx <= 0:
+        return
+    rate = elapsed / mpx
+    _decode_sec_per_mpx = rate if _decode_sec_per_mpx is None else 0.8 * _decode_sec_per_mpx + 0.2 * rate
+
+
+def _reject(gen: GenerationResult, rule: str, metrics: Dict[str, float], saved_sec: float,
+            luma: List[float] = ()) -> EvalResult:
+    metrics["decodeSavedSec"] = round(saved_sec, 4)
+    logger.info(f"[evaluate] {gen.variant_id} -> rejected by {rule} "
+                f"(decode saved ~{saved_sec:.3f}s) metrics={metrics}")
+    return EvalResult(variant_id=gen.variant_id, pass_flag=False, metrics=metrics,
+                      frame_luminance=list(luma), rejected_by=rule)
+
+
+class EvaluationCancelled(Exception):
+    """其他變體已達 good-enough 分數，本變體的評估中止（結果不寫入快取）。"""
+
+
+def plan_seam(acc: MetricAccumulator, metrics: Dict[str, float], fps: float, limit: float) -> Optional[dict]:
+    """loopError 超過上限時找循環接縫；可修補則以修補後的估計值取代 loopError（原值記在 loopErrorRaw）。"""
+    plan = loopseam.plan_loop(np.concatenate(acc.seam_features), fps, limit)
+    if plan is None:
+        return None
+    metrics["loopErrorRaw"] = metrics["loopError"]
+    metrics["loopError"] = plan["error"]
+    metrics["loopTrimFrames"] = float(acc.frames - (plan["end"] - plan["start"] + 1))
+    metrics["loopCrossfadeFrames"] = float(plan["crossfade"])
+    return plan
+
+
+def run_all(gen: GenerationResult, qa_rules: dict, cancel: Optional[threading.Event] = None,
+            loops: bool = False) -> EvalResult:
+    """loops=True 時 loopError 不通過會先嘗試找循環接縫（裁切 / crossfade，由 postprocess 套用），
+    可修補的變體以修補後的估計值判定，不必重新生成。"""
+    rules = plan_rules(qa_rules)
+    loop_limit = qa_rules.get("max_loop_error") if loops else None
+    metrics = {"sizeKB": Path(gen.video_path).stat().st_size / 1024}
+    expected = gen.raw_meta.get("frames")
+    try:
+        # 經由 frame cache：完整讀完時全解析度影格留給 postprocess 用，不必再解碼
+        source = framecache.source(gen.video_path, gen.variant_id, fps=gen.raw_meta.get("fps"),
+                                   max_side=METRIC_MAX_SIDE)
+        for rule, limit in rules:
+            if RULE_COST[rule] == 0 and metrics[RULE_METRICS[rule]] > limit:
+                w, h = source.size
+                saved = (_decode_sec_per_mpx or 0.0) * (expected or 0) * w * h / 1e6
+                return _reject(gen, rule, metrics, saved)
+
+        streaming = [(r, l) for r, l in rules if RULE_COST[r] == 1]
+        acc = MetricAccumulator(expected, seam=loop_limit is not None)
+        started = time.perf_counter()
+        chunks = source.chunks(EARLY_EXIT_CHUNK_BYTES) if streaming else source.chunks()
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                raise EvaluationCancelled(gen.variant_id)
+            acc.update(chunk)
+            for rule, limit in streaming:
+                if acc.fails(rule, limit):
+                    elapsed = time.perf_counter() - started
+                    remaining = max(0, (expected or acc.frames) - acc.frames)
+                    metrics["framesDecoded"] = float(acc.frames)
+                    return _reject(gen, rule, metrics, elapsed * remaining / acc.frames)
+        full, luma = acc.finalize()
+        _record_decode_rate(time.perf_counter() - started, acc.frames, source.size)
+    except (OSError, ValueError) as e:
+        logger.error(f"[evaluate] {gen.variant_id} decode failed: {e}")
+        return EvalResult(variant_id=gen.variant_id, pass_flag=False, metrics=metrics, rejected_by="decode")
+
+    metrics.update(full)
+    loop_plan = None
+    if loop_limit is not None and metrics["loopError"] > loop_limit:
+        loop_plan = plan_seam(acc, metrics, gen.raw_meta.get("fps") or 24, loop_limit)
+    failed = check_rules(metrics, qa_rules)
+    if failed:
+        return _reject(gen, failed[0], metrics, 0.0, luma)
+    logger.info(f"[evaluate] {gen.variant_id} -> pass=True metrics={metrics}"
+                + (f" loop_plan={loop_plan}" if loop_plan else ""))
+    return EvalResult(variant_id=gen.variant_id, pass_flag=True, metrics=metrics, frame_luminance=luma,
+                      loop_plan=loop_plan)
+
+
+def cacheable(result: EvalResult) -> bool:
+    """解碼 / 讀檔失敗可能是暫時性的（檔案寫到一半、I/O 錯誤），不寫入 stage cache，下次重跑會重新評估。"""
+    return result.rejected_by != "decode"
+
+
+def score(metrics: Dict[str, float], qa_rules: dict, weights: Optional[Dict[str, float]] = None) -> float:
+    """加權餘裕分數 0~1；沒有設定上限的指標不計。沒有任何可計分指標時回傳 1.0。"""
+    weights = SCORE_WEIGHTS if weights is None else weights
+    limits = {RULE_METRICS[r]: l for r, l in plan_rules(qa_rules)}
+    total = weight_sum = 0.0
+    for metric, w in weights.items():
+        limit = limits.get(metric)
+        if not w or not limit or metric not in metrics:
+            continue
+        total += w * min(1.0, max(0.0, 1 - metrics[metric] / limit))
+        weight_sum += w
+    return round(total / weight_sum, 4) if weight_sum else 1.0
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=EVAL_WORKERS, thread_name_prefix="evaluate")
+    return _executor
+
+
+def select_variant(gens: List[GenerationResult], qa_rules: dict,
+                   evaluate_one: Callable[[GenerationResult, threading.Event], EvalResult],
+                   good_enough: Optional[float] = None, weights: Optional[Dict[str, float]] = None):
+    """同時評估所有變體並選出最佳者。回傳 (選中的 gen 或 None, 其 EvalResult, 各變體結果, rationale)。
+
+    evaluate_one(gen, cancel)：評估單一變體（呼叫端可包上快取），應在 cancel 被設定後丟出 EvaluationCancelled。
+    good_enough：通過且分數達此值的變體一出現就採用，取消其餘評估（結果取決於完成先後）；
+    None 時等全部評估完，取分數最高者（同分取 seed 順序較前者，結果固定）。
+    """
+    cancel = threading.Event()
+    futures = {_pool().submit(evaluate_one, g, cancel): i for i, g in enumerate(gens)}
+    results: List[Optional[EvalResult]] = [None] * len(gens)
+    scores: List[Optional[float]] = [None] * len(gens)
+    early = None
+    for fut in as_completed(futures):
+        i = futures[fut]
+        try:
+            res = fut.result()
+        except (EvaluationCancelled, CancelledError):
+            continue
+        results[i] = res
+        if res.pass_flag:
+            scores[i] = score(res.metrics, qa_rules, weights)
+            if good_enough is not None and early is None and scores[i] >= good_enough:
+                early = i
+                cancel.set()
+                for f in futures:
+                    f.cancel()
+
+    passing = [i for i, s in enumerate(scores) if s is not None]
+    if early is not None:
+        chosen = early
+        reason = f"first variant to reach good-enough score {good_enough}; remaining evaluations cancelled"
+    elif passing:
+        chosen = max(passing, key=lambda i: (scores[i], -i))
+        reason = f"highest weighted score among {len(passing)} passing variant(s)"
+    else:
+        chosen, reason = None, "no variant passed QA"
+    rationale = {
+        "mode": "good_enough" if good_enough is not None else "best",
+        "chosen": gens[chosen].variant_id if chosen is not None else None,
+        "score": scores[chosen] if chosen is not None else None,
+        "reason": reason,
+        "weights": SCORE_WEIGHTS if weights is None else weights,
+        "candidates": [{
+            "variant": g.variant_id,
+            "pass": r.pass_flag if r is not None else None,
+            "score": scores[i],
+            "rejected_by": r.rejected_by if r is not None else None,
+            "cancelled": r is None,
+        } for i, (g, r) in enumerate(zip(gens, results))],
     }
-    pass_flag = True
-    if qa_rules.get("max_brightness") and brightness > qa_rules["max_brightness"]:
-        pass_flag = False
-    if qa_rules.get("max_size_kb") and size_kb > qa_rules["max_size_kb"]:
-        pass_flag = False
-    if qa_rules.get("max_loop_error") and loop_error > qa_rules["max_loop_error"]:
-        pass_flag = False
-    logger.info(f"[evaluate] {gen.variant_id} -> pass={pass_flag} metrics={metrics}")
-    return EvalResult(variant_id=gen.variant_id, pass_flag=pass_flag, metrics=metrics)
+    if good_enough is not None:
+        rationale["good_enough"] = good_enough
+    logger.info(f"[evaluate] selected {rationale['chosen']} ({reason})")
+    return (gens[chosen] if chosen is not None else None,
+            results[chosen] if chosen is not None else None, results, rationale)
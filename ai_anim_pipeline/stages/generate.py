@@ -1,26 +1,270 @@
 from loguru import logger
 from pathlib import Path
-from ..core import PromptPlan, GenerationResult
-import json, os
+from typing import List, Optional
+from ..core import OUTPUT_DIR, PromptPlan, GenerationResult, parse_resolution
+from ..core.frames import write_apng
+import asyncio
+import copy
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+import numpy as np
 
-DUMMY_VIDEO_DIR = Path(__file__).parent.parent / 'output' / 'temp' / 'videos'
+DUMMY_VIDEO_DIR = OUTPUT_DIR / 'temp' / 'videos'
+_publish_lock = threading.Lock()  # 放棄嘗試與 rename 到正式路徑互斥（見 LocalBackend._render）
 
-def run_variants(plan: PromptPlan):
-    DUMMY_VIDEO_DIR.mkdir(parents=True, exist_ok=True)
-    results = []
-    for seed in plan.seed_list:
+
+class GenerationError(RuntimeError):
+    """後端呼叫在重試後仍失敗"""
+
+
+class TokenBucket:
+    """Token bucket 限流：平均每秒 rate 次，最多累積 capacity 次突發。"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def render_clip(width: int, height: int, count: int, seed: int, opaque: bool = False) -> np.ndarray:
+    """程序化產生 (count, height, width, 4) RGBA 影格：脈動光暈，首尾相接。
+
+    依 seed 決定顏色與是否漂移（約 1/3 變體中心會水平漂移，讓 QA 有東西可擋）。
+    """
+    rng = np.random.default_rng(seed)
+    color = rng.uniform(0.45, 1.0, 3).astype(np.float32)
+    drift = 0.15 if seed % 3 == 0 else 0.0
+    t = np.arange(count, dtype=np.float32) / max(count - 1, 1)
+    phase = 2 * np.pi * t
+    ys = np.linspace(-1, 1, height, dtype=np.float32)[None, :, None]
+    xs = np.linspace(-1, 1, width, dtype=np.float32)[None, None, :]
+    cx = (drift * t)[:, None, None]
+    radius = (0.6 + 0.08 * np.sin(phase))[:, None, None]
+    glow = np.clip(1 - np.hypot(xs - cx, ys) / radius, 0, 1) ** 1.5
+    frames = np.empty((count, height, width, 4), np.uint8)
+    if opaque:
+        # 背景：暗色漸層底 + 光暈，整張不透明
+        base = 0.15 + 0.1 * (ys + 1)
+        for c in range(3):
+            frames[..., c] = np.clip((base + 0.6 * glow) * color[c], 0, 1) * 255
+        frames[..., 3] = 255
+    else:
+        for c in range(3):
+            frames[..., c] = color[c] * 255
+        frames[..., 3] = glow * 255
+    return frames
+
+
+class LocalBackend:
+    """本地替身後端：模擬 Veo 呼叫的延遲與失敗率，寫出程序化產生的 APNG 影片。
+
+    latency_sec / jitter_sec 控制每次呼叫的等待時間（jitter 為指數分布，模擬長尾），
+    failure_rate 為隨機丟出例外的機率，用於離線量測吞吐量與 tail latency。
+    render_max_side 限制替身影片的長邊像素（預覽解析度），None 表示以 spec 解析度輸出。
+    """
+    model = "veo-3-dummy"
+
+    def __init__(self, latency_sec: float = 0.0, jitter_sec: float = 0.0,
+                 failure_rate: float = 0.0, out_dir: Path = DUMMY_VIDEO_DIR,
+                 render_max_side: Optional[int] = 256):
+        self.latency_sec = latency_sec
+        self.jitter_sec = jitter_sec
+        self.failure_rate = failure_rate
+        self.out_dir = out_dir
+        self.render_max_side = render_max_side
+        self._rng = random.Random(0)
+
+    def _write_clip(self, plan: PromptPlan, seed: int, video_path: Path) -> dict:
+        notes = plan.technical_notes
+        w, h = parse_resolution(notes.get("resolution", ""))
+        fps = float(notes.get("fps", 24))
+        count = max(1, round(float(notes.get("duration_sec", 1.0)) * fps))
+        if self.render_max_side and max(w, h) > self.render_max_side:
+            scale = self.render_max_side / max(w, h)
+            w, h = max(1, round(w * scale)), max(1, round(h * scale))
+        frames = render_clip(w, h, count, seed, opaque="backgroundLoop" in plan.tags)
+        write_apng(video_path, frames, fps)
+        return {"model": self.model, "seed": seed, "fps": fps, "frames": count, "width": w, "height": h}
+
+    def _render(self, plan: PromptPlan, seed: int, video_path: Path, abandoned: threading.Event) -> dict:
+        tmp = video_path.with_suffix(f".{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            meta = self._write_clip(plan, seed, tmp)
+            with _publish_lock:
+                if not abandoned.is_set():
+                    os.replace(tmp, video_path)
+            return meta
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    async def generate(self, plan: PromptPlan, seed: int, variant_id: str):
+        delay = self.latency_sec
+        if self.jitter_sec:
+            delay += self._rng.expovariate(1 / self.jitter_sec)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise ConnectionError(f"simulated backend failure for {variant_id}")
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        video_path = self.out_dir / f"{variant_id}.apng"
+        # 影格運算與編碼是 CPU 工作，丟到 thread 避免卡住 event loop。
+        # 逾時取消後 thread 仍會把影片寫完，因此每次嘗試寫自己的暫存檔，只有未被放棄的嘗試才 rename 到 video_path
+        abandoned = threading.Event()
+        try:
+            meta = await asyncio.to_thread(self._render, plan, seed, video_path, abandoned)
+        except asyncio.CancelledError:
+            with _publish_lock:
+                abandoned.set()
+            raise
+        (self.out_dir / f"{variant_id}.json").write_text(json.dumps(meta, indent=2))
+        logger.info(f"[generate] stand-in video created: {video_path.name}")
+        return video_path, meta
+
+
+class GenerationEngine:
+    """asyncio 生成引擎。
+
+    - per_spec：單一 plan 同時進行中的變體數 (N)
+    - max_inflight：本行程同時進行中的請求數 (M)，由同一個 event loop 上的所有 plan 共用
+    - rate_per_sec：token bucket 限流，None 表示不限
+    - timeout_sec / retries / backoff_sec：單次請求逾時、重試次數、指數退避基數
+    同步呼叫（run_variants）都送到本行程唯一的背景 event loop，上限與限流跨 spec 生效；
+    多個 worker 行程以 split() 平分 M 與 rate。
+    """
+
+    def __init__(self, backend=None, per_spec: int = 4, max_inflight: int = 16,
+                 rate_per_sec: Optional[float] = None, timeout_sec: float = 120.0,
+                 retries: int = 2, backoff_sec: float = 0.5):
+        self.backend = backend or LocalBackend()
+        self.per_spec = max(1, per_spec)
+        self.max_inflight = max(1, max_inflight)
+        self.rate_per_sec = rate_per_sec
+        self.timeout_sec = timeout_sec
+        self.retries = retries
+        self.backoff_sec = backoff_sec
+        self._rng = random.Random()
+        self._loop = None
+
+    def __getstate__(self):
+        # 綁定 event loop 的狀態不跨行程傳遞（process pool initializer 會 pickle 引擎）
+        state = self.__dict__.copy()
+        state.update(_loop=None)
+        state.pop('_global', None)
+        state.pop('_bucket', None)
+        return state
+
+    def split(self, parts: int) -> "GenerationEngine":
+        """平分給 parts 個行程的引擎：每份 max_inflight 與 rate_per_sec 為 1/parts（max_inflight 至少 1）。"""
+        if parts <= 1:
+            return self
+        share = copy.copy(self)
+        share._loop = None
+        share.max_inflight = max(1, math.ceil(self.max_inflight / parts))
+        share.rate_per_sec = self.rate_per_sec / parts if self.rate_per_sec else None
+        return share
+
+    def _loop_state(self):
+        # Semaphore / Lock 綁定 event loop；換 loop（例如每次 asyncio.run）時重建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.max_inflight)
+            self._bucket = TokenBucket(self.rate_per_sec) if self.rate_per_sec else None
+        return self._global, self._bucket
+
+    async def _request(self, plan: PromptPlan, seed: int, local: asyncio.Semaphore) -> GenerationResult:
         variant_id = f"{plan.id}_seed{seed}"
-        # 建立一個假檔案代表影片輸出
-        video_path = DUMMY_VIDEO_DIR / f"{variant_id}.mp4"
-        video_path.write_bytes(b"DUMMY_VIDEO")
-        meta = {"model": "veo-3-dummy", "seed": seed}
-        (DUMMY_VIDEO_DIR / f"{variant_id}.json").write_text(json.dumps(meta, indent=2))
-        logger.info(f"[generate] fake video created: {video_path.name}")
-        results.append(GenerationResult(
-            plan_id=plan.id,
-            variant_id=variant_id,
-            seed=seed,
-            video_path=str(video_path),
-            raw_meta=meta
-        ))
-    return results
+        global_sem, bucket = self._loop_state()
+        for attempt in range(self.retries + 1):
+            async with local, global_sem:
+                if bucket:
+                    await bucket.acquire()
+                started = time.perf_counter()
+                try:
+                    video_path, meta = await asyncio.wait_for(
+                        self.backend.generate(plan, seed, variant_id), self.timeout_sec)
+                    error = None
+                except (asyncio.TimeoutError, ConnectionError, OSError) as e:
+                    error = e
+            if error is None:
+                meta = dict(meta, attempts=attempt + 1,
+                            latency_ms=round((time.perf_counter() - started) * 1000, 3))
+                return GenerationResult(
+                    plan_id=plan.id,
+                    variant_id=variant_id,
+                    seed=seed,
+                    video_path=str(video_path),
+                    raw_meta=meta
+                )
+            if attempt == self.retries:
+                raise GenerationError(f"{variant_id} failed after {attempt + 1} attempts: {error!r}") from error
+            # 退避期間不佔用 per_spec / max_inflight 名額
+            delay = self.backoff_sec * (2 ** attempt) * (0.5 + self._rng.random())
+            logger.warning(f"[generate] {variant_id} attempt {attempt + 1} failed ({error!r}), retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def run_plan(self, plan: PromptPlan) -> List[GenerationResult]:
+        """同時產生 plan 的所有變體，結果依 seed_list 順序回傳；重試後仍失敗的變體記錄後略過。"""
+        local = asyncio.Semaphore(self.per_spec)
+        results = await asyncio.gather(*(self._request(plan, s, local) for s in plan.seed_list),
+                                       return_exceptions=True)
+        for r in results:
+            if isinstance(r, GenerationError):
+                logger.error(f"[generate] {r}")
+            elif isinstance(r, BaseException):
+                raise r
+        return [r for r in results if isinstance(r, GenerationResult)]
+
+
+_default_engine = None
+_shared_loop = None  # (pid, loop)：fork 出的子行程沒有父行程的 loop thread，需重建
+_shared_loop_lock = threading.Lock()
+
+
+def configure(engine: GenerationEngine):
+    """設定本行程預設使用的 GenerationEngine（process pool 的 worker initializer 也呼叫此函式）。"""
+    global _default_engine
+    _default_engine = engine
+
+
+def default_engine() -> GenerationEngine:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = GenerationEngine()
+    return _default_engine
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """本行程共用的 event loop（背景 daemon thread），引擎的 Semaphore / token bucket 綁在這個 loop 上。"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None or _shared_loop[0] != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="generate-loop", daemon=True).start()
+            _shared_loop = (os.getpid(), loop)
+        return _shared_loop[1]
+
+
+def run_variants(plan: PromptPlan, engine: Optional[GenerationEngine] = None):
+    future = asyncio.run_coroutine_threadsafe((engine or default_engine()).run_plan(plan), _background_loop())
+    return future.result()
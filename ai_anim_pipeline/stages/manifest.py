@@ -1,18 +1,210 @@
 from pathlib import Path
+import hashlib
 import json
+import mmap
+import struct
+import zlib
 from loguru import logger
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
-MANIFEST_PATH = Path(__file__).parent.parent / 'output' / 'assets' / 'animation_manifest.json'
+from ..core import OUTPUT_DIR, texcomp
+from ..core.cache import file_digest, stable_hash
 
-def write(items: List[dict], output: str = None):
+MANIFEST_PATH = OUTPUT_DIR / 'assets' / 'animation_manifest.json'
+
+# manifest 的每個 asset 附上：
+# - files：client 要載入的檔案（sheet 頁面、GPU 貼圖、影片）的 bytes 與 sha256；content_hash 涵蓋這些檔案與 asset 描述
+# - bytes_total 與 texture_memory（頁面解開後的 RGBA8 bytes、各 GPU 格式的 block bytes；影片為單格 RGBA8 解碼緩衝）
+# 另外輸出二進位索引 {manifest}.idx（little-endian，可直接 mmap）：
+#   header  : magic "AMIX", version u16, flags u16, count u32, entry_size u32, strings_offset u64, manifest sha256 前 8 bytes
+#   entries : count 筆、依 id 的 UTF-8 bytes 排序，每筆 id_offset u32, id_len u16, kind u16,
+#             json_offset u64, json_len u32, crc32 u32（manifest 中該 asset JSON 物件的位置與校驗）
+#   strings : 所有 id 串接
+# 以二分搜尋找 id（O(log n)），只讀取並解析該 asset 的 JSON 片段。
+
+INDEX_MAGIC = b'AMIX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sHHIIQ8s')
+INDEX_ENTRY = struct.Struct('<IHHQII')
+KIND_SHEET, KIND_VIDEO = 1, 2
+
+
+def _files(item: dict) -> List[str]:
+    names = list(item.get("sheets") or [])
+    names += [n for v in (item.get("gpu_textures") or {}).values() for n in v["files"]]
+    if item.get("video"):
+        names.append(item["video"])
+    return names
+
+
+def texture_memory(item: dict) -> Dict[str, int]:
+    """載入後的貼圖記憶體估計（bytes，不含 mipmap）。"""
+    if item.get("video"):
+        w, h = item["frame_size"]
+        return {"rgba8": w * h * 4}
+    sizes = item.get("page_sizes") or []
+    out = {"rgba8": sum(w * h * 4 for w, h in sizes)}
+    for fmt in item.get("gpu_textures") or {}:
+        bw, bh = texcomp.FORMATS[fmt]["block"]
+        out[fmt] = sum(-(-w // bw) * -(-h // bh) * 16 for w, h in sizes)
+    return out
+
+
+def annotate(item: dict, assets_dir: Path, digests: Dict[str, dict]) -> dict:
+    """加上 files / bytes_total / texture_memory / content_hash；digests 為跨 asset 共用的檔案雜湊快取（atlas 頁面只算一次）。"""
+    files = {}
+    for name in _files(item):
+        if name not in digests:
+            path = assets_dir / name
+            digests[name] = {"bytes": path.stat().st_size, "sha256": file_digest(path)} if path.exists() else None
+        if digests[name] is not None:
+            files[name] = digests[name]
+    base = {k: v for k, v in item.items()
+            if k not in ("files", "bytes_total", "texture_memory", "content_hash", "raw_pages")}
+    return dict(base, files=files, bytes_total=sum(f["bytes"] for f in files.values()),
+                texture_memory=texture_memory(item), content_hash=stable_hash(base, files))
+
+
+def _dump(manifest: dict, items: List[dict]) -> Tuple[bytes, List[Tuple[int, int]]]:
+    """輸出與 json.dumps(indent=2) 相同結構的 manifest，並回傳每個 asset JSON 物件的 (offset, length)。"""
+    head = {k: v for k, v in manifest.items() if k != "assets"}
+    parts = ['{\n' + ''.join(f'  {json.dumps(k)}: {json.dumps(v)},\n' for k, v in head.items() if k != "atlases")
+             + '  "assets": [']
+    spans = []
+    pos = len(parts[0])
+    for i, item in enumerate(items):
+        prefix = ('' if i == 0 else ',') + '\n    '
+        blob = json.dumps(item, indent=2).replace('\n', '\n    ')
+        spans.append((pos + len(prefix), len(blob)))
+        parts += [prefix, blob]
+        pos += len(prefix) + len(blob)
+    parts.append('\n  ]' if items else ']')
+    if "atlases" in head:
+        parts.append(',\n  "atlases": ' + json.dumps(head["atlases"], indent=2).replace('\n', '\n  '))
+    parts.append('\n}')
+    # ensure_ascii（預設）下字元位置即 byte 位置
+    return ''.join(parts).encode('ascii'), spans
+
+
+def write_index(path: Path, items: List[dict], data: bytes, spans: List[Tuple[int, int]]) -> Path:
+    order = sorted(range(len(items)), key=lambda i: items[i]["id"].encode('utf-8'))
+    strings = bytearray()
+    entries = bytearray()
+    for i in order:
+        key = items[i]["id"].encode('utf-8')
+        offset, length = spans[i]
+        kind = KIND_VIDEO if items[i].get("video") else KIND_SHEET
+        entries += INDEX_ENTRY.pack(len(strings), len(key), kind, offset, length,
+                                    zlib.crc32(data[offset:offset + length]))
+        strings += key
+    strings_offset = INDEX_HEADER.size + len(entries)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, len(items), INDEX_ENTRY.size, strings_offset,
+                               hashlib.sha256(data).digest()[:8])
+    path.write_bytes(header + bytes(entries) + bytes(strings))
+    return path
+
+
+def write(items: List[dict], output: str = None, atlases: Optional[List[dict]] = None):
+    """atlases：跨 effect 共用的 atlas 頁面（stages/atlas.py），client 可先預載這些頁面。
+
+    同時寫出 {manifest}.idx 二進位索引（見 ManifestIndex）。
+    """
     MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    path = Path(output) if output else MANIFEST_PATH
+    digests: Dict[str, dict] = {}
+    items = [annotate(item, MANIFEST_PATH.parent, digests) for item in items]
     manifest = {
         "version": "v0.1-skeleton",
         "count": len(items),
+        "bytes_total": sum(f["bytes"] for f in digests.values() if f),
         "assets": items
     }
-    path = Path(output) if output else MANIFEST_PATH
-    path.write_text(json.dumps(manifest, indent=2))
-    logger.info(f"[manifest] written {len(items)} assets -> {path}")
+    if atlases:
+        manifest["atlases"] = atlases
+    data, spans = _dump(manifest, items)
+    path.write_bytes(data)
+    index = write_index(path.with_suffix('.idx'), items, data, spans)
+    logger.info(f"[manifest] written {len(items)} assets -> {path} (+ {index.name})")
     return path
+
+
+class ManifestIndex:
+    """以 mmap 讀取 {manifest}.idx，二分搜尋 id 後只解析該 asset 的 JSON。
+
+    with ManifestIndex(path_to_manifest_json) as idx: idx.get("symbol_win_lion")
+    """
+
+    def __init__(self, manifest_path: Path = MANIFEST_PATH):
+        self.manifest_path = Path(manifest_path)
+        self._f = open(self.manifest_path.with_suffix('.idx'), 'rb')
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, self._entry_size, self._strings, self.manifest_digest = \
+            INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"not a manifest index: {self.manifest_path.with_suffix('.idx')}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, k: int):
+        id_off, id_len, kind, offset, length, crc = INDEX_ENTRY.unpack_from(
+            self._mm, INDEX_HEADER.size + k * self._entry_size)
+        start = self._strings + id_off
+        return self._mm[start:start + id_len], kind, offset, length, crc
+
+    def ids(self) -> List[str]:
+        return [self._entry(k)[0].decode('utf-8') for k in range(self.count)]
+
+    def find(self, asset_id: str) -> Optional[Tuple[int, int, int]]:
+        """回傳 (json_offset, json_len, crc32)；不存在時回傳 None。"""
+        key = asset_id.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count:
+            found, _, offset, length, crc = self._entry(lo)
+            if found == key:
+                return offset, length, crc
+        return None
+
+    def get(self, asset_id: str) -> Optional[dict]:
+        hit = self.find(asset_id)
+        if hit is None:
+            return None
+        offset, length, crc = hit
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(offset)
+            blob = f.read(length)
+        if zlib.crc32(blob) != crc:
+            raise ValueError(f"manifest index out of date for {asset_id}")
+        return json.loads(blob)
+
+
+class ManifestWriter:
+    """依 catalog 順序收集各 spec 的 (manifest_item, kpi_record)。
+
+    DAG 排程下只在單一 writer thread 呼叫 add，spec 完成的先後順序不影響 records 的順序；
+    total 未知時（spec 以 generator 逐一取用）records 隨 index 增長。
+    """
+
+    def __init__(self, total: int = 0):
+        self.records = [None] * total
+
+    def add(self, index: int, record):
+        if index >= len(self.records):
+            self.records.extend([None] * (index + 1 - len(self.records)))
+        self.records[index] = record
@@ -1,40 +1,515 @@
 from loguru import logger
 from pathlib import Path
-from PIL import Image, ImageDraw
-from ..core import PackagingResult, EffectSpec
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+from ..core import OUTPUT_DIR, PackagingResult, EffectSpec, parse_resolution
+from ..core import color, texcomp
+from ..core import frames as frames_mod
+from ..core.frames import FrameSource
+from ..core.encoding import encode_pages
+from ..core.video import encode_loop
+import hashlib
+import io
 import json
-import random
+import numpy as np
 
-ASSETS_DIR = Path(__file__).parent.parent / 'output' / 'assets'
+ASSETS_DIR = OUTPUT_DIR / 'assets'
+RAW_PAGES_DIR = OUTPUT_DIR / 'temp' / 'pages'   # 量化前的頁面（無損 PNG），給跨 effect atlas 重新取樣用
+MAX_PAGE_SIZE = 4096
+PADDING = 2               # 影格之間留白，避免取樣時互相滲色
+POWER_OF_TWO = True       # 頁面尺寸取 2 的次方
+NEAR_DUP_SHIFT = 2        # 近似重複判定：每通道捨去最低 2 bit 後內容相同即共用同一區塊
+DELTA_TILE = 16           # delta 模式：以 16x16 tile 為單位找出與前一格不同的區域
+DELTA_KEY_RATIO = 0.6     # 變動區域超過該格 trim 面積的此比例時改存完整影格 (keyframe)
+# sheet / delta 頁面的大小預算（KB）。max_size_kb 是 evaluate 對生成影片的 QA 上限，
+# 打包後的 sheet 另以此鍵設定；未設定時沿用 max_size_kb。影片輸出 (package_video) 仍以 max_size_kb 為預算。
+SHEET_BUDGET_RULE = "sheet_max_kb"
+
+# 長背景循環 / 大解析度改輸出帶 alpha 的循環影片（spritesheet 會佔用過多貼圖記憶體）
+VIDEO_CATEGORIES = {"backgroundLoop"}
+VIDEO_MIN_PIXELS = 1280 * 720
+VIDEO_TWO_PASS = True
+
+# Atlas 打包：
+# 1. 串流讀取後處理影格：裁掉透明邊 (trim)，以內容雜湊找出相同 / 近似相同的影格
+# 2. 只替不重複的影格找位置：MaxRects (Best Short Side Fit)，受頁面上限與 2 的次方限制，放不下就換頁
+# 3. 第二次讀取影格貼進頁面（不重複影格總量小於 chunk 記憶體上限時直接用第一次讀取保留的影格）
+# meta 中每一格記錄頁面、rect 與裁切 offset，重複影格指向同一個 rect。
+#
+# Delta 模式（spec.packaging == "delta"）：第一格與變動過大的影格存完整 trim 影格 (keyframe)，
+# 其餘只存與前一格不同的 tile 合併成的 dirty rect（整段以 NumPy 逐 chunk 比較前後格）；
+# client 依序把 rect 以「取代」（非 alpha 混合）方式貼到上一格的畫面上即可還原，輸出與完整影格逐像素相同。
+#
+# 量化前的頁面另存無損 PNG 到 RAW_PAGES_DIR（同檔名），atlas 由此取區塊，避免有損編碼疊兩次。
+# spec 設定 gpu_formats 時每頁另外輸出 GPU 壓縮貼圖（{page}.etc2.ktx / .astc4x4.ktx / .astc6x6.ktx，見 core/texcomp），
+# 以 PNG 量化前的頁面編碼，meta 的 gpu_textures 記錄檔名、大小與 PSNR；未設定時不輸出。
+
+Rect = Tuple[int, int, int, int]
+
+
+def trim_box(frame: np.ndarray) -> Optional[Rect]:
+    """alpha > 0 的最小外框 (x, y, w, h)；完全透明回傳 None。"""
+    alpha = frame[..., 3]
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+
+def frame_key(trimmed: np.ndarray, shift: int = NEAR_DUP_SHIFT) -> str:
+    """近似重複雜湊：尺寸 + 量化後內容（shift=0 為完全相同）。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.asarray(trimmed.shape, np.int32).tobytes())
+    h.update(np.ascontiguousarray(trimmed >> shift if shift else trimmed).tobytes())
+    return h.hexdigest()
+
+
+class MaxRectsBin:
+    """MaxRects 裝箱（Best Short Side Fit），free rect 以 (x, y, w, h) 表示。"""
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.free: List[Rect] = [(0, 0, width, height)]
+        self.used_w = 0
+        self.used_h = 0
+
+    def insert(self, w: int, h: int) -> Optional[Tuple[int, int]]:
+        best = None
+        for fx, fy, fw, fh in self.free:
+            if w <= fw and h <= fh:
+                score = (min(fw - w, fh - h), max(fw - w, fh - h))
+                if best is None or score < best[0]:
+                    best = (score, fx, fy)
+        if best is None:
+            return None
+        _, x, y = best
+        self._place((x, y, w, h))
+        self.used_w = max(self.used_w, x + w)
+        self.used_h = max(self.used_h, y + h)
+        return x, y
+
+    def _place(self, rect: Rect):
+        x, y, w, h = rect
+        new_free = []
+        for fx, fy, fw, fh in self.free:
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                new_free.append((fx, fy, fw, fh))
+                continue
+            # 與放入的 rect 相交：切出上下左右四塊剩餘空間
+            if x > fx:
+                new_free.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                new_free.append((x + w, fy, fx + fw - x - w, fh))
+            if y > fy:
+                new_free.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                new_free.append((fx, y + h, fw, fy + fh - y - h))
+        self.free = _prune(new_free)
+
+
+def _prune(rects: List[Rect]) -> List[Rect]:
+    """移除被其他 free rect 完全包含的 rect。"""
+    rects = sorted(set(rects), key=lambda r: r[2] * r[3], reverse=True)
+    kept: List[Rect] = []
+    for r in rects:
+        x, y, w, h = r
+        if not any(x >= kx and y >= ky and x + w <= kx + kw and y + h <= ky + kh for kx, ky, kw, kh in kept):
+            kept.append(r)
+    return kept
+
+
+def _next_pow2(n: int) -> int:
+    return 1 << max(0, (n - 1).bit_length())
+
+
+def _candidate_sizes(area: int, max_w: int, max_h: int, pot: bool):
+    """由小到大的頁面尺寸候選（最後一個必為上限尺寸）。"""
+    side = max(1, int(area ** 0.5))
+    w = h = _next_pow2(side) if pot else side
+    sizes = []
+    while w < max_w or h < max_h:
+        sizes.append((min(w, max_w), min(h, max_h)))
+        if w <= h:
+            w *= 2
+        else:
+            h *= 2
+    sizes.append((max_w, max_h))
+    return sizes
+
+
+def pack_rects(sizes: List[Tuple[int, int]], max_size: int = MAX_PAGE_SIZE, padding: int = PADDING,
+               pot: bool = POWER_OF_TWO):
+    """將多個 (w, h) 裝進一或多頁。
+
+    回傳 (placements, pages)：placements[i] = (page, x, y)；pages[k] = (page_w, page_h)。
+    """
+    for w, h in sizes:
+        if w + padding > max_size or h + padding > max_size:
+            raise ValueError(f"rect {w}x{h} exceeds max page size {max_size}")
+    # 大的先放：以長邊、面積排序
+    order = sorted(range(len(sizes)), key=lambda i: (max(sizes[i]), sizes[i][0] * sizes[i][1]), reverse=True)
+    placements: List[Optional[Tuple[int, int, int]]] = [None] * len(sizes)
+    pages = []
+    remaining = order
+    while remaining:
+        area = sum((sizes[i][0] + padding) * (sizes[i][1] + padding) for i in remaining)
+        for bw, bh in _candidate_sizes(area, max_size, max_size, pot):
+            bin_ = MaxRectsBin(bw, bh)
+            placed, left = {}, []
+            for i in remaining:
+                pos = bin_.insert(sizes[i][0] + padding, sizes[i][1] + padding)
+                if pos is None:
+                    left.append(i)
+                else:
+                    placed[i] = pos
+            # 全部放得下，或已是上限尺寸（放不下的留給下一頁）
+            if not left or (bw, bh) == (max_size, max_size):
+                break
+        page = len(pages)
+        for i, (x, y) in placed.items():
+            placements[i] = (page, x, y)
+        used_w, used_h = bin_.used_w, bin_.used_h
+        pages.append((min(_next_pow2(used_w), bw), min(_next_pow2(used_h), bh)) if pot else (used_w, used_h))
+        remaining = left
+    return placements, pages
+
+
+def _page_name(spec: EffectSpec, index: int) -> str:
+    return f"{spec.id}_sheet.png" if index == 0 else f"{spec.id}_sheet_{index}.png"
+
+
+def raw_page_path(name: str) -> Path:
+    """sheet 頁面 name 量化前的無損版本。"""
+    return RAW_PAGES_DIR / name
+
+
+def packaging_mode(spec: EffectSpec) -> str:
+    """'sheet'、'delta' 或 'video'：spec.packaging 明確指定優先，否則依 category / 解析度（delta 需明確指定）。"""
+    if spec.packaging in ("sheet", "delta", "video"):
+        return spec.packaging
+    w, h = parse_resolution(spec.resolution)
+    return "video" if spec.category in VIDEO_CATEGORIES or w * h >= VIDEO_MIN_PIXELS else "sheet"
+
+
+def open_processed(processed: dict) -> FrameSource:
+    """postprocess 輸出的 memmap 影格（舊紀錄沒有 frames_path 時退回解碼原始影片）。"""
+    return FrameSource(processed.get("frames_path") or processed["video_path"], fps=processed.get("fps"))
+
+
+def package_video(processed: dict, spec: EffectSpec) -> PackagingResult:
+    ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+    source = open_processed(processed)
+    premultiplied = processed.get("premultiplied", False)
+    counted = []
+
+    def frames_factory():
+        n = 0
+        for frame in source.frames():
+            n += 1
+            # 影片編碼器的 alpha 為 straight
+            yield color.unpremultiply_u8(frame) if premultiplied else frame
+        counted.append(n)
+
+    budget_kb = spec.qa_rules.get("max_size_kb")
+    encoding = encode_loop(frames_factory, source.size, spec.fps, round(spec.duration_sec * spec.fps),
+                           ASSETS_DIR / f"{spec.id}_loop", int(budget_kb * 1024) if budget_kb else None,
+                           two_pass=VIDEO_TWO_PASS)
+    video_path = Path(encoding.pop("path"))
+    if not encoding["within_budget"]:
+        logger.warning(f"[pack] {spec.id}: {encoding['bytes'] / 1024:.1f}KB exceeds budget {budget_kb}KB")
+    meta = {
+        "id": spec.id,
+        "frames": counted[-1] if counted else 0,
+        "fps": spec.fps,
+        "loops": spec.loops,
+        "video": video_path.name,
+        "frame_size": list(source.size),
+        "crop": processed.get("crop"),
+        "scale": processed.get("scale"),
+        "loop": processed.get("loop"),
+        "encoding": encoding
+    }
+    video_path.with_suffix('.json').write_text(json.dumps(meta, indent=2))
+    logger.info(f"[pack] {spec.id}: {meta['frames']} frames -> {video_path.name} "
+                f"{encoding['bytes'] / 1024:.1f}KB ({encoding['codec']}, {len(encoding['attempts'])} attempt(s))")
+    return PackagingResult(spritesheet_path=None, webm_path=str(video_path), meta_json=meta)
+
+
+def gpu_formats(spec: EffectSpec) -> List[str]:
+    """spec 要求的 GPU 壓縮格式；未設定時不輸出（CPU 編碼每頁數秒，需明確要求）。"""
+    if not spec.gpu_formats:
+        return []
+    unknown = [f for f in spec.gpu_formats if f not in texcomp.FORMATS]
+    if unknown:
+        logger.warning(f"[pack] {spec.id}: unknown gpu_formats {unknown} ignored")
+    return [f for f in spec.gpu_formats if f in texcomp.FORMATS]
+
+
+def sheet_budget_kb(spec: EffectSpec) -> Optional[float]:
+    """sheet 頁面總大小預算：qa_rules.sheet_max_kb，未設定時沿用 max_size_kb（生成影片的 QA 上限）。"""
+    budget = spec.qa_rules.get(SHEET_BUDGET_RULE)
+    return budget if budget is not None else spec.qa_rules.get("max_size_kb")
+
+
+def write_sheets(spec: EffectSpec, pages: List[np.ndarray]) -> Tuple[List[str], dict, dict, dict]:
+    """編碼並寫出頁面：依 sheet_budget_kb 搜尋最小品質損失且放得進預算的 PNG 參數；
+    另外以未量化的頁面輸出 GPU 壓縮貼圖。回傳 (檔名, 編碼資訊, GPU 貼圖資訊, 量化前頁面的 sha256)。"""
+    budget_kb = sheet_budget_kb(spec)
+    datas, encoding = encode_pages(pages, int(budget_kb * 1024) if budget_kb else None)
+    if not encoding["within_budget"]:
+        logger.warning(f"[pack] {spec.id}: {encoding['bytes'] / 1024:.1f}KB exceeds budget {budget_kb}KB")
+    sheets, raw = [], {}
+    RAW_PAGES_DIR.mkdir(parents=True, exist_ok=True)
+    for k, (page, data) in enumerate(zip(pages, datas)):
+        name = _page_name(spec, k)
+        (ASSETS_DIR / name).write_bytes(data)
+        buf = io.BytesIO()
+        Image.fromarray(page, 'RGBA').save(buf, format='PNG', compress_level=1)
+        raw_page_path(name).write_bytes(buf.getvalue())
+        raw[name] = hashlib.sha256(buf.getvalue()).hexdigest()
+        sheets.append(name)
+    gpu = texcomp.compress_pages(pages, sheets, ASSETS_DIR, gpu_formats(spec))
+    if gpu:
+        logger.info(f"[pack] {spec.id}: gpu textures " + ", ".join(
+            f"{fmt} {v['bytes'] / 1024:.1f}KB psnr={v['psnr']}" for fmt, v in gpu.items()))
+    return sheets, encoding, gpu, raw
 
-# 產生一張顏色塊 spritesheet + meta json （假）
 
 def package(processed: dict, spec: EffectSpec) -> PackagingResult:
+    mode = packaging_mode(spec)
+    if mode == "video":
+        return package_video(processed, spec)
+    if mode == "delta":
+        return package_delta(processed, spec)
+    ASSETS_DIR.mkdir(parents=True, exist_ok=True)
+    meta_path = ASSETS_DIR / f"{spec.id}_sheet.json"
+    source = open_processed(processed)
+    fw, fh = source.size
+
+    # pass 1：trim + 去重
+    boxes: List[Optional[Rect]] = []
+    frame_unique: List[Optional[int]] = []   # 每格對應的 unique 索引（全透明為 None）
+    unique_keys: Dict[str, int] = {}
+    unique_src: List[Tuple[int, Rect]] = []  # unique 索引 -> (代表影格索引, trim box)
+    kept: Optional[Dict[int, np.ndarray]] = {}
+    kept_bytes = 0
+    for idx, frame in enumerate(source.frames()):
+        box = trim_box(frame)
+        boxes.append(box)
+        if box is None:
+            frame_unique.append(None)
+            continue
+        x, y, w, h = box
+        trimmed = frame[y:y + h, x:x + w]
+        key = frame_key(trimmed)
+        if key not in unique_keys:
+            unique_keys[key] = len(unique_src)
+            unique_src.append((idx, box))
+            if kept is not None:
+                kept_bytes += trimmed.nbytes
+                if kept_bytes > frames_mod.DEFAULT_CHUNK_BYTES:
+                    kept = None  # 超過記憶體上限，改為第二次解碼
+                else:
+                    kept[len(unique_src) - 1] = trimmed.copy()
+        frame_unique.append(unique_keys[key])
+
+    # 排版
+    placements, page_sizes = pack_rects([(b[2], b[3]) for _, b in unique_src])
+    pages = [np.zeros((h, w, 4), np.uint8) for w, h in page_sizes]
+
+    def paste(u: int, trimmed: np.ndarray):
+        page, x, y = placements[u]
+        pages[page][y:y + trimmed.shape[0], x:x + trimmed.shape[1]] = trimmed
+
+    if kept is not None:
+        for u, trimmed in kept.items():
+            paste(u, trimmed)
+    else:
+        rep = {idx: u for u, (idx, _) in enumerate(unique_src)}
+        for idx, frame in enumerate(source.frames()):
+            if idx in rep:
+                x, y, w, h = unique_src[rep[idx]][1]
+                paste(rep[idx], frame[y:y + h, x:x + w])
+
+    sheets, encoding, gpu, raw_pages = write_sheets(spec, pages)
+    del pages
+
+    frame_meta = []
+    for box, u in zip(boxes, frame_unique):
+        if u is None:
+            frame_meta.append({"empty": True})
+            continue
+        page, x, y = placements[u]
+        frame_meta.append({"page": page, "rect": [x, y, box[2], box[3]], "offset": [box[0], box[1]]})
+
+    meta = {
+        "id": spec.id,
+        "frames": len(frame_meta),
+        "fps": spec.fps,
+        "loops": spec.loops,
+        "sheet": sheets[0] if sheets else None,
+        "sheets": sheets,
+        "page_sizes": [list(s) for s in page_sizes],
+        "frame_size": [fw, fh],
+        "crop": processed.get("crop"),   # 原始畫面中的裁切區 (x, y, w, h)，縮放前座標
+        "scale": processed.get("scale"),
+        "loop": processed.get("loop"),   # 循環接縫修補：原始影格區間 [start, end]、crossfade 格數、修補前後的 loopError
+        "premultiplied_alpha": processed.get("premultiplied", False),
+        "atlas_group": spec.atlas_group or spec.category,
+        "unique_frames": len(unique_src),
+        "encoding": encoding,
+        "gpu_textures": gpu,             # 格式 -> {files（與 sheets 對應）, bytes, psnr（最差頁）, block, gl_internal_format}
+        "raw_pages": raw_pages,          # 頁面名稱 -> 量化前頁面的 sha256（atlas 的快取 key；manifest 不輸出）
+        "frame_rects": frame_meta
+    }
+    meta_path.write_text(json.dumps(meta, indent=2))
+    logger.info(f"[pack] {spec.id}: {len(frame_meta)} frames ({len(unique_src)} unique) "
+                f"-> {len(sheets)} page(s) {page_sizes}, {encoding['bytes'] / 1024:.1f}KB "
+                f"({'palette' if encoding.get('colors') else 'rgba'}, psnr={encoding['psnr']})")
+    return PackagingResult(
+        spritesheet_path=str(ASSETS_DIR / sheets[0]) if sheets else None,
+        webm_path=None,
+        meta_json=meta
+    )
+
+
+def changed_masks(prev: Optional[np.ndarray], chunk: np.ndarray) -> np.ndarray:
+    """(n, H, W) bool：每格與前一格不同的像素；prev 為上一個 chunk 的最後一格（第一格為 None 時全部視為變動）。"""
+    if prev is None:
+        diff = np.ones(chunk.shape[:3], bool)
+        diff[1:] = (chunk[1:] != chunk[:-1]).any(axis=-1)
+        return diff
+    stacked = np.concatenate([prev[None], chunk])
+    return (stacked[1:] != stacked[:-1]).any(axis=-1)
+
+
+def dirty_rects(mask: np.ndarray, tile: int = DELTA_TILE) -> List[Rect]:
+    """變動像素 mask (H, W) -> 覆蓋所有變動 tile 的 rect：同一 tile 列連續的 tile 合成一段，
+    上下相鄰且範圍相同的段再合併。rect 截在畫面內。"""
+    h, w = mask.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((th * tile, tw * tile), bool)
+    padded[:h, :w] = mask
+    tiles = padded.reshape(th, tile, tw, tile).any(axis=(1, 3))
+    rects: List[List[int]] = []
+    open_runs: Dict[Tuple[int, int], int] = {}   # (起點, 長度) -> rects 索引（上一列延續中的段）
+    for ty in range(th):
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], tiles[ty].astype(np.int8), [0]])))
+        runs = list(zip(edges[::2], edges[1::2] - edges[::2]))
+        next_open = {}
+        for tx, n in runs:
+            key = (int(tx), int(n))
+            if key in open_runs:
+                rects[open_runs[key]][3] += 1
+                next_open[key] = open_runs[key]
+            else:
+                next_open[key] = len(rects)
+                rects.append([int(tx), ty, int(n), 1])
+        open_runs = next_open
+    out = []
+    for tx, ty, n, m in rects:
+        x, y = tx * tile, ty * tile
+        out.append((x, y, min(n * tile, w - x), min(m * tile, h - y)))
+    return out
+
+
+def package_delta(processed: dict, spec: EffectSpec) -> PackagingResult:
     ASSETS_DIR.mkdir(parents=True, exist_ok=True)
-    sheet_path = ASSETS_DIR / f"{spec.id}_sheet.png"
     meta_path = ASSETS_DIR / f"{spec.id}_sheet.json"
+    source = open_processed(processed)
+    fw, fh = source.size
+
+    # pass 1：每格決定 keyframe（完整 trim 影格）或 dirty rect，相同內容的區塊共用
+    plans: List[Tuple[bool, List[Rect]]] = []   # 每格 (是否 keyframe, 要存的區塊)
+    region_keys: Dict[str, int] = {}
+    regions: List[Tuple[int, Rect]] = []        # 區塊索引 -> (影格索引, rect)
+    frame_regions: List[List[int]] = []
+    full_area = stored_area = 0
+    prev = None
+    idx = 0
+    for chunk in source.chunks():
+        masks = changed_masks(prev, chunk)
+        for k in range(len(chunk)):
+            frame = chunk[k]
+            box = trim_box(frame)
+            trim_area = box[2] * box[3] if box else 0
+            full_area += trim_area
+            rects = dirty_rects(masks[k]) if prev is not None or k > 0 else None
+            if rects is not None and sum(w * h for _, _, w, h in rects) <= DELTA_KEY_RATIO * trim_area:
+                key_frame, stored = False, rects
+            else:
+                key_frame, stored = True, [box] if box else []
+            ids = []
+            for x, y, w, h in stored:
+                key = frame_key(frame[y:y + h, x:x + w], shift=0)
+                if key not in region_keys:
+                    region_keys[key] = len(regions)
+                    regions.append((idx, (x, y, w, h)))
+                    stored_area += w * h
+                ids.append(region_keys[key])
+            plans.append((key_frame, stored))
+            frame_regions.append(ids)
+            idx += 1
+        prev = chunk[-1].copy()
+
+    placements, page_sizes = pack_rects([(r[2], r[3]) for _, r in regions])
+    pages = [np.zeros((h, w, 4), np.uint8) for w, h in page_sizes]
+    by_frame: Dict[int, List[int]] = {}
+    for u, (i, _) in enumerate(regions):
+        by_frame.setdefault(i, []).append(u)
+    # pass 2：把各區塊貼進頁面（postprocess 輸出為 memmap，重讀不需解碼）
+    for i, frame in enumerate(source.frames()):
+        for u in by_frame.get(i, ()):
+            page, px, py = placements[u]
+            x, y, w, h = regions[u][1]
+            pages[page][py:py + h, px:px + w] = frame[y:y + h, x:x + w]
+    sheets, encoding, gpu, raw_pages = write_sheets(spec, pages)
+    del pages
 
-    # 建立一張 512x512 (或解析度拆寬高) 顏色塊圖片
-    try:
-        w, h = map(int, spec.resolution.lower().split('x'))
-    except Exception:
-        w, h = 512, 512
-    img = Image.new('RGBA', (w, h), (random.randint(0,255), random.randint(0,255), random.randint(0,255), 255))
-    d = ImageDraw.Draw(img)
-    d.text((10,10), spec.id, fill=(255,255,255,255))
-    img.save(sheet_path)
+    frame_meta = []
+    for (key_frame, stored), ids in zip(plans, frame_regions):
+        rects = []
+        for (x, y, w, h), u in zip(stored, ids):
+            page, px, py = placements[u]
+            rects.append({"page": page, "rect": [px, py, w, h], "offset": [x, y]})
+        if key_frame:
+            frame_meta.append(dict(rects[0], key=True) if rects else {"key": True, "empty": True})
+        else:
+            frame_meta.append({"rects": rects})
 
     meta = {
         "id": spec.id,
-        "frames": 1,
+        "frames": len(frame_meta),
         "fps": spec.fps,
         "loops": spec.loops,
-        "sheet": sheet_path.name
+        "sheet": sheets[0] if sheets else None,
+        "sheets": sheets,
+        "page_sizes": [list(s) for s in page_sizes],
+        "frame_size": [fw, fh],
+        "crop": processed.get("crop"),
+        "scale": processed.get("scale"),
+        "loop": processed.get("loop"),
+        "premultiplied_alpha": processed.get("premultiplied", False),
+        "atlas_group": spec.atlas_group or spec.category,
+        # 還原：key 影格先清空畫面再貼上 rect；其餘影格把 rects 依序以取代方式貼到上一格上（rects 為空表示與上一格相同）
+        "frame_encoding": {"mode": "delta", "tile": DELTA_TILE, "blend": "replace",
+                           "keyframes": sum(1 for k, _ in plans if k),
+                           "stored_area": stored_area, "full_area": full_area},
+        "unique_frames": len(regions),
+        "encoding": encoding,
+        "gpu_textures": gpu,
+        "raw_pages": raw_pages,
+        "frame_rects": frame_meta
     }
     meta_path.write_text(json.dumps(meta, indent=2))
-    logger.info(f"[pack] sheet + meta generated for {spec.id}")
+    saved = 1 - stored_area / full_area if full_area else 0.0
+    logger.info(f"[pack] {spec.id}: {len(frame_meta)} frames ({meta['frame_encoding']['keyframes']} key) "
+                f"-> {len(regions)} rects, area {stored_area}/{full_area} px (-{saved:.0%}), "
+                f"{len(sheets)} page(s) {page_sizes}, {encoding['bytes'] / 1024:.1f}KB")
     return PackagingResult(
-        spritesheet_path=str(sheet_path),
+        spritesheet_path=str(ASSETS_DIR / sheets[0]) if sheets else None,
         webm_path=None,
         meta_json=meta
     )
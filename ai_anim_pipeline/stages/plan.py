@@ -1,22 +1,39 @@
 from loguru import logger
 from typing import List
 from ..core import EffectSpec, PromptPlan
-import random
+import hashlib
 
 PROMPT_TEMPLATES = {
     "symbolWin": "Generate a short slot symbol win animation for {id}. Energetic burst, subtle scale pulse (8%), golden light sweep. {duration}s @ {fps}fps.",
     "backgroundLoop": "Create a seamless atmospheric loop background for {id}. Soft ambient motion, subtle depth fog. {duration}s @ {fps}fps loop.",
 }
 
+def derive_seeds(spec_id: str, count: int) -> List[int]:
+    """由 spec.id 雜湊推導 seeds（1000~9998 不重複）；同一 spec 重跑得到相同 seeds，快取才能命中。"""
+    seeds = []
+    i = 0
+    while len(seeds) < count:
+        digest = hashlib.sha256(f"{spec_id}:{i}".encode('utf-8')).digest()
+        seed = 1000 + int.from_bytes(digest[:8], 'big') % 8999
+        if seed not in seeds:
+            seeds.append(seed)
+        i += 1
+    return seeds
+
 def build_prompt(spec: EffectSpec) -> PromptPlan:
     template = PROMPT_TEMPLATES.get(spec.category, PROMPT_TEMPLATES["symbolWin"])  # fallback
     prompt = template.format(id=spec.id, duration=spec.duration_sec, fps=spec.fps)
-    seed_list = random.sample(range(1000, 9999), spec.variant_count)
+    seed_list = derive_seeds(spec.id, spec.variant_count)
     logger.info(f"[plan] {spec.id} prompt built. seeds={seed_list}")
     return PromptPlan(
         id=spec.id,
         prompt=prompt,
         seed_list=seed_list,
         tags=[spec.category],
-        technical_notes={"loops": str(spec.loops)}
+        technical_notes={
+            "loops": str(spec.loops),
+            "resolution": spec.resolution,
+            "fps": str(spec.fps),
+            "duration_sec": str(spec.duration_sec),
+        }
     )
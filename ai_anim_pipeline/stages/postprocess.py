@@ -1,13 +1,145 @@
 from loguru import logger
 from pathlib import Path
-from ..core import GenerationResult, EffectSpec
+from typing import Optional, Tuple
+from ..core import OUTPUT_DIR, GenerationResult, EffectSpec, parse_resolution
+from ..core import color, framecache, loopseam
+from ..core import frames as frames_mod
+from ..core.frames import FrameSource
+import json
+import math
+import numpy as np
 
-# 偽後處理：僅複製檔案並標記已處理
+PROCESSED_DIR = OUTPUT_DIR / 'temp' / 'processed'
+LANCZOS_SUPPORT = 3
 
-def process(gen: GenerationResult, spec: EffectSpec):
-    out_dir = Path(__file__).parent.parent / 'output' / 'temp' / 'processed'
-    out_dir.mkdir(parents=True, exist_ok=True)
-    marker = out_dir / f"{gen.variant_id}_processed.flag"
-    marker.write_text("processed")
-    logger.info(f"[postprocess] processed marker created for {gen.variant_id}")
-    return {"processed_flag": str(marker)}
+# 後處理：整段 clip 以 NumPy 向量化處理，輸出到 memory-mapped .npy 給 pack 直接讀（不必再解碼）
+# pass 1：串流取所有影格 alpha 的聯集外框 (union-of-alpha crop) 並計算格數
+# pass 2：逐 chunk 裁切 -> sRGB 轉 linear -> premultiply -> 縮到 spec.resolution（可分離 Lanczos-3，
+#         以兩次矩陣乘法套用到整個 chunk）-> 轉回 sRGB，輸出 premultiplied sRGB uint8
+# 只縮小不放大；不需縮放時直接在 sRGB 上 premultiply。
+# 有 loop_plan（evaluate 找到的循環接縫）時只輸出 [start, end]，需要時把尾端 crossfade 到 start 前的影格，
+# 寫完後以輸出首尾兩格重新量 loopError（直接讀 memmap，不必重新解碼或生成）。
+
+
+def union_alpha_box(source: FrameSource) -> Tuple[Optional[Tuple[int, int, int, int]], int]:
+    """回傳 (所有影格 alpha > 0 的聯集外框 (x, y, w, h)，格數)；全透明時外框為 None。"""
+    w, h = source.size
+    mask = np.zeros((h, w), bool)
+    count = 0
+    for chunk in source.chunks():
+        mask |= (chunk[..., 3] > 0).any(axis=0)
+        count += len(chunk)
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None, count
+    cols = np.flatnonzero(mask.any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)), count
+
+
+def resample_matrix(in_size: int, out_size: int, support: float = LANCZOS_SUPPORT) -> np.ndarray:
+    """(out_size, in_size) 的 Lanczos 縮放權重（縮小時依比例放寬 kernel 以抗鋸齒），每列總和為 1。"""
+    scale = in_size / out_size
+    filter_scale = max(scale, 1.0)
+    centers = (np.arange(out_size) + 0.5) * scale
+    d = ((np.arange(in_size) + 0.5)[None, :] - centers[:, None]) / filter_scale
+    w = np.sinc(d) * np.sinc(d / support)
+    w[np.abs(d) >= support] = 0
+    return (w / w.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def resize_chunk(chunk: np.ndarray, wy: np.ndarray, wx: np.ndarray) -> np.ndarray:
+    """(n, H, W, 4) float -> (n, h, w, 4)：先垂直再水平，各一次 batched matmul。"""
+    n, h, w, c = chunk.shape
+    tmp = np.matmul(wy, chunk.reshape(n, h, w * c)).reshape(n, wy.shape[0], w, c)
+    return np.matmul(tmp.transpose(0, 1, 3, 2), wx.T).transpose(0, 1, 3, 2)
+
+
+def target_scale(source_size, spec: EffectSpec) -> float:
+    tw, th = parse_resolution(spec.resolution)
+    sw, sh = source_size
+    return min(1.0, tw / sw, th / sh)
+
+
+def convert(cropped: np.ndarray, wy: Optional[np.ndarray], wx: Optional[np.ndarray]) -> np.ndarray:
+    """裁切後的 straight sRGB uint8 影格 -> 縮放後的 premultiplied sRGB uint8。"""
+    if wy is None:
+        return color.premultiply_u8(cropped)
+    lin = color.premultiply(color.srgb_to_linear(cropped))
+    lin = color.unpremultiply(np.clip(resize_chunk(lin, wy, wx), 0, 1))
+    srgb = np.concatenate([color.linear_to_srgb(lin[..., :3]), lin[..., 3:]], axis=-1)
+    return color.to_u8(color.premultiply(srgb))
+
+
+def process(gen: GenerationResult, spec: EffectSpec, loop_plan: Optional[dict] = None):
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    source = framecache.source(gen.video_path, gen.variant_id, fps=spec.fps)
+    box, count = union_alpha_box(source)
+    sw, sh = source.size
+    x, y, cw, ch = box or (0, 0, sw, sh)
+    scale = target_scale((sw, sh), spec)
+    ow, oh = max(1, math.ceil(cw * scale)), max(1, math.ceil(ch * scale))
+    resize = (ow, oh) != (cw, ch)
+    wy = resample_matrix(ch, oh) if resize else None
+    wx = resample_matrix(cw, ow) if resize else None
+
+    start, end = 0, count - 1
+    lead = None
+    if loop_plan and spec.loops:
+        start, end = int(loop_plan["start"]), min(int(loop_plan["end"]), count - 1)
+        if loop_plan.get("crossfade"):
+            leads = loopseam.lead_range(loop_plan)
+            lead = np.empty((len(leads), oh, ow, 4), np.uint8)
+    # 需要處理的第一格（含 crossfade 用的前導影格）
+    first = start if lead is None else leads.start
+
+    frames_path = PROCESSED_DIR / f"{gen.variant_id}_frames.npy"
+    out = np.lib.format.open_memmap(frames_path, mode='w+', dtype=np.uint8, shape=(end - start + 1, oh, ow, 4))
+    i = 0
+    # float32 中間結果為 uint8 的 4 倍，chunk 相應縮小
+    for chunk in source.chunks(max(1, frames_mod.DEFAULT_CHUNK_BYTES // 4)):
+        lo, hi = i, i + len(chunk)
+        i = hi
+        a, b = max(lo, first), min(hi, end + 1)
+        if a >= b:
+            if lo > end:
+                break
+            continue
+        converted = convert(chunk[a - lo:b - lo, y:y + ch, x:x + cw], wy, wx)
+        wa = max(a, start)
+        if wa < b:
+            out[wa - start:b - start] = converted[wa - a:]
+        if lead is not None and a <= leads[-1]:
+            la, lb = max(a, first), min(b, leads[-1] + 1)
+            lead[la - first:lb - first] = converted[la - a:lb - a]
+    if lead is not None:
+        n = int(loop_plan["crossfade"])
+        out[-n:] = loopseam.crossfade(out[-n:], lead)
+    loop = None
+    if loop_plan and spec.loops:
+        # 重新量修補後的接縫（全解析度；loop_error 需要 straight alpha）
+        error = loopseam.loop_error(color.unpremultiply_u8(out[0]), color.unpremultiply_u8(out[-1]))
+        loop = dict(loop_plan, error=round(error, 6))
+    out.flush()
+    frames_out = len(out)
+    del out
+
+    info = {
+        "video_path": gen.video_path,
+        "frames_path": str(frames_path),
+        "fps": spec.fps,
+        "frames": frames_out,
+        "width": ow,
+        "height": oh,
+        "source_size": [sw, sh],
+        "crop": [x, y, cw, ch],
+        "scale": round(scale, 6),
+        "premultiplied": True,
+        "color_space": "srgb",
+    }
+    if loop:
+        info["loop"] = loop
+    marker = PROCESSED_DIR / f"{gen.variant_id}_processed.json"
+    marker.write_text(json.dumps(info, indent=2))
+    logger.info(f"[postprocess] {gen.variant_id}: {frames_out}/{count} frames, crop {cw}x{ch}@({x},{y}) "
+                f"-> {ow}x{oh} premultiplied" + (f", loop {loop}" if loop else ""))
+    return dict(info, processed_path=str(marker))
@@ -2,11 +2,51 @@ from pathlib import Path
 from loguru import logger
 import statistics
 import json
-from typing import List, Dict
+from collections import Counter
+from typing import List, Dict, Optional
+from ..core import OUTPUT_DIR
+from ..core.history import sparkline
 
-REPORT_DIR = Path(__file__).parent.parent / 'output' / 'reports'
+REPORT_DIR = OUTPUT_DIR / 'reports'
 
-def generate(kpi_records: List[Dict], output_dir: str = None):
+def _history_md(history: dict) -> List[str]:
+    """執行歷史（core/history.py: HistoryStore.analyze）的趨勢、百分位數與退步標記。"""
+    md = ["", f"## History (run {history['run_id']}, baseline = previous {history['window']} runs)", "",
+          "| Run | Effects | Passed | Pass Rate | Asset KB |", "| --- | --- | --- | --- | --- |"]
+    md += [f"| {r['run_id']} | {r['total']} | {r['passed']} | {r['pass_rate']} | {r['asset_bytes'] / 1024:.1f} |"
+           for r in history["runs"]]
+    regressions = history["regressions"]
+    md += ["", "### Regressions", ""]
+    if regressions:
+        md += ["| Kind | Effect | Stage | Current | Baseline | Ratio |", "| --- | --- | --- | --- | --- | --- |"]
+        md += [f"| {r['kind']} | {r['effect'] or '-'} | {r.get('stage') or '-'} | {r['current']} | {r['baseline']} "
+               f"| {r.get('ratio') or '-'} |" for r in regressions]
+    else:
+        md.append("None.")
+    stage_p = history["percentiles"]["stage_sec"]
+    if stage_p:
+        md += ["", "### Stage Time Percentiles (uncached, per effect)", "",
+               "| Stage | Samples | p50 (s) | p90 (s) | p95 (s) | Max (s) |", "| --- | --- | --- | --- | --- | --- |"]
+        md += [f"| {name} | {p['count']} | {p['p50']} | {p['p90']} | {p['p95']} | {p['max']} |"
+               for name, p in stage_p.items()]
+    size_p = history["percentiles"]["asset_kb"]
+    if size_p:
+        md += ["", f"Asset size percentiles (KB, this run): p50 {size_p['p50']}, p90 {size_p['p90']}, "
+                   f"p95 {size_p['p95']}, max {size_p['max']}"]
+    if history["trends"]:
+        md += ["", "### Effect Trends", "", "| Effect | Size Trend | Latest KB | Pass Trend | Variant Pass Rate |",
+               "| --- | --- | --- | --- | --- |"]
+        for effect, t in history["trends"].items():
+            latest = t["asset_bytes"][-1]
+            rate = t.get("variant_pass_rate", [None])[-1]
+            md.append(f"| {effect} | `{sparkline(t['asset_bytes'])}` | {'-' if latest is None else f'{latest / 1024:.1f}'} "
+                      f"| `{''.join('-' if v is None else ('✓' if v else '✗') for v in t['pass'])}` "
+                      f"| {'-' if rate is None else round(rate, 2)} |")
+    return md
+
+
+def generate(kpi_records: List[Dict], output_dir: str = None, stage_stats: Optional[Dict[str, dict]] = None,
+             history: Optional[dict] = None):
     REPORT_DIR.mkdir(parents=True, exist_ok=True)
     if output_dir:
         out = Path(output_dir)
@@ -18,11 +58,25 @@ def generate(kpi_records: List[Dict], output_dir: str = None):
     brightness_vals = [r.get('brightnessAvg') for r in kpi_records if r.get('brightnessAvg') is not None]
     size_vals = [r.get('sizeKB') for r in kpi_records if r.get('sizeKB') is not None]
 
+    # 各 QA 規則淘汰的變體數（evaluate 依成本排序後第一個不通過的規則）
+    rejections = Counter(rule for r in kpi_records for rule in r.get('rejected_by', []) if rule)
+
+    # loops=true 中靠接縫修補（裁切 / crossfade）通過、不必重新生成的 effect 數
+    loop_repaired = sum(1 for r in kpi_records if r.get('loopErrorRaw') is not None)
+
     summary = {
         'total': len(kpi_records),
         'brightness_avg': round(statistics.mean(brightness_vals), 3) if brightness_vals else None,
-        'size_avg_kb': round(statistics.mean(size_vals), 2) if size_vals else None
+        'size_avg_kb': round(statistics.mean(size_vals), 2) if size_vals else None,
+        'rejections': dict(sorted(rejections.items())),
+        'loop_repaired': loop_repaired
     }
+    # --trace 時附上各 stage 耗時統計（trace.stage_summary）
+    if stage_stats:
+        summary['stages'] = stage_stats
+    # 與前 N 次執行比較的趨勢與退步標記
+    if history:
+        summary['history'] = history
 
     (out / 'summary.json').write_text(json.dumps(summary, indent=2))
     md = ["# KPI Summary", "", f"Total Variants: {summary['total']}"]
@@ -30,6 +84,28 @@ def generate(kpi_records: List[Dict], output_dir: str = None):
         md.append(f"Average Brightness: {summary['brightness_avg']}")
     if summary['size_avg_kb']:
         md.append(f"Average Size (KB): {summary['size_avg_kb']}")
+    if loop_repaired:
+        md.append(f"Loop Seams Repaired: {loop_repaired}")
+    if rejections:
+        md += ["", "## QA Rejections", "", "| Rule | Variants |", "| --- | --- |"]
+        md += [f"| {rule} | {n} |" for rule, n in sorted(rejections.items())]
+    if stage_stats:
+        md += ["", "## Stage Timing", "",
+               "| Stage | Calls | Wall (s) | p50 (s) | p95 (s) | Max (s) | Thread CPU (s) | Process Peak RSS +KB "
+               "| Process Written KB | Histogram |",
+               "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |"]
+        # 行程層級欄位只來自主 thread 的 span，全在 thread pool 執行的 stage 顯示 -
+        for name, s in stage_stats.items():
+            rss, written = s['proc_peak_rss_delta_kb'], s['proc_bytes_written']
+            md.append(f"| {name} | {s['count']} | {s['wall_sec']} | {s['p50_sec']} | {s['p95_sec']} | {s['max_sec']} "
+                      f"| {s['cpu_sec']} | {'-' if rss is None else rss} "
+                      f"| {'-' if written is None else f'{written / 1024:.1f}'} | `{s['histogram']}` |")
+    if history:
+        md += _history_md(history)
     (out / 'summary.md').write_text("\n".join(md))
+    if history and history["regressions"]:
+        logger.warning(f"[report] {len(history['regressions'])} regression(s) vs previous {history['window']} runs: "
+                       + ", ".join(f"{r['kind']}:{r['effect'] or '-'}" + (f"/{r['stage']}" if r.get('stage') else '')
+                                   for r in history["regressions"][:10]))
     logger.info(f"[report] summary generated -> {out}")
     return summary
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# 測試不寫入正式的 output/（core.OUTPUT_DIR 在匯入時讀取此環境變數）
+os.environ.setdefault('AI_ANIM_OUTPUT_DIR', tempfile.mkdtemp(prefix='ai_anim_test_'))
@@ -0,0 +1,71 @@
+import numpy as np
+from PIL import Image
+
+from ai_anim_pipeline.core import EffectSpec
+from ai_anim_pipeline.stages import atlas, pack
+
+
+def _item(effect_id, group="ui", rects=1):
+    frames = [{"page": 0, "rect": [i * 10, 0, 8, 8], "offset": [0, 0]} for i in range(rects)]
+    return {"id": effect_id, "atlas_group": group, "sheets": [f"{effect_id}_sheet.png"], "frame_rects": frames}
+
+
+def test_groups_skip_videos_and_singletons():
+    items = [_item("a"), _item("b", "fx"), _item("c"), {"id": "v", "atlas_group": "ui", "sheets": [], "frame_rects": []},
+             {"id": "w", "atlas_group": "ui", "webm": "w_loop.webm"}]
+    assert atlas.groups(items) == {"ui": [0, 2]}
+
+
+def test_split_by_effect_count(monkeypatch):
+    monkeypatch.setattr(atlas, "MAX_GROUP_EFFECTS", 3)
+    items = [_item(f"e{i}") for i in range(7)]
+    # 依 manifest 順序切段；最後只剩一個 effect 的段不做 atlas
+    assert atlas.groups(items) == {"ui#0": [0, 1, 2], "ui#1": [3, 4, 5]}
+
+
+def test_split_by_rect_count(monkeypatch):
+    monkeypatch.setattr(atlas, "MAX_GROUP_RECTS", 10)
+    items = [_item("a", rects=4), _item("b", rects=4), _item("c", rects=20), _item("d", rects=3), _item("e", rects=3)]
+    # c 單獨就超過上限，自成一段（單一 effect，不做 atlas）
+    assert atlas._split(list(range(5)), items) == [[0, 1], [2], [3, 4]]
+    assert atlas.groups(items) == {"ui#0": [0, 1], "ui#2": [3, 4]}
+
+
+def test_duplicate_rects_counted_once():
+    item = _item("a", rects=2)
+    item["frame_rects"] += item["frame_rects"] + [{"empty": True}]
+    assert atlas._rect_count(item) == 2
+
+
+def _packed_item(tmp_path, effect_id, colour):
+    frames = np.zeros((3, 16, 16, 4), np.uint8)
+    for i in range(3):
+        frames[i, 2:10, 2 + i:10 + i] = (*colour, 255 - 40 * i)
+    path = tmp_path / f"{effect_id}.npy"
+    np.save(path, frames)
+    spec = EffectSpec(id=effect_id, category="ui", resolution="16x16", duration_sec=0.25, fps=12, loops=False,
+                      packaging="sheet")
+    return pack.package({"frames_path": str(path), "fps": 12}, spec).meta_json
+
+
+def _regions(item, page_dir):
+    out = []
+    for f in item["frame_rects"]:
+        for r in atlas.regions(f):
+            x, y, w, h = r["rect"]
+            with Image.open(page_dir(item["sheets"][r["page"]])) as im:
+                out.append(np.asarray(im.convert('RGBA'))[y:y + h, x:x + w])
+    return out
+
+
+def test_pack_group_preserves_pixels(tmp_path):
+    members = [_packed_item(tmp_path, "atlas_a", (255, 0, 0)), _packed_item(tmp_path, "atlas_b", (0, 0, 255))]
+    packed = atlas.pack_group("ui", members)
+    for m in members:
+        moved = atlas.apply(m, "ui", packed)
+        assert moved["atlas"]["standalone_sheets"] == m["sheets"]
+        before = _regions(m, pack.raw_page_path)
+        after = _regions(moved, lambda n: pack.ASSETS_DIR / n)
+        assert len(before) == len(after) == 3
+        for a, b in zip(before, after):
+            np.testing.assert_array_equal(a, b)
@@ -0,0 +1,50 @@
+import json
+
+from ai_anim_pipeline.cli import benchmark
+
+
+def _results(eps=10.0, rss=100.0, p50=1.0, p95=2.0, effects=100, jobs=2):
+    return {"version": benchmark.RESULTS_VERSION, "runs": [{
+        "effects": effects, "jobs": jobs, "effects_per_sec": eps, "peak_rss_mb": rss,
+        "stages": {"pack": {"p50_sec": p50, "p95_sec": p95}},
+    }]}
+
+
+def _flags(rows):
+    return {metric for _, metric, _, _, _, regressed in rows if regressed}
+
+
+def test_no_regression_within_threshold():
+    assert _flags(benchmark.compare(_results(), _results(eps=9.5, rss=105, p95=2.1))) == set()
+
+
+def test_throughput_memory_and_stage_regressions():
+    rows = benchmark.compare(_results(), _results(eps=8.0, rss=130, p50=1.2))
+    assert _flags(rows) == {"effects_per_sec", "peak_rss_mb", "pack.p50_sec"}
+    change = {metric: c for _, metric, _, _, c, _ in rows}
+    assert round(change["effects_per_sec"], 3) == -0.2
+
+
+def test_improvements_are_not_regressions():
+    assert _flags(benchmark.compare(_results(), _results(eps=20, rss=50, p50=0.5, p95=1.0))) == set()
+
+
+def test_small_stage_delta_is_noise():
+    # 毫秒級 stage：相對變化大但絕對差距 < MIN_STAGE_DELTA_SEC
+    base, new = _results(p50=0.001, p95=0.002), _results(p50=0.004, p95=0.006)
+    assert _flags(benchmark.compare(base, new)) == set()
+
+
+def test_threshold_and_unmatched_runs():
+    assert _flags(benchmark.compare(_results(), _results(eps=9.0), threshold=0.05)) == {"effects_per_sec"}
+    # 規模或 jobs 不同的執行不比較
+    assert benchmark.compare(_results(), _results(eps=1.0, jobs=4)) == []
+
+
+def test_compare_command_exit_code(tmp_path):
+    base, new = tmp_path / 'base.json', tmp_path / 'new.json'
+    base.write_text(json.dumps(_results()))
+    new.write_text(json.dumps(_results()))
+    assert benchmark.main(['compare', str(base), str(new)]) == 0
+    new.write_text(json.dumps(_results(eps=5.0)))
+    assert benchmark.main(['compare', str(base), str(new)]) == 1
@@ -0,0 +1,49 @@
+from ai_anim_pipeline.core import cache
+from ai_anim_pipeline.core.cache import StageCache
+from ai_anim_pipeline.stages import atlas
+
+
+def _closure(path):
+    cache._source_hash.cache_clear()
+    cache._import_closure_hash.cache_clear()
+    return cache._import_closure_hash(str(path))
+
+
+def test_code_version_follows_transitive_imports(tmp_path):
+    pkg = tmp_path / 'pkg'
+    (pkg / 'stages').mkdir(parents=True)
+    (pkg / 'core').mkdir()
+    (pkg / 'core' / '__init__.py').write_text("")
+    (pkg / 'core' / 'util.py').write_text("X = 1\n")
+    (pkg / 'stages' / 'pack.py').write_text("from ..core import util\n")
+    (pkg / 'stages' / 'atlas.py').write_text("from .pack import something\n")
+    (pkg / 'unrelated.py').write_text("Y = 1\n")
+    before = _closure(pkg / 'stages' / 'atlas.py')
+    (pkg / 'unrelated.py').write_text("Y = 2\n")
+    assert _closure(pkg / 'stages' / 'atlas.py') == before
+    (pkg / 'core' / 'util.py').write_text("X = 2\n")
+    assert _closure(pkg / 'stages' / 'atlas.py') != before
+
+
+def test_run_hit_and_artifact_invalidation(tmp_path):
+    store = StageCache(tmp_path / 'cache')
+    out = tmp_path / 'out.txt'
+    calls = []
+
+    def compute():
+        calls.append(1)
+        out.write_text("data")
+        return {"path": str(out)}
+
+    first, digest = store.run(atlas, ("k",), compute, artifacts=lambda v: [v["path"]])
+    again, digest2 = store.run(atlas, ("k",), compute, artifacts=lambda v: [v["path"]])
+    assert first == again and digest == digest2 and len(calls) == 1
+    out.write_text("changed")
+    store.run(atlas, ("k",), compute, artifacts=lambda v: [v["path"]])
+    assert len(calls) == 2
+
+
+def test_sheet_digests_use_recorded_hashes():
+    # 記錄過的 sha256 直接使用，不讀檔（頁面檔不存在也不會出錯）
+    members = [{"sheets": ["missing_a.png", "missing_b.png"], "raw_pages": {"missing_a.png": "aa", "missing_b.png": "bb"}}]
+    assert atlas.sheet_digests(members) == ["aa", "bb"]
@@ -0,0 +1,99 @@
+import textwrap
+
+import pytest
+
+from ai_anim_pipeline.core import catalog
+
+
+def _write(path, *parts):
+    path.write_text(''.join(textwrap.dedent(p) for p in parts), encoding='utf-8')
+    return path
+
+
+def _load(path):
+    return catalog.load_effect_specs(path, cache_dir=None, workers=1)
+
+
+BASE = """
+templates:
+  symbol_base: {category: symbolWin, duration_sec: 0.5, fps: 24, loops: false, qa_rules: {max_size_kb: 400}}
+  strict: {qa_rules: {max_brightness: 0.9}}
+"""
+
+
+def test_extends_and_dict_merge(tmp_path):
+    path = _write(tmp_path / 'c.yaml', BASE, """
+    effects:
+      - id: lion
+        extends: [symbol_base, strict]
+        resolution: 256x256
+        qa_rules: {max_size_kb: 300}
+    """)
+    (spec,) = _load(path)
+    assert spec.category == "symbolWin" and spec.fps == 24
+    assert spec.qa_rules == {"max_size_kb": 300, "max_brightness": 0.9}
+
+
+def test_matrix_expansion(tmp_path):
+    path = _write(tmp_path / 'c.yaml', BASE, """
+    effects:
+      - id: "symbol_win_{symbol}_{resolution}"
+        extends: symbol_base
+        atlas_group: "symbols_{resolution}"
+        matrix: {symbol: [lion, tiger], resolution: [256x256, 512x512]}
+    """)
+    specs = _load(path)
+    assert [s.id for s in specs] == ["symbol_win_lion_256x256", "symbol_win_lion_512x512",
+                                     "symbol_win_tiger_256x256", "symbol_win_tiger_512x512"]
+    assert [s.resolution for s in specs[:2]] == ["256x256", "512x512"]
+    assert specs[1].atlas_group == "symbols_512x512"
+
+
+def test_templates_visible_in_later_shards_only(tmp_path):
+    d = tmp_path / 'shards'
+    d.mkdir()
+    _write(d / '01.yaml', BASE, """
+    effects:
+      - {id: a, extends: symbol_base, resolution: 64x64}
+    """)
+    _write(d / '02.yaml', """
+    effects:
+      - {id: b, extends: symbol_base, resolution: 64x64}
+    """)
+    assert [s.id for s in _load(d)] == ["a", "b"]
+    (d / '00.yaml').write_text("effects:\n  - {id: z, extends: symbol_base, resolution: 64x64}\n")
+    with pytest.raises(ValueError, match="unknown template"):
+        _load(d)
+
+
+def test_errors(tmp_path):
+    cycle = _write(tmp_path / 'cycle.yaml', """
+    templates:
+      x: {extends: y}
+      y: {extends: x}
+    effects:
+      - {id: a, extends: x}
+    """)
+    with pytest.raises(ValueError, match="template cycle"):
+        _load(cycle)
+    dup = _write(tmp_path / 'dup.yaml', BASE, """
+    effects:
+      - {id: a, extends: symbol_base, resolution: 64x64}
+      - {id: "{n}", extends: symbol_base, resolution: 64x64, matrix: {n: [a]}}
+    """)
+    with pytest.raises(ValueError, match="duplicate effect ids"):
+        _load(dup)
+    bad = _write(tmp_path / 'bad.yaml', BASE, """
+    effects:
+      - {id: "{missing}", extends: symbol_base, resolution: 64x64, matrix: {n: [1]}}
+    """)
+    with pytest.raises(ValueError, match="cannot expand"):
+        _load(bad)
+
+
+def test_parse_cache(tmp_path):
+    path = _write(tmp_path / 'c.yaml', BASE, "effects: []\n")
+    cache_dir = tmp_path / 'cache'
+    first = catalog.parse_shard(path, cache_dir)
+    assert list(cache_dir.iterdir())
+    assert catalog.parse_shard(path, cache_dir) == first
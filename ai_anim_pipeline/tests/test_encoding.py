@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from ai_anim_pipeline.core import encoding
+
+
+def _pages():
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:128, 0:128]
+    page = np.zeros((128, 128, 4), np.uint8)
+    page[..., 0] = xx * 2
+    page[..., 1] = yy * 2
+    page[..., 2] = rng.integers(0, 256, (128, 128))  # 雜訊讓無損壓不小
+    page[..., 3] = np.clip(255 - np.hypot(xx - 64, yy - 64) * 3, 0, 255)
+    return [page, page[:64].copy()]
+
+
+def _lossless_bytes(pages):
+    datas, _ = encoding.encode_pages(pages)
+    return sum(map(len, datas))
+
+
+def test_no_budget_is_lossless():
+    pages = _pages()
+    datas, info = encoding.encode_pages(pages)
+    assert info["within_budget"] and info["psnr"] is None and "colors" not in info
+    for page, data in zip(pages, datas):
+        np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(data)).convert('RGBA')), page)
+
+
+def test_tight_budget_picks_lossy_within_budget():
+    pages = _pages()
+    budget = int(_lossless_bytes(pages) * 0.6)
+    datas, info = encoding.encode_pages(pages, budget)
+    assert info["within_budget"] and sum(map(len, datas)) == info["bytes"] <= budget
+    assert info["psnr"] is not None and ("colors" in info or "alpha_levels" in info)
+    # 放得進預算的有損候選中 PSNR 最高
+    zlib_opts = {k: info[k] for k in ("level", "strategy")}
+    fitting = [q for _, d, q in encoding._encode_all(pages, encoding.LOSSY, zlib_opts, True) if sum(map(len, d)) <= budget]
+    assert info["psnr"] == round(max(fitting), 2)
+
+
+def test_impossible_budget_returns_smallest():
+    pages = _pages()
+    datas, info = encoding.encode_pages(pages, 100)
+    assert not info["within_budget"]
+    assert info["bytes"] == sum(map(len, datas)) < _lossless_bytes(pages)
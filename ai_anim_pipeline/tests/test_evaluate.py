@@ -0,0 +1,106 @@
+import tracemalloc
+
+import numpy as np
+
+from ai_anim_pipeline.core import EvalResult, GenerationResult
+from ai_anim_pipeline.stages import evaluate
+
+
+def _reference(frames):
+    x = frames.reshape(len(frames), -1, 4).astype(np.float64)
+    alpha = x[..., 3]
+    luma = (x[..., :3] @ evaluate.LUMA.astype(np.float64)) / 255
+    mass = alpha.sum(axis=1)
+    return np.divide((alpha * luma).sum(axis=1), mass, out=np.zeros_like(mass), where=mass > 0)
+
+
+def test_frame_luminance_matches_reference_across_slices(monkeypatch):
+    frames = np.random.default_rng(0).integers(0, 256, (7, 16, 12, 4), dtype=np.uint8)
+    frames[3, ..., 3] = 0  # 完全透明
+    monkeypatch.setattr(evaluate, "LUMA_SLICE_PIXELS", 16 * 12 * 2)
+    np.testing.assert_allclose(evaluate.frame_luminance(frames), _reference(frames), rtol=1e-5)
+    assert evaluate.frame_luminance(frames)[3] == 0
+
+
+def test_metric_scratch_memory_is_bounded():
+    frames = np.random.default_rng(1).integers(0, 256, (32, 256, 256, 4), dtype=np.uint8)  # 8 MB chunk
+    tracemalloc.start()
+    try:
+        evaluate.frame_luminance(frames)
+        evaluate.alpha_centroids(frames)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # 暫存上限約 LUMA_SLICE_PIXELS * 16 bytes，遠小於整個 chunk 轉 float32 的 4 倍 chunk
+    assert peak < evaluate.LUMA_SLICE_PIXELS * 16 * 1.5
+    assert peak < frames.nbytes
+
+
+def test_alpha_centroids():
+    frames = np.zeros((2, 4, 8, 4), np.uint8)
+    frames[0, 1, 6, 3] = 255
+    c = evaluate.alpha_centroids(frames)
+    np.testing.assert_allclose(c[0], [6 / 8, 1 / 4])
+    assert np.isnan(c[1]).all()
+
+
+RULES = {"max_loop_error": 0.2, "max_size_kb": 100}
+
+
+def _gens(n):
+    return [GenerationResult(plan_id="fx", variant_id=f"fx_seed{i}", seed=i, video_path=f"{i}.apng", raw_meta={})
+            for i in range(n)]
+
+
+def _evaluator(metrics, passes=None):
+    """依 seed 回傳固定指標；passes 未列出的 seed 視為通過。"""
+    def evaluate_one(gen, cancel):
+        ok = passes is None or gen.seed in passes
+        return EvalResult(variant_id=gen.variant_id, pass_flag=ok, metrics=metrics[gen.seed],
+                          rejected_by=None if ok else "max_loop_error")
+    return evaluate_one
+
+
+def test_score_weighted_margin():
+    # loopError 餘裕 0.5（權重 0.4）、sizeKB 餘裕 0.75（權重 0.2）；沒有上限的指標不計
+    metrics = {"loopError": 0.1, "sizeKB": 25, "centerDriftRatio": 0.9}
+    assert evaluate.score(metrics, RULES) == round((0.4 * 0.5 + 0.2 * 0.75) / 0.6, 4)
+    assert evaluate.score(metrics, {}) == 1.0
+
+
+def test_select_highest_score_and_tie_breaks_by_seed():
+    metrics = [{"loopError": 0.1, "sizeKB": 50}, {"loopError": 0.0, "sizeKB": 10},
+               {"loopError": 0.0, "sizeKB": 10}, {"loopError": 0.0, "sizeKB": 0}]
+    gen, result, results, rationale = evaluate.select_variant(_gens(4), RULES, _evaluator(metrics, passes={0, 1, 2}))
+    assert gen.seed == 1 and result.variant_id == "fx_seed1"
+    assert rationale["mode"] == "best" and rationale["chosen"] == "fx_seed1"
+    assert [c["score"] for c in rationale["candidates"]][3] is None  # 未通過的變體不計分
+    assert len(results) == 4
+
+
+def test_custom_weights_change_choice():
+    metrics = [{"loopError": 0.0, "sizeKB": 90}, {"loopError": 0.15, "sizeKB": 0}]
+    assert evaluate.select_variant(_gens(2), RULES, _evaluator(metrics))[0].seed == 0
+    gen, _, _, rationale = evaluate.select_variant(_gens(2), RULES, _evaluator(metrics),
+                                                   weights={"loopError": 0.1, "sizeKB": 0.9})
+    assert gen.seed == 1 and rationale["weights"] == {"loopError": 0.1, "sizeKB": 0.9}
+
+
+def test_no_variant_passes():
+    metrics = [{"loopError": 0.5}] * 2
+    gen, result, _, rationale = evaluate.select_variant(_gens(2), RULES, _evaluator(metrics, passes=set()))
+    assert gen is None and result is None and rationale["chosen"] is None
+
+
+def test_good_enough_cancels_remaining():
+    def evaluate_one(gen, cancel):
+        if gen.seed == 0:
+            return EvalResult(variant_id=gen.variant_id, pass_flag=True, metrics={"loopError": 0.0})
+        # 已開始的評估在 cancel 後丟出 EvaluationCancelled；尚未開始的直接被取消
+        if not cancel.wait(2):
+            raise AssertionError("not cancelled")
+        raise evaluate.EvaluationCancelled()
+
+    gen, _, results, rationale = evaluate.select_variant(_gens(2), RULES, evaluate_one, good_enough=0.9)
+    assert gen.seed == 0 and rationale["mode"] == "good_enough"
+    assert results[1] is None and rationale["candidates"][1]["cancelled"]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from ai_anim_pipeline.core.frames import reduce_frame
+
+
+def _reference(frame, factor):
+    """精確的 alpha 加權區塊平均（premultiplied RGB 與 alpha，float）；邊緣以實際像素數平均。"""
+    h, w = frame.shape[:2]
+    f = frame.astype(np.float64)
+    premul = np.concatenate([f[..., :3] * f[..., 3:4] / 255, f[..., 3:4]], -1)
+    out = np.empty((-(-h // factor), -(-w // factor), 4))
+    for i in range(out.shape[0]):
+        for j in range(out.shape[1]):
+            out[i, j] = premul[i * factor:(i + 1) * factor, j * factor:(j + 1) * factor].reshape(-1, 4).mean(0)
+    return out
+
+
+def test_matches_alpha_weighted_average():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (9, 14, 4), dtype=np.uint8)
+    out = reduce_frame(frame, 4)
+    ref = _reference(frame, 4)
+    assert out.shape == ref.shape
+    o = out.astype(np.float64)
+    assert np.abs(o[..., 3] - ref[..., 3]).max() <= 1
+    assert np.abs(o[..., :3] * o[..., 3:4] / 255 - ref[..., :3]).max() <= 2
+
+
+def test_transparent_colour_not_mixed():
+    frame = np.zeros((2, 2, 4), np.uint8)
+    frame[0, 0] = (255, 0, 0, 255)
+    frame[1, 1, :3] = (0, 255, 0)  # alpha 0，不應混入
+    out = reduce_frame(frame, 2)
+    assert tuple(out[0, 0, :3]) == (255, 0, 0)
+    assert abs(int(out[0, 0, 3]) - 64) <= 1
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+
+from ai_anim_pipeline.core import PromptPlan
+from ai_anim_pipeline.stages.generate import GenerationEngine, LocalBackend, TokenBucket
+
+
+def _plan(seeds=4, plan_id="fx"):
+    return PromptPlan(id=plan_id, prompt="glow", seed_list=list(range(seeds)))
+
+
+class FakeBackend:
+    """依呼叫次序回傳設定好的行為，並記錄同時進行中的請求數。"""
+
+    def __init__(self, delay=0.02, script=None):
+        self.delay = delay
+        self.script = script or {}
+        self.calls = {}
+        self.active = self.peak = 0
+
+    async def generate(self, plan, seed, variant_id):
+        n = self.calls[variant_id] = self.calls.get(variant_id, 0) + 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            action = self.script.get((seed, n))
+            if action == "fail":
+                raise ConnectionError("boom")
+            await asyncio.sleep(1.0 if action == "hang" else self.delay)
+            return f"{variant_id}.apng", {"seed": seed}
+        finally:
+            self.active -= 1
+
+
+@pytest.mark.parametrize("per_spec, max_inflight, cap", [(4, 2, 2), (2, 16, 2)])
+def test_inflight_caps(per_spec, max_inflight, cap):
+    backend = FakeBackend()
+    engine = GenerationEngine(backend, per_spec=per_spec, max_inflight=max_inflight)
+    results = asyncio.run(engine.run_plan(_plan(8)))
+    assert [r.seed for r in results] == list(range(8))
+    assert backend.peak == cap
+
+
+def test_max_inflight_is_shared_across_plans():
+    backend = FakeBackend()
+    engine = GenerationEngine(backend, per_spec=4, max_inflight=3)
+
+    async def both():
+        return await asyncio.gather(engine.run_plan(_plan(4, "a")), engine.run_plan(_plan(4, "b")))
+
+    assert [len(r) for r in asyncio.run(both())] == [4, 4]
+    assert backend.peak == 3
+
+
+def test_token_bucket_rate():
+    async def take(n):
+        bucket = TokenBucket(20, capacity=1)
+        start = time.monotonic()
+        for _ in range(n):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 容量 1：第一次立即取得，其後每 1/20 秒一次
+    assert 0.18 <= asyncio.run(take(5)) < 0.5
+
+
+def test_timeout_then_retry_succeeds():
+    backend = FakeBackend(script={(0, 1): "hang"})
+    engine = GenerationEngine(backend, timeout_sec=0.1, retries=1, backoff_sec=0.01)
+    (result,) = asyncio.run(engine.run_plan(_plan(1)))
+    assert result.raw_meta["attempts"] == 2
+    assert backend.calls == {"fx_seed0": 2}
+
+
+def test_retry_backoff_then_gives_up():
+    backend = FakeBackend(script={(1, n): "fail" for n in (1, 2, 3)})
+    engine = GenerationEngine(backend, retries=2, backoff_sec=0.05)
+    start = time.monotonic()
+    results = asyncio.run(engine.run_plan(_plan(2)))
+    # 失敗的變體記錄後略過；退避為 0.05 * 2^attempt * [0.5, 1.5)
+    assert [r.seed for r in results] == [0]
+    assert backend.calls["fx_seed1"] == 3
+    assert time.monotonic() - start >= 0.05 * 0.5 + 0.1 * 0.5
+
+
+def test_split_shares_limits():
+    engine = GenerationEngine(FakeBackend(), max_inflight=5, rate_per_sec=10)
+    assert engine.split(1) is engine
+    share = engine.split(2)
+    assert (share.max_inflight, share.rate_per_sec) == (3, 5)
+    assert (engine.max_inflight, engine.rate_per_sec) == (5, 10)
+    assert engine.split(8).max_inflight == 1
+    assert GenerationEngine(FakeBackend()).split(4).rate_per_sec is None
+
+
+class SlowFirstBackend(LocalBackend):
+    """第一次 render 很慢（會逾時），之後立即完成。"""
+
+    def __init__(self, out_dir):
+        super().__init__(out_dir=out_dir)
+        self.renders = 0
+
+    def _write_clip(self, plan, seed, video_path):
+        self.renders += 1
+        label = b"stale" if self.renders == 1 else b"fresh"
+        if label == b"stale":
+            time.sleep(0.4)
+        video_path.write_bytes(label)
+        return {"render": label.decode()}
+
+
+def test_timed_out_render_does_not_overwrite_retry(tmp_path):
+    backend = SlowFirstBackend(tmp_path)
+    engine = GenerationEngine(backend, timeout_sec=0.1, retries=1, backoff_sec=0.01)
+    (result,) = asyncio.run(engine.run_plan(_plan(1)))
+    assert result.raw_meta["render"] == "fresh"
+    time.sleep(0.5)  # 等逾時的那次 render 寫完
+    assert (tmp_path / "fx_seed0.apng").read_bytes() == b"fresh"
+    assert list(tmp_path.glob("*.tmp")) == []
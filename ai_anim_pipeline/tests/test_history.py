@@ -0,0 +1,90 @@
+import pytest
+
+from ai_anim_pipeline.core import history
+from ai_anim_pipeline.core.history import HistoryStore
+
+
+def _kpi(effect, variants=4, passed=4):
+    if passed:
+        return {"id": effect, "variants": variants, "variants_passed": passed, "sizeKB": 10.0}
+    return {"id": effect, "status": "NO_PASS", "variants": variants, "variants_passed": 0}
+
+
+def _item(effect, size=1000):
+    return {"id": effect, "encoding": {"bytes": size}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    with HistoryStore(tmp_path / 'history.db') as s:
+        yield s
+
+
+def _kinds(result):
+    return {(r["kind"], r["effect"]) for r in result["regressions"]}
+
+
+def _baseline(store, runs=3, label="cat"):
+    for _ in range(runs):
+        store.record([_kpi("a"), _kpi("b")], [_item("a"), _item("b")],
+                     timings=[("evaluate", "a", None, 1.0, 0.9, False)], label=label)
+
+
+def test_spec_passed():
+    assert history.spec_passed(_kpi("a"))
+    assert not history.spec_passed(_kpi("a", passed=0))
+    assert not history.spec_passed({"id": "a", "status": "FAILED", "error": "boom"})
+    assert history.spec_passed({"id": "a", "sizeKB": 1.0})  # 沒有變體計數的舊紀錄
+
+
+def test_failed_specs_are_not_passed(store):
+    _baseline(store)
+    failed = [{"id": e, "status": "FAILED", "error": "worker crashed"} for e in ("a", "b")]
+    run = store.record(failed, [], label="cat")
+    result = store.analyze(run)
+    assert result["runs"][-1]["passed"] == 0 and result["runs"][-1]["pass_rate"] == 0.0
+    assert {("qa_fail", "a"), ("qa_fail", "b"), ("pass_rate", None)} <= _kinds(result)
+
+
+def test_no_regressions_when_stable(store):
+    _baseline(store)
+    run = store.record([_kpi("a"), _kpi("b")], [_item("a"), _item("b")],
+                       timings=[("evaluate", "a", None, 1.0, 0.9, False)], label="cat")
+    assert store.analyze(run)["regressions"] == []
+
+
+def test_size_stage_time_and_variant_rate(store):
+    _baseline(store)
+    run = store.record([_kpi("a", passed=2), _kpi("b")], [_item("a"), _item("b", size=1500)],
+                       timings=[("evaluate", "a", None, 3.0, 2.9, False)], label="cat")
+    result = store.analyze(run)
+    kinds = _kinds(result)
+    assert ("size", "b") in kinds and ("stage_time", "a") in kinds
+    assert ("variant_pass_rate", "a") in kinds
+    rate = next(r for r in result["regressions"] if r["kind"] == "variant_pass_rate")
+    assert rate["current"] == 0.5 and rate["baseline"] == 1.0
+    assert result["trends"]["a"]["variant_pass_rate"][-1] == 0.5
+
+
+def test_total_failure_is_qa_fail_only(store):
+    _baseline(store)
+    run = store.record([_kpi("a", passed=0), _kpi("b")], [_item("b")], label="cat")
+    kinds = _kinds(store.analyze(run))
+    assert ("qa_fail", "a") in kinds and ("variant_pass_rate", "a") not in kinds
+
+
+def test_cached_stages_and_other_labels_ignored(store):
+    _baseline(store, label="other")
+    _baseline(store, runs=1)
+    # 命中快取的 stage 不比較；label 不同的執行不進基準
+    run = store.record([_kpi("a")], [_item("a", size=5000)],
+                       timings=[("evaluate", "a", None, 9.0, 9.0, True)], label="cat")
+    result = store.analyze(run)
+    assert [r["run_id"] for r in result["runs"]] == [run - 1, run]
+    assert _kinds(result) == {("size", "a")}
+
+
+def test_stage_rows_skip_spec_span_and_name_atlas():
+    rows = history._stage_rows([("spec", "a", None, 1.0, 1.0, False), ("atlas", None, "ui", 0.5, 0.4, True),
+                                ("pack", "a", None, 0.25, 0.2, False)])
+    assert rows == [("atlas:ui", "atlas", 0.5, 0.4, 1), ("a", "pack", 0.25, 0.2, 0)]
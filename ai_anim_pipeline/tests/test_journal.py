@@ -0,0 +1,55 @@
+from ai_anim_pipeline.core import journal
+from ai_anim_pipeline.core.models import EffectSpec
+
+
+def _spec(sid, fps=24):
+    return EffectSpec(id=sid, category="symbolWin", resolution="64x64", duration_sec=0.5, fps=fps, loops=False)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'run.ndjson'
+    with journal.RunJournal(path, fresh=True) as j:
+        j.append(_spec("a"), {"id": "a"}, {"id": "a", "sizeKB": 1.0})
+        j.append(_spec("b"), None, {"id": "b", "status": "NO_PASS"})
+    records = journal.load(path)
+    assert set(records) == {"a", "b"}
+    assert journal.lookup(_spec("a"), records) == ({"id": "a"}, {"id": "a", "sizeKB": 1.0})
+    # spec 改過的紀錄不採用
+    assert journal.lookup(_spec("a", fps=30), records) is None
+    assert journal.completed([_spec("x"), _spec("b")], records) == {1: (None, {"id": "b", "status": "NO_PASS"})}
+
+
+def test_torn_line_repaired(tmp_path):
+    path = tmp_path / 'run.ndjson'
+    with journal.RunJournal(path, fresh=True) as j:
+        j.append(_spec("a"), {"id": "a"}, {"id": "a"})
+    # 模擬寫到一半當機：最後一行沒有換行結尾
+    with open(path, 'ab') as f:
+        f.write(b'{"id":"b","spec_ha')
+    assert set(journal.load(path)) == {"a"}
+    # 續寫時先補換行，新紀錄不會接在半行後面
+    with journal.RunJournal(path) as j:
+        j.append(_spec("c"), {"id": "c"}, {"id": "c"})
+    assert set(journal.load(path)) == {"a", "c"}
+
+
+def test_last_record_wins_and_fresh_truncates(tmp_path):
+    path = tmp_path / 'run.ndjson'
+    with journal.RunJournal(path, fresh=True) as j:
+        j.append(_spec("a"), None, {"id": "a", "status": "NO_PASS"})
+        j.append(_spec("a"), {"id": "a"}, {"id": "a"})
+    assert journal.load(path)["a"]["item"] == {"id": "a"}
+    journal.RunJournal(path, fresh=True).close()
+    assert journal.load(path) == {}
+    assert journal.load(tmp_path / 'missing.ndjson') == {}
+
+
+def test_batched_writes(tmp_path):
+    path = tmp_path / 'run.ndjson'
+    j = journal.RunJournal(path, batch_size=3, flush_sec=3600, fresh=True)
+    j.append(_spec("a"), None, {"id": "a"})
+    j.append(_spec("b"), None, {"id": "b"})
+    assert journal.load(path) == {}
+    j.append(_spec("c"), None, {"id": "c"})
+    assert set(journal.load(path)) == {"a", "b", "c"}
+    j.close()
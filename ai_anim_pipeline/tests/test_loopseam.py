@@ -0,0 +1,48 @@
+import numpy as np
+
+from ai_anim_pipeline.core import loopseam
+
+
+def _features(values):
+    """每格一個常數特徵向量 (n, 4, 3)。"""
+    return np.repeat(np.asarray(values, np.float32)[:, None, None], 4, axis=1).repeat(3, axis=2)
+
+
+def test_loop_error_ignores_transparent_rgb():
+    a = np.zeros((4, 4, 4), np.uint8)
+    b = a.copy()
+    b[..., :3] = 255  # alpha 仍為 0
+    assert loopseam.loop_error(a, b) == 0.0
+    b[..., 3] = 255
+    assert loopseam.loop_error(a, b) > 0.5
+
+
+def test_plan_loop_finds_period():
+    # 週期 8：(0, 8) 首尾同格，距離為 0；同距離時取較長、較早開始的區間
+    feats = _features([i % 8 * 10 for i in range(12)])
+    plan = loopseam.plan_loop(feats, fps=24, limit=0.01)
+    assert plan["start"] == 0 and plan["end"] == 8
+    assert plan["crossfade"] == 0 and plan["error"] == 0.0
+
+
+def test_plan_loop_crossfade_and_reject():
+    # 線性漂移：最短允許間距 (8 格) 的距離最小
+    feats = _features([i * 1.0 for i in range(12)])
+    best = float(loopseam.seam_matrix(feats, 9).min())
+    plan = loopseam.plan_loop(feats, fps=24, limit=best / 2)
+    assert plan["end"] - plan["start"] == 8
+    assert plan["crossfade"] >= 2 and plan["error"] == 0.0
+    assert loopseam.plan_loop(feats, fps=24, limit=best / 4) is None
+
+
+def test_lead_range():
+    assert loopseam.lead_range({"start": 5, "crossfade": 3}) == range(3, 6)
+    assert loopseam.lead_range({"start": 0, "crossfade": 3}) == range(0, 1)
+
+
+def test_crossfade_ends_on_lead():
+    tail = np.zeros((4, 2, 2, 4), np.uint8)
+    lead = np.full((4, 2, 2, 4), 200, np.uint8)
+    out = loopseam.crossfade(tail, lead)
+    assert (out[-1] == lead[-1]).all()
+    assert (np.diff(out[:, 0, 0, 0].astype(int)) > 0).all()
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from ai_anim_pipeline.stages import manifest
+
+
+def _write(tmp_path, items, atlases=None):
+    path = tmp_path / 'animation_manifest.json'
+    doc = {"version": "test", "count": len(items), "assets": items}
+    if atlases:
+        doc["atlases"] = atlases
+    data, spans = manifest._dump(doc, items)
+    path.write_bytes(data)
+    manifest.write_index(path.with_suffix('.idx'), items, data, spans)
+    return path, data
+
+
+ITEMS = [
+    {"id": "symbol_win_tiger", "sheet": "a.png", "frames": 12},
+    {"id": "bg_loop", "video": "bg.webm", "meta": {"nested": [1, 2, {"x": "y"}]}},
+    {"id": "symbol_win_獅子", "sheet": "b.png"},
+]
+
+
+def test_dump_matches_json(tmp_path):
+    _, data = _write(tmp_path, ITEMS, atlases=[{"page": "atlas_x.png"}])
+    doc = json.loads(data)
+    assert doc["assets"] == ITEMS and doc["atlases"] == [{"page": "atlas_x.png"}]
+
+
+def test_lookup(tmp_path):
+    path, _ = _write(tmp_path, ITEMS)
+    with manifest.ManifestIndex(path) as idx:
+        assert len(idx) == 3
+        assert idx.ids() == sorted(i["id"] for i in ITEMS)  # 以 UTF-8 bytes 排序，這裡與字串排序一致
+        for item in ITEMS:
+            assert idx.get(item["id"]) == item
+        assert idx.find("missing") is None and idx.get("zzz") is None
+
+
+def test_empty_manifest(tmp_path):
+    path, data = _write(tmp_path, [])
+    assert json.loads(data)["assets"] == []
+    with manifest.ManifestIndex(path) as idx:
+        assert len(idx) == 0 and idx.get("a") is None
+
+
+def test_stale_index_detected(tmp_path):
+    path, data = _write(tmp_path, ITEMS)
+    path.write_bytes(data.replace(b'"a.png"', b'"c.png"'))
+    with manifest.ManifestIndex(path) as idx:
+        with pytest.raises(ValueError):
+            idx.get("symbol_win_tiger")
+
+
+def test_bad_magic(tmp_path):
+    path, _ = _write(tmp_path, ITEMS)
+    idx_path = path.with_suffix('.idx')
+    idx_path.write_bytes(b'XXXX' + idx_path.read_bytes()[4:])
+    with pytest.raises(ValueError):
+        manifest.ManifestIndex(path)
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ai_anim_pipeline.core import EffectSpec
+from ai_anim_pipeline.stages import pack
+
+
+def _spec(effect_id, **kw):
+    return EffectSpec(id=effect_id, category="ui", resolution="64x48", duration_sec=1.0, fps=12, loops=True, **kw)
+
+
+def _processed(tmp_path, frames):
+    path = tmp_path / 'frames.npy'
+    np.save(path, frames)
+    return {"frames_path": str(path), "fps": 12}
+
+
+def _delta_clip():
+    rng = np.random.default_rng(0)
+    frames = np.zeros((12, 48, 64, 4), np.uint8)
+    frames[:, 8:40, 4:60] = (40, 80, 120, 200)  # 靜止底圖
+    for i in range(12):
+        x = 6 + 4 * i
+        frames[i, 20:28, x:x + 8] = (255, 200, 50, 255)  # 移動的方塊
+    frames[5] = frames[4]                                 # 與上一格相同
+    frames[8] = rng.integers(0, 256, (48, 64, 4), dtype=np.uint8)  # 全面變動 -> keyframe
+    frames[10] = 0                                        # 完全透明
+    return frames
+
+
+def _rebuild(meta):
+    """依 frame_rects 以取代方式還原每一格（讀量化前的無損頁面）。"""
+    pages = [np.asarray(Image.open(pack.raw_page_path(name)).convert('RGBA')) for name in meta["sheets"]]
+    fw, fh = meta["frame_size"]
+    canvas = np.zeros((fh, fw, 4), np.uint8)
+    out = []
+    for entry in meta["frame_rects"]:
+        if entry.get("key"):
+            canvas[:] = 0
+            rects = [] if entry.get("empty") else [entry]
+        else:
+            rects = entry["rects"]
+        for r in rects:
+            px, py, w, h = r["rect"]
+            ox, oy = r["offset"]
+            canvas[oy:oy + h, ox:ox + w] = pages[r["page"]][py:py + h, px:px + w]
+        out.append(canvas.copy())
+    return np.stack(out)
+
+
+def test_delta_round_trip(tmp_path):
+    frames = _delta_clip()
+    meta = pack.package(_processed(tmp_path, frames), _spec("delta_fx", packaging="delta")).meta_json
+    enc = meta["frame_encoding"]
+    assert enc["mode"] == "delta" and enc["stored_area"] < enc["full_area"]
+    assert meta["frame_rects"][0]["key"] and meta["frame_rects"][8]["key"]
+    assert meta["frame_rects"][5] == {"rects": []}
+    np.testing.assert_array_equal(_rebuild(meta), frames)
+
+
+def _overlaps(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def test_maxrects_no_overlap_within_pages():
+    rng = np.random.default_rng(0)
+    sizes = [tuple(int(v) for v in rng.integers(4, 90, 2)) for _ in range(120)]
+    placements, pages = pack.pack_rects(sizes, max_size=256, padding=2)
+    assert len(pages) > 1 and all(p is not None for p in placements)
+    by_page = {}
+    for (w, h), (page, x, y) in zip(sizes, placements):
+        pw, ph = pages[page]
+        assert x + w + 2 <= pw and y + h + 2 <= ph
+        assert pw & (pw - 1) == 0 and ph & (ph - 1) == 0  # 2 的次方
+        by_page.setdefault(page, []).append((x, y, w + 2, h + 2))
+    for rects in by_page.values():
+        assert not any(_overlaps(a, b) for i, a in enumerate(rects) for b in rects[i + 1:])
+
+
+def test_pack_rects_rejects_oversized():
+    with pytest.raises(ValueError):
+        pack.pack_rects([(300, 10)], max_size=256)
+
+
+def test_sheet_dedupes_identical_frames(tmp_path):
+    frames = np.zeros((6, 32, 32, 4), np.uint8)
+    for i, x in enumerate([2, 10, 2, 18, 10, 2]):
+        frames[i, 8:16, x:x + 8] = (200, 100, 50, 255)
+    frames[3] = 0  # 完全透明
+    meta = pack.package(_processed(tmp_path, frames), _spec("dedupe_fx", packaging="sheet")).meta_json
+    rects = meta["frame_rects"]
+    # 方塊在不同位置，trim 後內容相同：全部共用一個區塊，offset 各自記錄
+    assert meta["unique_frames"] == 1
+    assert rects[3] == {"empty": True}
+    assert len({tuple(r["rect"]) for r in rects if "rect" in r}) == 1
+    assert [r["offset"][0] for r in rects if "rect" in r] == [2, 10, 2, 10, 2]
+    page = np.asarray(Image.open(pack.raw_page_path(meta["sheets"][0])).convert('RGBA'))
+    px, py, w, h = rects[0]["rect"]
+    np.testing.assert_array_equal(page[py:py + h, px:px + w], frames[0, 8:16, 2:10])
+
+
+def test_frame_key_exact_and_near():
+    a = np.full((4, 4, 4), 200, np.uint8)
+    b = a.copy()
+    b[0, 0, 0] = 201  # 只差最低 bit
+    assert pack.frame_key(a) == pack.frame_key(b)
+    assert pack.frame_key(a, shift=0) != pack.frame_key(b, shift=0)
+    assert pack.frame_key(a, shift=0) != pack.frame_key(a[:2], shift=0)
+
+
+def test_sheet_budget_key():
+    assert pack.sheet_budget_kb(_spec("a", qa_rules={"max_size_kb": 500, "sheet_max_kb": 64})) == 64
+    assert pack.sheet_budget_kb(_spec("b", qa_rules={"max_size_kb": 500})) == 500
+    assert pack.sheet_budget_kb(_spec("c")) is None
+
+
+def test_sheet_encoding_uses_sheet_budget(tmp_path):
+    frames = _delta_clip()
+    spec = _spec("budget_fx", packaging="sheet", qa_rules={"max_size_kb": 1, "sheet_max_kb": 4096})
+    encoding = pack.package(_processed(tmp_path, frames), spec).meta_json["encoding"]
+    assert encoding["budget_bytes"] == 4096 * 1024 and encoding["within_budget"]
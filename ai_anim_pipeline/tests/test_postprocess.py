@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ai_anim_pipeline.stages import postprocess
+
+
+def _pil_lanczos(channel: np.ndarray, size):
+    return np.asarray(Image.fromarray(channel, 'F').resize(size, Image.Resampling.LANCZOS))
+
+
+@pytest.mark.parametrize("src, dst", [((64, 48), (20, 15)), ((37, 53), (11, 29)), ((30, 30), (30, 30))])
+def test_resize_matches_pil_lanczos(src, dst):
+    (sw, sh), (dw, dh) = src, dst
+    chunk = np.random.default_rng(0).random((2, sh, sw, 4), dtype=np.float32)
+    out = postprocess.resize_chunk(chunk, postprocess.resample_matrix(sh, dh), postprocess.resample_matrix(sw, dw))
+    assert out.shape == (2, dh, dw, 4)
+    for n in range(2):
+        for c in range(4):
+            np.testing.assert_allclose(out[n, ..., c], _pil_lanczos(chunk[n, ..., c], (dw, dh)), atol=1e-4)
+
+
+def test_resample_rows_normalised():
+    w = postprocess.resample_matrix(100, 7)
+    np.testing.assert_allclose(w.sum(axis=1), 1, atol=1e-6)
+    np.testing.assert_allclose(postprocess.resample_matrix(5, 5), np.eye(5), atol=1e-6)  # 同尺寸即恆等
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def _run(out_dir: Path, *args):
+    env = dict(os.environ, AI_ANIM_OUTPUT_DIR=str(out_dir))
+    subprocess.run([sys.executable, '-m', 'ai_anim_pipeline.cli.run_pipeline', '--no-cache', '--no-history', *args],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    # temp/ 內的中繼 JSON 含絕對路徑，只比較交付的產出
+    files = [p for sub in ('assets', 'reports', 'journal') for p in (out_dir / sub).rglob('*') if p.is_file()]
+    return {p.relative_to(out_dir).as_posix(): p.read_bytes() for p in files}
+
+
+@pytest.mark.parametrize("args", [('--jobs', '2'), ('--scheduler', 'dag', '--jobs', '2')])
+def test_parallel_output_matches_serial(tmp_path, args):
+    serial = _run(tmp_path / 'serial')
+    parallel = _run(tmp_path / 'parallel', *args)
+    assert 'assets/animation_manifest.json' in serial
+    assert serial.keys() == parallel.keys()
+    assert [k for k in serial if serial[k] != parallel[k]] == []
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from ai_anim_pipeline.core.scheduler import DagScheduler, Node
+
+
+def _chain(i, log):
+    """每組：a -> b，b 取用 a 的結果。"""
+    return [Node((i, "a"), "work", lambda i=i: log.append(("a", i)) or i),
+            Node((i, "b"), "work", lambda x: log.append(("b", x)) or x * 10, deps=((i, "a"),))]
+
+
+def test_window_bounds_expanded_groups():
+    log, pulled, done = [], [], []
+    finished = set()
+    in_flight = []
+
+    def groups():
+        for i in range(20):
+            pulled.append(i)
+            in_flight.append(len(pulled) - len(finished))
+            yield _chain(i, log)
+
+    def on_done(node, value):
+        if node.key[1] == "b":
+            finished.add(node.key[0])
+            done.append(value)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = DagScheduler({"work": pool}, limits={"work": 2}).run(groups(), on_done=on_done, window=3)
+    assert sorted(done) == [i * 10 for i in range(20)]
+    assert max(in_flight) <= 3
+    assert results == {}  # 整組完成後釋放
+
+
+def test_without_window_returns_all_results():
+    log = []
+    nodes = [n for i in range(3) for n in _chain(i, log)]
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = DagScheduler({"work": pool}).run(nodes)
+    assert results == {**{(i, "a"): i for i in range(3)}, **{(i, "b"): i * 10 for i in range(3)}}
+
+
+def test_ready_nodes_dispatch_in_declaration_order():
+    log = []
+    nodes = [n for i in range(3) for n in _chain(i, log)]
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        DagScheduler({"work": pool}, limits={"work": 1}).run(nodes)
+    # 先宣告的 spec 先往下游推進，不會整批卡在同一個 stage
+    assert log == [("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2), ("b", 2)]
+
+
+def test_skipped_upstream_skips_downstream():
+    ran = []
+    nodes = [Node("a", "main", lambda: None),
+             Node("b", "main", lambda x: ran.append(x), deps=("a",)),
+             Node("c", "main", lambda x: ran.append("forced") or 1, deps=("a",), when=lambda _: True)]
+    results = DagScheduler({}).run(nodes)
+    assert results == {"a": None, "b": None, "c": 1}
+    assert ran == ["forced"]
+
+
+def test_pool_limits_cap_concurrency():
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    nodes = [Node(i, "cpu", work) for i in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        DagScheduler({"cpu": pool}, limits={"cpu": 2}).run(nodes)
+    assert peak[0] == 2
+
+
+def test_error_cancels_pending_nodes():
+    ran = []
+
+    def boom():
+        raise ValueError("boom")
+
+    nodes = [Node("bad", "work", boom)]
+    nodes += [Node(i, "work", lambda i=i: ran.append(i) or time.sleep(0.01) or i) for i in range(20)]
+    nodes.append(Node("after", "work", lambda x: ran.append("after"), deps=("bad",)))
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        with pytest.raises(ValueError, match="boom"):
+            DagScheduler({"work": pool}).run(nodes)
+    # 尚未開始的 node 被取消，相依於失敗 node 的也不會執行
+    assert "after" not in ran and len(ran) < 20
@@ -0,0 +1,51 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ai_anim_pipeline.core import texcomp
+
+
+def _gradient(h=22, w=30):
+    """平滑漸層 + 一塊全透明區域；尺寸刻意不是 block 的倍數。"""
+    y, x = np.mgrid[0:h, 0:w]
+    img = np.stack([x * 8, y * 10, (x + y) * 4, np.full_like(x, 255)], -1).clip(0, 255).astype(np.uint8)
+    img[:5, :5, 3] = 0
+    return img
+
+
+@pytest.mark.parametrize("fmt,min_psnr", [("etc2_rgba8", 33), ("astc_4x4", 32), ("astc_6x6", 28)])
+def test_round_trip_psnr(fmt, min_psnr):
+    img = _gradient()
+    data = texcomp.encode(img, fmt)
+    bw, bh = texcomp.FORMATS[fmt]["block"]
+    assert len(data) == -(-img.shape[1] // bw) * -(-img.shape[0] // bh) * 16
+    decoded = texcomp.decode(data, fmt, img.shape[1], img.shape[0])
+    assert decoded.shape == img.shape and decoded.dtype == np.uint8
+    assert texcomp.psnr(img, decoded) >= min_psnr
+
+
+@pytest.mark.parametrize("fmt", list(texcomp.FORMATS))
+def test_solid_block(fmt):
+    img = np.empty((12, 12, 4), np.uint8)
+    img[:] = (200, 40, 90, 180)
+    decoded = texcomp.decode(texcomp.encode(img, fmt), fmt, 12, 12)
+    assert np.abs(decoded.astype(int) - img).max() <= 3
+
+
+def test_psnr_identical_is_inf():
+    img = _gradient()
+    assert texcomp.psnr(img, img) == float('inf')
+
+
+def test_ktx_header():
+    data = texcomp.encode(_gradient(8, 8), "astc_4x4")
+    ktx = texcomp.ktx_bytes(data, "astc_4x4", 8, 8)
+    assert ktx[:12] == texcomp.KTX_IDENTIFIER
+    fields = struct.unpack_from('<13I', ktx, 12)
+    assert fields[0] == 0x04030201
+    assert fields[4] == texcomp.FORMATS["astc_4x4"]["gl_internal_format"]
+    assert fields[5] == texcomp.GL_RGBA
+    assert fields[6:8] == (8, 8)
+    (size,) = struct.unpack_from('<I', ktx, 64)
+    assert size == len(data) and ktx[68:] == data
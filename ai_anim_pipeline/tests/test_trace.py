@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from ai_anim_pipeline.core import trace
+
+
+@pytest.fixture
+def traced():
+    trace.enable(True, timings=True)
+    yield
+    trace.snapshot()
+    trace.enable(False, timings=False)
+
+
+def _spin(sec):
+    end = time.perf_counter() + sec
+    while time.perf_counter() < end:
+        pass
+
+
+def test_thread_span_excludes_other_threads_cpu(traced):
+    stop = threading.Event()
+    busy = threading.Thread(target=lambda: [_spin(0.01) for _ in iter(stop.is_set, True)])
+    busy.start()
+    try:
+        def idle():
+            with trace.span("evaluate", spec="a"):
+                time.sleep(0.3)
+        t = threading.Thread(target=idle)
+        t.start()
+        t.join()
+    finally:
+        stop.set()
+        busy.join()
+    events, timings = trace.snapshot()
+    (event,) = [e for e in events if e["name"] == "evaluate"]
+    # 睡眠中的 span 不被另一個 thread 的忙迴圈灌入 CPU；非主 thread 不記錄行程層級計數器
+    assert event["args"]["cpu_ms"] < 50
+    assert "proc_bytes_written" not in event["args"]
+    assert [cpu for name, _, _, _, cpu, _ in timings if name == "evaluate"][0] < 0.05
+
+
+def test_main_thread_span_labels_process_counters(traced):
+    with trace.span("pack", spec="a"):
+        pass
+    (event,) = trace.snapshot()[0]
+    assert {"proc_peak_rss_delta_kb", "proc_bytes_written"} <= event["args"].keys()
+    stats = trace.stage_summary([event, dict(event, args={"cpu_ms": 1.0})])["pack"]
+    assert stats["proc_bytes_written"] == event["args"]["proc_bytes_written"]
+
+
+def test_concurrent_accumulate_is_exact():
+    trace.enable(False, timings=True)
+    try:
+        def work():
+            for _ in range(2000):
+                trace._accumulate("evaluate", {"spec": "a"}, 1.0, 0.5)
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert trace.drain_timings() == [("evaluate", "a", None, 16000.0, 8000.0, False)]
+    finally:
+        trace.enable(False, timings=False)
@@ -0,0 +1,70 @@
+import numpy as np
+from PIL import Image
+
+from ai_anim_pipeline.core import video
+
+
+def _factory(calls=None, count=8, size=(48, 32)):
+    w, h = size
+    rng = np.random.default_rng(0)
+    clip = rng.integers(0, 256, (count, h, w, 4), dtype=np.uint8)
+
+    def frames():
+        if calls is not None:
+            calls.append(1)
+        yield from clip
+    return frames
+
+
+def test_vp9_requires_ffmpeg(monkeypatch):
+    video.has_vp9_encoder.cache_clear()
+    monkeypatch.setattr(video.shutil, "which", lambda _: None)
+    try:
+        assert not video.has_vp9_encoder()
+    finally:
+        video.has_vp9_encoder.cache_clear()
+
+
+def test_webp_fallback_without_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(video, "has_vp9_encoder", lambda: False)
+    info = video.encode_loop(_factory(), (48, 32), 12, 8, tmp_path / 'fx_loop')
+    assert info["format"] == "webp" and info["path"].endswith('.webp') and info["within_budget"]
+    assert info["quality"] == 95 and len(info["attempts"]) == 1
+    with Image.open(info["path"]) as im:
+        assert im.format == 'WEBP' and im.n_frames == 8 and im.size == (48, 32)
+
+
+def test_webp_quality_search_fits_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(video, "has_vp9_encoder", lambda: False)
+    calls = []
+    full = video.encode_loop(_factory(), (48, 32), 12, 8, tmp_path / 'full')["bytes"]
+    budget = int(full * 0.6)
+    info = video.encode_loop(_factory(calls), (48, 32), 12, 8, tmp_path / 'fx_loop', budget)
+    assert info["within_budget"] and info["bytes"] <= budget
+    assert info["quality"] < 95 and len(info["attempts"]) <= video.MAX_ATTEMPTS + 2
+    # 輸出檔為放得進預算的最高 quality（每次嘗試都重新串流影格）
+    fitting = [a for a in info["attempts"] if a["bytes"] <= budget * video.CONTAINER_OVERHEAD]
+    assert info["quality"] == max(a["quality"] for a in fitting)
+    assert len(calls) >= len(info["attempts"])
+
+
+def test_webp_impossible_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(video, "has_vp9_encoder", lambda: False)
+    info = video.encode_loop(_factory(), (48, 32), 12, 8, tmp_path / 'fx_loop', 10)
+    assert not info["within_budget"]
+    assert info["quality"] == info["attempts"][-1]["quality"] == min(a["quality"] for a in info["attempts"])
+
+
+def test_vp9_bitrate_lowered_until_within_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(video, "has_vp9_encoder", lambda: True)
+
+    def fake_vp9(frames_factory, size, fps, out_path, kbps, two_pass):
+        # 檔案大小與 bitrate 成正比，但實際輸出比目標多 30%
+        out_path.write_bytes(b"\0" * int(kbps * 1000 / 8 * 2 * 1.3))
+        return out_path.stat().st_size
+
+    monkeypatch.setattr(video, "_ffmpeg_vp9", fake_vp9)
+    info = video.encode_loop(_factory(), (48, 32), 12, 24, tmp_path / 'fx_loop', 200_000)
+    kbps = [a["bitrate_kbps"] for a in info["attempts"]]
+    assert info["format"] == "webm" and info["within_budget"]
+    assert len(kbps) == 2 and kbps[1] < kbps[0]
@@ -0,0 +1,99 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from ai_anim_pipeline.core.workqueue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = WorkQueue(tmp_path / 'queue.db', max_attempts=2)
+    q.enqueue([("a", "h1"), ("b", "h1"), ("c", "h1")])
+    yield q
+    q.close()
+
+
+def test_lease_in_order_and_ack(queue):
+    assert queue.lease("w1", count=2) == [("a", "h1"), ("b", "h1")]
+    assert queue.lease("w2", count=5) == [("c", "h1")]
+    assert queue.lease("w3") == []
+    queue.ack("w1", ["a", "b"])
+    queue.ack("w2", ["c"])
+    assert queue.counts() == {"done": 3}
+    assert queue.drained()
+
+
+def test_expired_lease_is_taken_over(queue):
+    assert [sid for sid, _ in queue.lease("w1", count=1, lease_sec=-1)] == ["a"]
+    assert [sid for sid, _ in queue.lease("w2", count=1)] == ["a"]
+    # 原本的 worker 續約無效（租約已屬於 w2）
+    queue.renew("w1", ["a"], lease_sec=-1)
+    assert queue.lease("w3", count=1)[0][0] == "b"
+
+
+def test_fail_retries_then_gives_up(queue):
+    queue.lease("w1", count=1)
+    queue.fail("w1", ["a"], "boom")
+    assert queue.counts()["pending"] == 3
+    assert queue.lease("w1", count=1)[0][0] == "a"
+    queue.fail("w1", ["a"], "boom again")
+    assert queue.failed() == {"a": "boom again"}
+    assert not queue.drained()
+    # 別的 worker 對不屬於自己的租約回報失敗不影響
+    queue.lease("w1", count=1)
+    queue.fail("w2", ["b"], "not mine")
+    assert queue.counts()["leased"] == 1
+
+
+def test_enqueue_keeps_done_and_requeues_changed(queue):
+    for sid, _ in queue.lease("w1", count=3):
+        queue.ack("w1", [sid])
+    queue.enqueue([("a", "h1"), ("b", "h2"), ("d", "h1")])
+    assert queue.counts() == {"done": 1, "pending": 2}
+    assert [sid for sid, _ in queue.lease("w1", count=5)] == ["b", "d"]
+    queue.enqueue([("a", "h1")], reset=True)
+    assert queue.counts() == {"pending": 1}
+
+
+WORKER = """
+import sys, time
+from ai_anim_pipeline.core.workqueue import WorkQueue
+q = WorkQueue(sys.argv[1])
+print(q.lease("doomed", count=1, lease_sec=0.3)[0][0], flush=True)
+time.sleep(60)
+"""
+
+
+def _lease_and_die(db_path):
+    """子行程租下一筆後被 SIGKILL（模擬處理中當機的 worker）。"""
+    proc = subprocess.Popen([sys.executable, '-c', WORKER, str(db_path)], stdout=subprocess.PIPE, text=True,
+                            cwd=Path(__file__).resolve().parents[2])
+    sid = proc.stdout.readline().strip()
+    proc.kill()
+    proc.wait()
+    time.sleep(0.4)  # 等租約過期
+    return sid
+
+
+def test_killed_worker_fails_after_max_attempts(tmp_path):
+    q = WorkQueue(tmp_path / 'queue.db', max_attempts=2)
+    q.enqueue([("a", "h1")])
+    assert _lease_and_die(q.path) == "a"
+    # 第一次過期：還沒到 max_attempts，重新租出
+    assert _lease_and_die(q.path) == "a"
+    # 第二次過期：lease() 標記 failed，不再租出，佇列可以結束
+    assert q.lease("w2") == []
+    assert "lease expired" in q.failed()["a"]
+    assert q.drained()
+    q.close()
+
+
+def test_seeded_and_meta(tmp_path):
+    q = WorkQueue(tmp_path / 'queue.db')
+    assert not q.seeded() and q.meta("output_token") is None
+    q.enqueue([("a", "h1")], meta={"output_token": "t"})
+    assert q.seeded() and q.meta("output_token") == "t"
+    q.close()